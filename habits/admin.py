@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Habit, HabitLog
+from .models import Habit, HabitLog, DailyUserStats, HabitStats, HabitDailyRollup, HabitLogArchive
 
 
 @admin.register(Habit)
@@ -12,13 +12,13 @@ class HabitAdmin(admin.ModelAdmin):
     ]
     list_filter = ['is_pleasant', 'is_public', 'created_at', 'user']
     search_fields = ['action', 'place', 'user__username']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['next_fire_at', 'created_at', 'updated_at']
     fieldsets = (
         ('Основная информация', {
             'fields': ('user', 'action', 'place', 'time', 'estimated_time')
         }),
         ('Настройки', {
-            'fields': ('is_pleasant', 'is_public', 'periodicity')
+            'fields': ('is_pleasant', 'is_public', 'periodicity', 'next_fire_at')
         }),
         ('Вознаграждение', {
             'fields': ('reward', 'related_habit')
@@ -28,6 +28,10 @@ class HabitAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+    
+    def get_queryset(self, request):
+        # Пользователь нужен для часового пояса при пересчете напоминания
+        return super().get_queryset(request).select_related('user')
 
 
 @admin.register(HabitLog)
@@ -37,4 +41,46 @@ class HabitLogAdmin(admin.ModelAdmin):
     list_display = ['habit', 'completed_at', 'is_completed']
     list_filter = ['is_completed', 'completed_at', 'habit__user']
     search_fields = ['habit__action', 'habit__user__username']
-    readonly_fields = ['completed_at']
\ No newline at end of file
+    readonly_fields = ['completed_at']
+
+
+@admin.register(DailyUserStats)
+class DailyUserStatsAdmin(admin.ModelAdmin):
+    """Админка для ежедневной статистики"""
+    
+    list_display = ['user', 'date', 'completed_habits', 'total_habits', 'updated_at']
+    list_filter = ['date']
+    search_fields = ['user__email']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(HabitStats)
+class HabitStatsAdmin(admin.ModelAdmin):
+    """Админка для статистики привычек"""
+    
+    list_display = [
+        'habit', 'current_streak', 'longest_streak',
+        'total_completions', 'last_completed_date'
+    ]
+    search_fields = ['habit__action', 'habit__user__email']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(HabitDailyRollup)
+class HabitDailyRollupAdmin(admin.ModelAdmin):
+    """Админка для дневных агрегатов выполнения"""
+    
+    list_display = ['habit', 'user', 'date', 'completions', 'updated_at']
+    list_filter = ['date']
+    search_fields = ['habit__action', 'user__email']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(HabitLogArchive)
+class HabitLogArchiveAdmin(admin.ModelAdmin):
+    """Админка для архива логов"""
+    
+    list_display = ['habit', 'year', 'completions', 'updated_at']
+    list_filter = ['year']
+    search_fields = ['habit__action', 'habit__user__email']
+    readonly_fields = ['updated_at']
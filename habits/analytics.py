@@ -0,0 +1,101 @@
+"""
+Аналитика выполнения привычек по дневным агрегатам (HabitDailyRollup).
+
+Запрос читает не больше одной строки на день периода (сумма по привычкам
+пользователя), поэтому время ответа зависит от длины периода, а не от
+длины истории логов. Недели начинаются с понедельника.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Sum
+
+from .models import HabitDailyRollup, RollupState
+from .partitions import add_months, month_start
+
+PERIOD_DAY = 'day'
+PERIOD_WEEK = 'week'
+PERIOD_MONTH = 'month'
+PERIODS = (PERIOD_DAY, PERIOD_WEEK, PERIOD_MONTH)
+
+# Число корзин по умолчанию, если начало периода не задано
+DEFAULT_BUCKETS = {PERIOD_DAY: 30, PERIOD_WEEK: 12, PERIOD_MONTH: 12}
+
+
+def bucket_start(day, period):
+    """Первый день корзины, в которую попадает день"""
+    if period == PERIOD_WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == PERIOD_MONTH:
+        return month_start(day)
+    return day
+
+
+def next_bucket(start, period):
+    """Начало следующей корзины"""
+    if period == PERIOD_WEEK:
+        return start + timedelta(weeks=1)
+    if period == PERIOD_MONTH:
+        return add_months(start, 1)
+    return start + timedelta(days=1)
+
+
+def default_start(end, period):
+    """Начало периода по умолчанию: DEFAULT_BUCKETS корзин, включая текущую"""
+    count = DEFAULT_BUCKETS[period] - 1
+    last = bucket_start(end, period)
+    if period == PERIOD_WEEK:
+        return last - timedelta(weeks=count)
+    if period == PERIOD_MONTH:
+        return add_months(last, -count)
+    return last - timedelta(days=count)
+
+
+def daily_completions(user, start, end, habit_id=None):
+    """Выполнения пользователя по дням за [start, end]: {дата: число}"""
+    rollups = HabitDailyRollup.objects.filter(user=user, date__gte=start, date__lte=end)
+    if habit_id is not None:
+        rollups = rollups.filter(habit_id=habit_id)
+    return dict(
+        rollups
+        .order_by()
+        .values('date')
+        .annotate(total=Sum('completions'))
+        .values_list('date', 'total')
+    )
+
+
+def build_analytics(user, period, start, end, habit_id=None):
+    """
+    Корзины за период (пустые — с нулями, чтобы график был непрерывным)
+    и тепловая карта: выполнения по дням, только дни с выполнениями.
+    """
+    days = daily_completions(user, start, end, habit_id)
+    completions, active_days = defaultdict(int), defaultdict(int)
+    for day, total in days.items():
+        key = bucket_start(day, period)
+        completions[key] += total
+        active_days[key] += 1
+
+    buckets = []
+    current = bucket_start(start, period)
+    while current <= end:
+        buckets.append({
+            'start': current,
+            'completions': completions[current],
+            'active_days': active_days[current],
+        })
+        current = next_bucket(current, period)
+
+    state = RollupState.objects.filter(name=HabitDailyRollup.objects.state_name).first()
+    return {
+        'period': period,
+        'from': start,
+        'to': end,
+        'updated_at': state.updated_at if state else None,
+        'buckets': buckets,
+        'heatmap': [
+            {'date': day, 'completions': days[day]}
+            for day in sorted(days)
+        ],
+    }
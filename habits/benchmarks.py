@@ -0,0 +1,274 @@
+"""
+Бенчмарки фоновых задач и основных эндпоинтов HabitViewSet.
+
+Каждый замер выполняется в транзакции, которая откатывается, поэтому
+данные (например, сгенерированные командой generate_habits_data) не
+меняются между прогонами. Для каждого замера сохраняется число SQL-запросов
+и время выполнения. Число запросов не должно зависеть от объема данных:
+его рост почти всегда означает N+1, поэтому базовое значение сравнивается
+строго, а время — с допуском.
+
+Очередь outbox и публикация изменений расписания в бенчмарках заменяются
+заглушками: измеряется работа с базой, а не Redis.
+"""
+import json
+import logging
+import time as time_module
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Habit, User
+
+BENCHMARKS = {}
+
+# Абсолютный запас по времени: короткие замеры шумят сильнее множителя
+TIME_SLACK_MS = 5
+
+BENCHMARK_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'habits-benchmarks',
+        }
+    },
+}
+
+
+class BenchmarkError(Exception):
+    """Замер не удался: задача записала ошибку или эндпоинт вернул не 2xx"""
+
+
+def benchmark(name):
+    """Зарегистрировать замер: функция получает BenchmarkContext"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class NullOutbox:
+    """Outbox без Redis: только перебирает сообщения, как настоящая очередь"""
+
+    def __init__(self, client=None):
+        pass
+
+    def enqueue_many(self, entries, batch_size=None):
+        return sum(1 for _ in entries)
+
+
+class _ErrorCollector(logging.Handler):
+    """Задачи перехватывают исключения и только пишут их в лог"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class BenchmarkContext:
+    """Данные, на которых выполняются замеры"""
+
+    def __init__(self, user, habit):
+        self.user = user
+        self.habit = habit
+
+    @classmethod
+    def pick(cls):
+        """Пользователь с наибольшим числом привычек и его привычка с логами"""
+        user = (
+            User.objects.annotate(habit_count=Count('habits'))
+            .filter(habit_count__gt=0)
+            .order_by('-habit_count', 'id')
+            .first()
+        )
+        if user is None:
+            raise BenchmarkError('Нет данных: запустите generate_habits_data')
+        habit = (
+            Habit.objects.filter(user=user)
+            .annotate(log_count=Count('logs'))
+            .order_by('-log_count', 'id')
+            .first()
+        )
+        return cls(user, habit)
+
+    def client(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        return client
+
+
+def measure(func, repeat=1):
+    """
+    Выполнить func в откатываемой транзакции repeat раз.
+    Возвращает число запросов последнего прогона и лучшее время в мс.
+    """
+    best = None
+    queries = 0
+    for _ in range(repeat):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                started = time_module.perf_counter()
+                func()
+                elapsed = time_module.perf_counter() - started
+            transaction.set_rollback(True)
+        queries = len(captured)
+        best = elapsed if best is None else min(best, elapsed)
+    return {'queries': queries, 'ms': round(best * 1000, 2)}
+
+
+def run_task(task, *args):
+    """Выполнить задачу синхронно и проверить, что она не записала ошибок"""
+    collector = _ErrorCollector()
+    task_logger = logging.getLogger('telegram_bot.tasks')
+    task_logger.addHandler(collector)
+    try:
+        with mock.patch('telegram_bot.tasks.Outbox', NullOutbox), \
+                mock.patch('telegram_bot.tasks.publish_schedule_change'):
+            result = task(*args)
+    finally:
+        task_logger.removeHandler(collector)
+    if collector.messages:
+        raise BenchmarkError('; '.join(collector.messages))
+    return result
+
+
+def get(context, url):
+    """GET-запрос к API от имени пользователя замера"""
+    response = context.client().get(url)
+    if response.status_code >= 300:
+        raise BenchmarkError(f'GET {url}: {response.status_code}')
+    return response
+
+
+@benchmark('task.send_habit_reminders')
+def bench_send_habit_reminders(context):
+    # Работа тика выполняется шардами; один шард на все привычки — весь тик.
+    # Тик через сутки: наступают напоминания всех ежедневных привычек
+    from telegram_bot.tasks import send_habit_reminders_shard
+    tick = timezone.now() + timedelta(days=1)
+    run_task(send_habit_reminders_shard, 0, 1, tick.isoformat())
+
+
+@benchmark('task.check_habit_completion')
+def bench_check_habit_completion(context):
+    from telegram_bot.tasks import check_habit_completion
+    run_task(check_habit_completion)
+
+
+@benchmark('task.send_daily_summary')
+def bench_send_daily_summary(context):
+    from telegram_bot.tasks import send_daily_summary
+    run_task(send_daily_summary)
+
+
+@benchmark('api.habits.list')
+def bench_habits_list(context):
+    get(context, '/api/v1/habits/')
+
+
+@benchmark('api.habits.my_habits')
+def bench_my_habits(context):
+    get(context, '/api/v1/habits/my_habits/')
+
+
+@benchmark('api.habits.public_habits')
+def bench_public_habits(context):
+    # Замеряется промах кэша: страница строится из базы
+    cache.clear()
+    get(context, '/api/v1/habits/public_habits/')
+
+
+@benchmark('api.habits.retrieve')
+def bench_habit_retrieve(context):
+    get(context, f'/api/v1/habits/{context.habit.id}/')
+
+
+@benchmark('api.habits.logs')
+def bench_habit_logs(context):
+    get(context, f'/api/v1/habits/{context.habit.id}/logs/')
+
+
+@benchmark('api.habits.stats')
+def bench_habit_stats(context):
+    get(context, f'/api/v1/habits/{context.habit.id}/stats/')
+
+
+@benchmark('api.analytics')
+def bench_analytics(context):
+    # Полный допустимый период: время не должно зависеть от длины истории
+    today = timezone.localdate()
+    start = today - timedelta(days=settings.ANALYTICS_MAX_DAYS - 1)
+    get(context, f'/api/v1/analytics/?period=week&from={start}&to={today}')
+
+
+@benchmark('api.habits.complete')
+def bench_habit_complete(context):
+    response = context.client().post(f'/api/v1/habits/{context.habit.id}/complete/')
+    if response.status_code >= 300:
+        raise BenchmarkError(f'complete: {response.status_code}')
+
+
+def run_benchmarks(names=None, repeat=1):
+    """Выполнить замеры (по умолчанию все) и вернуть словарь результатов"""
+    context = BenchmarkContext.pick()
+    results = {}
+    with override_settings(**BENCHMARK_SETTINGS):
+        for name, func in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            results[name] = measure(lambda: func(context), repeat=repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Список превышений базовых значений.
+    Число запросов сравнивается строго, время — с множителем tolerance
+    (но не меньше TIME_SLACK_MS).
+    Замеры без базового значения пропускаются.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if 'queries' in expected and result['queries'] > expected['queries']:
+            regressions.append(
+                f"{name}: {result['queries']} запросов, базовое значение {expected['queries']}"
+            )
+        limit = expected.get('ms') and max(expected['ms'] * tolerance, expected['ms'] + TIME_SLACK_MS)
+        if limit and result['ms'] > limit:
+            regressions.append(
+                f"{name}: {result['ms']} мс, базовое значение {expected['ms']} мс "
+                f"(допуск x{tolerance})"
+            )
+    return regressions
+
+
+def load_baseline(path):
+    """Базовые значения из JSON-файла (пустой словарь, если файла нет)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    """Сохранить результаты как новые базовые значения"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
@@ -0,0 +1,198 @@
+"""
+Пакетные операции с привычками для синхронизации офлайн-клиентов.
+
+Весь пакет проверяется за один проход: все упомянутые привычки загружаются
+одним запросом, элементы проверяются общими правилами (habits.validators)
+по этому словарю, ошибки собираются по элементам, а корректные элементы
+записываются через bulk_create/bulk_update в одной транзакции.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Habit, HabitLog, HabitStats
+from .serializers import HabitBulkItemSerializer, HabitCompleteItemSerializer
+from .signals import habits_bulk_saved
+
+# Максимальное число элементов в одном пакете
+BULK_MAX_ITEMS = 500
+
+
+def _referenced_ids(items, *fields):
+    ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for field in fields:
+            try:
+                ids.add(int(item[field]))
+            except (KeyError, TypeError, ValueError):
+                pass
+    return ids
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bulk_save_habits(user, items):
+    """
+    Создать и обновить привычки пакетом.
+    Возвращает результат по каждому элементу в порядке запроса.
+    """
+    # Одним запросом: свои привычки для обновления и все связанные привычки
+    own_ids = _referenced_ids(items, 'id')
+    related_ids = _referenced_ids(items, 'related_habit')
+    habits_by_id = {
+        habit.id: habit
+        for habit in Habit.objects.select_related('related_habit').filter(
+            Q(id__in=own_ids, user=user) | Q(id__in=related_ids)
+        )
+    }
+    context = {'habits_by_id': habits_by_id}
+
+    results = []
+    to_create, to_update, update_fields = [], [], set()
+    for index, item in enumerate(items):
+        is_update = isinstance(item, dict) and 'id' in item
+        instance = None
+        if is_update:
+            instance = habits_by_id.get(_as_int(item['id']))
+            if instance is None or instance.user_id != user.id:
+                results.append({
+                    'index': index, 'status': 'error',
+                    'errors': {'id': ['Привычка не найдена']}
+                })
+                continue
+
+        # Правила проверяются по данным элемента вместе с текущими полями привычки
+        serializer = HabitBulkItemSerializer(
+            instance, data=item, partial=is_update, context=context
+        )
+        if not serializer.is_valid():
+            results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+            continue
+
+        data = dict(serializer.validated_data)
+        data.pop('id', None)
+        if is_update:
+            habit = instance
+            for field, value in data.items():
+                setattr(habit, field, value)
+            update_fields.update(data)
+        else:
+            habit = Habit(user=user, **data)
+
+        (to_update if is_update else to_create).append(habit)
+        results.append({
+            'index': index,
+            'status': 'updated' if is_update else 'created',
+            'habit': habit
+        })
+
+    now = timezone.now()
+    for habit in to_create:
+        habit.schedule(now, tz=user.timezone)
+    for habit in to_update:
+        habit.updated_at = now
+        if habit.needs_schedule():
+            habit.schedule(now, tz=user.timezone)
+            update_fields.add('next_fire_at')
+
+    with transaction.atomic():
+        Habit.objects.bulk_create(to_create)
+        if to_update:
+            Habit.objects.bulk_update(to_update, sorted(update_fields | {'updated_at'}))
+        saved = to_create + to_update
+        if saved:
+            transaction.on_commit(
+                lambda: habits_bulk_saved.send(sender=Habit, habits=saved)
+            )
+
+    for result in results:
+        if 'habit' in result:
+            result['id'] = result.pop('habit').id
+    return results
+
+
+def bulk_complete(user, items):
+    """
+    Отметить выполнение нескольких привычек пакетом.
+    Логи создаются одним bulk_create, счетчики серий обновляются в той же транзакции.
+    """
+    habits_by_id = {
+        habit.id: habit
+        for habit in Habit.objects.filter(
+            id__in=_referenced_ids(items, 'habit'), user=user
+        )
+    }
+    context = {'habits_by_id': habits_by_id}
+
+    results, logs = [], []
+    for index, item in enumerate(items):
+        serializer = HabitCompleteItemSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+            continue
+        log = HabitLog(
+            habit=serializer.validated_data['habit'],
+            completed_at=serializer.validated_data.get('completed_at') or timezone.now(),
+            is_completed=True
+        )
+        logs.append(log)
+        results.append({'index': index, 'status': 'completed', 'log': log})
+
+    with transaction.atomic():
+        HabitLog.objects.bulk_create(logs)
+        _update_stats(logs)
+
+    for result in results:
+        if 'log' in result:
+            log = result.pop('log')
+            result.update({'habit': log.habit_id, 'log_id': log.id})
+    return results
+
+
+def _update_stats(logs):
+    """Учесть новые логи в счетчиках серий привычек"""
+    days_by_habit = defaultdict(list)
+    for log in logs:
+        days_by_habit[log.habit].append(timezone.localdate(log.completed_at))
+    if not days_by_habit:
+        return
+
+    stats_by_habit = {
+        stats.habit_id: stats
+        for stats in HabitStats.objects.select_for_update().filter(
+            habit_id__in=[habit.id for habit in days_by_habit]
+        )
+    }
+    now = timezone.now()
+    to_rebuild, to_update = [], []
+    for habit, days in days_by_habit.items():
+        stats = stats_by_habit.get(habit.id)
+        if stats is None or (
+            stats.last_completed_date and min(days) < stats.last_completed_date
+        ):
+            # Новые счетчики и выполнения задним числом пересчитываются по всем логам
+            # (логи пакета уже записаны) одним пакетным пересчетом
+            to_rebuild.append(habit.id)
+            continue
+        stats.habit = habit
+        for day in sorted(days):
+            stats.record_completion(day)
+        # bulk_update не вызывает pre_save, поэтому auto_now не срабатывает
+        stats.updated_at = now
+        to_update.append(stats)
+
+    if to_rebuild:
+        HabitStats.objects.rebuild(habit_ids=to_rebuild)
+    HabitStats.objects.bulk_update(to_update, [
+        'current_streak', 'longest_streak', 'total_completions',
+        'completed_days', 'last_completed_date', 'updated_at'
+    ])
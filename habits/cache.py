@@ -0,0 +1,90 @@
+"""
+Кэш публичной ленты привычек в Redis.
+
+Сериализованные страницы хранятся под ключом с номером версии ленты.
+Сигналы модели Habit увеличивают версию при любом изменении публичных
+привычек, поэтому старые страницы просто перестают читаться и истекают
+по таймауту. Счетчики попаданий и промахов тоже хранятся в Redis.
+"""
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from redis import RedisError
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'public_habits:version'
+HITS_KEY = 'public_habits:hits'
+MISSES_KEY = 'public_habits:misses'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа еще нет: создаем атомарно и повторяем
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def get_version():
+    """Текущая версия публичной ленты"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_version():
+    """Сделать устаревшими все закэшированные страницы ленты"""
+    try:
+        return _incr(VERSION_KEY)
+    except RedisError as e:
+        logger.error(f"Error bumping public habits cache version: {e}")
+
+
+def page_key(request, version):
+    """Ключ страницы: версия, хост (ссылки next/previous абсолютные) и параметры"""
+    params = urlencode(sorted(request.query_params.items()))
+    return f'public_habits:v{version}:{request.get_host()}:{params}'
+
+
+def get_page(request):
+    """
+    Закэшированная страница ленты и ключ для ее сохранения.
+    При недоступности Redis возвращает (None, None) — лента отдается из базы.
+    """
+    try:
+        key = page_key(request, get_version())
+        data = cache.get(key)
+        _incr(HITS_KEY if data is not None else MISSES_KEY)
+        return data, key
+    except RedisError as e:
+        logger.error(f"Error reading public habits cache: {e}")
+        return None, None
+
+
+def set_page(key, data):
+    """Сохранить страницу ленты"""
+    if key is None:
+        return
+    try:
+        cache.set(key, data, timeout=settings.PUBLIC_HABITS_CACHE_TIMEOUT)
+    except RedisError as e:
+        logger.error(f"Error writing public habits cache: {e}")
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша ленты"""
+    values = cache.get_many([HITS_KEY, MISSES_KEY, VERSION_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+        'version': values.get(VERSION_KEY, 1),
+    }
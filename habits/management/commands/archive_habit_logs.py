@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from habits.models import HabitLogArchive
+
+
+class Command(BaseCommand):
+    """Свертка старых логов привычек в архив битовых карт"""
+
+    help = 'Сворачивает выполнения старше горизонта хранения в годовые битовые карты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.HABITLOG_ARCHIVE_AFTER_DAYS,
+            help='Архивировать выполнения старше стольких дней '
+                 '(по умолчанию HABITLOG_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько привычек обрабатывать в одной транзакции (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('Горизонт хранения должен быть больше нуля дней')
+        before = timezone.localdate() - timedelta(days=options['days'])
+        archived = HabitLogArchive.objects.archive(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Архивировано логов до {before}: {archived}'))
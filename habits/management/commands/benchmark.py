@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.benchmarks import (
+    BENCHMARKS, BenchmarkError, compare, load_baseline, run_benchmarks, save_baseline
+)
+
+
+class Command(BaseCommand):
+    """Замеры фоновых задач и эндпоинтов с проверкой по базовым значениям"""
+
+    help = 'Измеряет число SQL-запросов и время задач и API, сравнивает с baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help=f'Замеры для запуска (по умолчанию все): {", ".join(BENCHMARKS)}'
+        )
+        parser.add_argument(
+            '--baseline', type=Path,
+            default=Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json',
+            help='Файл базовых значений (по умолчанию benchmarks/baseline.json)'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как новые базовые значения'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=1.5,
+            help='Допустимый множитель времени относительно базового (по умолчанию 1.5)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Число прогонов каждого замера, берется лучшее время (по умолчанию 3)'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - BENCHMARKS.keys()
+        if unknown:
+            raise CommandError(f'Неизвестные замеры: {", ".join(sorted(unknown))}')
+
+        try:
+            results = run_benchmarks(options['names'], repeat=options['repeat'])
+        except BenchmarkError as e:
+            raise CommandError(f'Замер не удался: {e}')
+        baseline = load_baseline(options['baseline'])
+        for name, result in results.items():
+            expected = baseline.get(name, {})
+            self.stdout.write(
+                f"{name:32} {result['queries']:>5} запросов "
+                f"(база {expected.get('queries', '-')})  "
+                f"{result['ms']:>10.2f} мс (база {expected.get('ms', '-')})"
+            )
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], {**baseline, **results})
+            self.stdout.write(self.style.SUCCESS(f'Базовые значения записаны в {options["baseline"]}'))
+            return
+
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Превышены базовые значения:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Базовые значения не превышены'))
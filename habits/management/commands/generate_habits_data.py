@@ -0,0 +1,160 @@
+import io
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from habits.models import Habit, HabitDailyRollup, HabitLog, HabitStats, User
+from habits.utils import batched
+
+PLACES = ['Дома', 'Парк', 'Офис', 'Спортзал', 'Кухня', 'Балкон']
+ACTIONS = [
+    'Пробежка', 'Зарядка', 'Чтение', 'Медитация', 'Стакан воды',
+    'Прогулка', 'Растяжка', 'Английский', 'Дневник', 'Планирование дня'
+]
+PLEASANT_ACTIONS = ['Чай', 'Любимая музыка', 'Ванна', 'Сериал', 'Десерт']
+TIMEZONES = ['Europe/Moscow', 'Europe/Berlin', 'Asia/Yekaterinburg', 'Asia/Tokyo', 'America/New_York']
+EMAIL_TEMPLATE = 'bench{}@example.com'
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных для нагрузочных замеров"""
+
+    help = 'Создает пользователей, привычки и логи выполнения для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Число пользователей (по умолчанию 1000)'
+        )
+        parser.add_argument(
+            '--habits', type=int, default=5000,
+            help='Число привычек, распределяются по пользователям (по умолчанию 5000)'
+        )
+        parser.add_argument(
+            '--logs', type=int, default=100000,
+            help='Число логов выполнения (по умолчанию 100000)'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Глубина истории логов в днях (по умолчанию 365)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Размер пакета вставки (по умолчанию 10000)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Зерно генератора для воспроизводимых данных'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Пересчитать счетчики серий и дневные агрегаты после генерации'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        now = timezone.now()
+
+        user_ids = self.create_users(options['users'])
+        self.stdout.write(f'Пользователей: {len(user_ids)}')
+
+        habit_ids = self.create_habits(user_ids, options['habits'], now)
+        self.stdout.write(f'Привычек: {len(habit_ids)}')
+
+        logs = self.create_logs(habit_ids, options['logs'], options['days'], now)
+        self.stdout.write(f'Логов: {logs}')
+
+        if options['stats']:
+            # Сотни тысяч id в IN медленнее полного пересчета
+            rebuilt = HabitStats.objects.rebuild(batch_size=self.batch_size)
+            self.stdout.write(f'Пересчитана статистика {rebuilt} привычек')
+            refreshed = HabitDailyRollup.objects.refresh(batch_size=self.batch_size)
+            self.stdout.write(f'Пересчитано дневных агрегатов: {refreshed}')
+
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы'))
+
+    def create_users(self, count):
+        """Пользователи с общим хэшем пароля: хэширование — самая медленная часть"""
+        start = User.objects.filter(email__startswith='bench').count()
+        password = make_password('benchmark')
+        users = (
+            User(
+                email=EMAIL_TEMPLATE.format(start + i),
+                password=password,
+                telegram_chat_id=str(10 ** 9 + start + i),
+                timezone=self.random.choice(TIMEZONES)
+            )
+            for i in range(count)
+        )
+        created = []
+        for batch in batched(users, self.batch_size):
+            with transaction.atomic():
+                created.extend(User.objects.bulk_create(batch))
+        return [(user.id, user.timezone) for user in created]
+
+    def create_habits(self, users, count, now):
+        """Полезные привычки с расписанием и немного приятных на каждого пользователя"""
+        def habits():
+            for i in range(count):
+                user_id, user_timezone = users[i % len(users)]
+                is_pleasant = self.random.random() < 0.1
+                habit = Habit(
+                    user_id=user_id,
+                    place=self.random.choice(PLACES),
+                    time=time(self.random.randrange(6, 23), self.random.choice([0, 15, 30, 45])),
+                    action=self.random.choice(PLEASANT_ACTIONS if is_pleasant else ACTIONS),
+                    is_pleasant=is_pleasant,
+                    periodicity=self.random.choice([1, 1, 1, 2, 3, 7]),
+                    estimated_time=self.random.randrange(30, 121, 30),
+                    reward='' if is_pleasant else self.random.choice(['', 'Кофе', 'Отдых']),
+                    is_public=self.random.random() < 0.2
+                )
+                habit.schedule(now, tz=user_timezone)
+                yield habit
+
+        habit_ids = []
+        for batch in batched(habits(), self.batch_size):
+            with transaction.atomic():
+                habit_ids.extend(habit.id for habit in Habit.objects.bulk_create(batch))
+        return habit_ids
+
+    def create_logs(self, habit_ids, count, days, now):
+        """Логи выполнения, равномерно распределенные по истории"""
+        span = days * 24 * 3600
+
+        def rows():
+            for _ in range(count):
+                completed_at = now - timedelta(seconds=self.random.randrange(span))
+                yield self.random.choice(habit_ids), completed_at
+
+        created = 0
+        for batch in batched(rows(), self.batch_size):
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    self.copy_logs(batch)
+                else:
+                    HabitLog.objects.bulk_create(
+                        HabitLog(habit_id=habit_id, completed_at=completed_at, is_completed=True)
+                        for habit_id, completed_at in batch
+                    )
+            created += len(batch)
+            if created % (self.batch_size * 100) == 0:
+                self.stdout.write(f'  ... {created} логов')
+        return created
+
+    def copy_logs(self, batch):
+        """Вставка логов через COPY: на десятках миллионов строк в разы быстрее INSERT"""
+        buffer = io.StringIO()
+        for habit_id, completed_at in batch:
+            buffer.write(f'{habit_id}\t{datetime.isoformat(completed_at)}\tt\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f'COPY {HabitLog._meta.db_table} (habit_id, completed_at, is_completed) FROM STDIN',
+                buffer
+            )
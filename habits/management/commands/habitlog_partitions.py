@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from habits.partitions import (
+    add_months,
+    create_partition,
+    detach_partition,
+    is_partitioned,
+    list_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    """Обслуживание помесячных секций таблицы логов привычек"""
+
+    help = 'Создает будущие секции habits_habitlog и отсоединяет устаревшие'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=3,
+            help='Сколько будущих месяцев должно иметь секции (по умолчанию 3)'
+        )
+        parser.add_argument(
+            '--retain', type=int, default=None,
+            help='Сколько последних месяцев оставить присоединенными; '
+                 'более старые секции отсоединяются'
+        )
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Удалять отсоединенные секции вместо того, чтобы оставлять их таблицами'
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('Таблица habits_habitlog не секционирована (нужен PostgreSQL)')
+
+        current = month_start(timezone.now().date())
+        existing = set(list_partitions())
+
+        for offset in range(options['ahead'] + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                create_partition(month)
+                self.stdout.write(f'Создана секция за {month:%Y-%m}')
+
+        if options['retain'] is not None:
+            oldest_kept = add_months(current, -options['retain'] + 1)
+            for month in sorted(existing):
+                if month < oldest_kept:
+                    name = detach_partition(month, drop=options['drop'])
+                    action = 'Удалена' if options['drop'] else 'Отсоединена'
+                    self.stdout.write(f'{action} секция {name}')
+
+        self.stdout.write(self.style.SUCCESS('Секции habits_habitlog актуальны'))
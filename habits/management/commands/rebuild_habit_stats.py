@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from habits.models import HabitStats
+
+
+class Command(BaseCommand):
+    """Пересчет счетчиков выполнения привычек по логам"""
+
+    help = 'Пересчитывает серии и счетчики выполнения привычек по логам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--habit', type=int, nargs='*', dest='habit_ids',
+            help='ID привычек для пересчета (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пакета для сохранения (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = HabitStats.objects.rebuild(
+            habit_ids=options['habit_ids'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Пересчитана статистика {rebuilt} привычек'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from habits.models import HabitLogArchive
+
+
+class Command(BaseCommand):
+    """Восстановление логов привычек из архива битовых карт"""
+
+    help = 'Разворачивает архив выполнений обратно в логи (по логу на отмеченный день)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--habit', type=int, nargs='*', dest='habit_ids',
+            help='ID привычек для восстановления (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--year', type=int, nargs='*', dest='years',
+            help='Годы для восстановления (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько годовых карт обрабатывать в одной транзакции (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        restored = HabitLogArchive.objects.restore(
+            habit_ids=options['habit_ids'],
+            years=options['years'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Восстановлено логов: {restored}'))
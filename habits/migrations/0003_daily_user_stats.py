@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0002_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('total_habits', models.PositiveIntegerField(default=0, verbose_name='Всего полезных привычек')),
+                ('completed_habits', models.PositiveIntegerField(default=0, verbose_name='Выполнено привычек')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Статистика за день',
+                'verbose_name_plural': 'Статистика за день',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='daily_stats_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyuserstats',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_user_daily_stats'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:22
+
+from datetime import date
+
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+# Сколько будущих месяцев создать сразу; дальше секции создает команда
+# manage.py habitlog_partitions
+PARTITIONS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_habitlog(apps, schema_editor):
+    """
+    Перевод habits_habitlog на секционирование по месяцам (только PostgreSQL).
+
+    Старая таблица не копируется: она переименовывается и присоединяется
+    к новой секционированной таблице как секция для всех строк до начала
+    следующего месяца. Новые строки попадают в помесячные секции.
+
+    Переименование таблицы не переименовывает ее индексы и последовательность,
+    поэтому они получают имена с суффиксом _legacy, иначе имена заняты для
+    новой таблицы. Первичный ключ секции должен совпадать с ключом родителя
+    (id, completed_at), поэтому старый ключ по id перестраивается.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM habits_habitlog")
+        next_id = cursor.fetchone()[0]
+        cursor.execute("SELECT (now() AT TIME ZONE 'UTC')::date")
+        today = cursor.fetchone()[0]
+
+    first_month = _add_months(date(today.year, today.month, 1), 1)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = 'habits_habitlog'::regclass AND contype = 'p'"
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = 'habits_habitlog'"
+        )
+        indexes = [name for name, in cursor.fetchall() if name != primary_key]
+        cursor.execute("SELECT pg_get_serial_sequence('habits_habitlog', 'id')")
+        sequence = cursor.fetchone()[0]
+
+    execute("ALTER TABLE habits_habitlog RENAME TO habits_habitlog_legacy")
+    for index in indexes:
+        legacy_name = index.replace('habits_habitlog', 'habits_habitlog_legacy', 1)[:63]
+        execute(f'ALTER INDEX "{index}" RENAME TO "{legacy_name}"')
+    execute(f'ALTER TABLE habits_habitlog_legacy DROP CONSTRAINT "{primary_key}"')
+    execute(
+        "ALTER TABLE habits_habitlog_legacy ADD CONSTRAINT habits_habitlog_legacy_pkey "
+        "PRIMARY KEY (id, completed_at)"
+    )
+    if sequence:
+        execute(f"ALTER SEQUENCE {sequence} RENAME TO habits_habitlog_legacy_id_seq")
+    execute("ALTER TABLE habits_habitlog_legacy ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    execute("ALTER TABLE habits_habitlog_legacy ALTER COLUMN id DROP DEFAULT")
+    execute(f"CREATE SEQUENCE habits_habitlog_part_id_seq START WITH {next_id}")
+    execute(
+        "CREATE TABLE habits_habitlog ("
+        " id bigint NOT NULL DEFAULT nextval('habits_habitlog_part_id_seq'),"
+        " completed_at timestamp with time zone NOT NULL,"
+        " is_completed boolean NOT NULL,"
+        " habit_id bigint NOT NULL,"
+        " PRIMARY KEY (id, completed_at)"
+        ") PARTITION BY RANGE (completed_at)"
+    )
+    execute("ALTER SEQUENCE habits_habitlog_part_id_seq OWNED BY habits_habitlog.id")
+    execute(
+        "ALTER TABLE habits_habitlog ADD CONSTRAINT habits_habitlog_habit_id_part_fk "
+        "FOREIGN KEY (habit_id) REFERENCES habits_habit (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute(
+        "ALTER TABLE habits_habitlog ATTACH PARTITION habits_habitlog_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()}')"
+    )
+    for offset in range(PARTITIONS_AHEAD + 1):
+        start = _add_months(first_month, offset)
+        end = _add_months(start, 1)
+        execute(
+            f"CREATE TABLE habits_habitlog_p{start:%Y%m} PARTITION OF habits_habitlog "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    execute("CREATE TABLE habits_habitlog_default PARTITION OF habits_habitlog DEFAULT")
+
+
+def unpartition_habitlog(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        raise IrreversibleError('Секционирование habits_habitlog нельзя откатить автоматически')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0003_daily_user_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_habitlog, unpartition_habitlog),
+        migrations.AddIndex(
+            model_name='habitlog',
+            index=models.Index(fields=['habit', 'completed_at'], name='habitlog_habit_completed_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_habitlog_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='habits.habit', verbose_name='Привычка')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='Текущая серия')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='Самая длинная серия')),
+                ('total_completions', models.PositiveIntegerField(default=0, verbose_name='Всего выполнений')),
+                ('completed_days', models.PositiveIntegerField(default=0, verbose_name='Дней с выполнением')),
+                ('last_completed_date', models.DateField(blank=True, null=True, verbose_name='Дата последнего выполнения')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика привычки',
+                'verbose_name_plural': 'Статистика привычек',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0005_habit_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='habit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-created_at', '-id'], name='habit_public_created_idx'),
+        ),
+    ]
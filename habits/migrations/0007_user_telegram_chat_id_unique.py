@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:36
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalize_chat_ids(apps, schema_editor):
+    """
+    Подготовка к уникальному индексу: пустые значения становятся NULL.
+    Чат, привязанный к нескольким пользователям, автоматически не
+    переназначается: иначе остальные молча перестали бы получать
+    напоминания. Миграция останавливается со списком пользователей,
+    конфликт нужно разрешить вручную и запустить ее снова.
+    """
+    User = apps.get_model('habits', 'User')
+    User.objects.filter(telegram_chat_id='').update(telegram_chat_id=None)
+    duplicates = (
+        User.objects.exclude(telegram_chat_id=None)
+        .values('telegram_chat_id')
+        .annotate(users=Count('id'))
+        .filter(users__gt=1)
+        .values_list('telegram_chat_id', flat=True)
+    )
+    conflicts = defaultdict(list)
+    for user_id, chat_id in (
+        User.objects.filter(telegram_chat_id__in=list(duplicates))
+        .order_by('telegram_chat_id', 'id')
+        .values_list('id', 'telegram_chat_id')
+    ):
+        conflicts[chat_id].append(user_id)
+    if conflicts:
+        details = '; '.join(
+            f"чат {chat_id}: пользователи {', '.join(map(str, user_ids))}"
+            for chat_id, user_ids in conflicts.items()
+        )
+        raise RuntimeError(
+            'telegram_chat_id должен быть уникальным, но чаты привязаны '
+            f'к нескольким пользователям ({details}). Оставьте чат одному '
+            'пользователю и повторите migrate.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_habit_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_chat_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='telegram_chat_id',
+            field=models.CharField(blank=True, help_text='ID чата в Telegram для отправки уведомлений', max_length=100, null=True, unique=True, verbose_name='Telegram Chat ID'),
+        ),
+    ]
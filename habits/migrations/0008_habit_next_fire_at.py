@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:40
+
+from django.db import migrations, models
+from django.utils import timezone
+import habits.utils
+
+BATCH_SIZE = 1000
+
+
+def schedule_habits(apps, schema_editor):
+    """Рассчитать ближайшее напоминание для существующих полезных привычек"""
+    Habit = apps.get_model('habits', 'Habit')
+    now = timezone.now()
+    queryset = (
+        Habit.objects.filter(is_pleasant=False)
+        .select_related('user')
+        .only('id', 'time', 'periodicity', 'user__timezone')
+        .order_by('id')
+    )
+    for batch in habits.utils.batched(queryset.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+        for habit in batch:
+            habit.next_fire_at = habits.utils.next_fire_time(
+                habit.time, habit.periodicity, habit.user.timezone, now
+            )
+        Habit.objects.bulk_update(batch, ['next_fire_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0007_user_telegram_chat_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_fire_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Вычисляется по времени, периодичности и часовому поясу пользователя', null=True, verbose_name='Следующее напоминание'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='Europe/Moscow', help_text='Часовой пояс IANA, в котором указано время привычек', max_length=64, validators=[habits.utils.validate_timezone], verbose_name='Часовой пояс'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasant', False)), fields=['next_fire_at'], name='habit_next_fire_idx'),
+        ),
+        migrations.RunPython(schedule_habits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_habit_next_fire_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Агрегат')),
+                ('last_log_id', models.BigIntegerField(default=0, verbose_name='Последний учтенный лог')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Состояние агрегата',
+                'verbose_name_plural': 'Состояния агрегатов',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Выполнений')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='habits.habit', verbose_name='Привычка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='habit_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выполнения привычки за день',
+                'verbose_name_plural': 'Выполнения привычек по дням',
+                'indexes': [models.Index(fields=['user', 'date'], name='habit_rollup_user_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='habitdailyrollup',
+            constraint=models.UniqueConstraint(fields=('habit', 'date'), name='unique_habit_daily_rollup'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_habit_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('days', models.BinaryField(help_text='Бит на день года, начиная с 1 января', max_length=46, verbose_name='Дни выполнения')),
+                ('completions', models.PositiveIntegerField(default=0, help_text='Число архивированных логов (за день их может быть несколько)', verbose_name='Выполнений')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_archives', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Архив логов привычки',
+                'verbose_name_plural': 'Архив логов привычек',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='habitlogarchive',
+            constraint=models.UniqueConstraint(fields=('habit', 'year'), name='unique_habit_log_archive'),
+        ),
+    ]
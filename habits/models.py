@@ -1,8 +1,23 @@
-from django.db import models
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, FilteredRelation, Max, Q, Sum
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from .utils import (
+    YEAR_BITMAP_BYTES, batched, bitmap_days, day_bounds, days_to_bitmap, next_fire_time,
+    validate_timezone
+)
+from .validators import check_habit, values_from_instance
+
 
 class UserManager(BaseUserManager):
     """Кастомный менеджер пользователей"""
@@ -39,6 +54,7 @@ class User(AbstractUser):
         max_length=100,
         blank=True,
         null=True,
+        unique=True,
         verbose_name='Telegram Chat ID',
         help_text='ID чата в Telegram для отправки уведомлений'
     )
@@ -49,6 +65,13 @@ class User(AbstractUser):
         verbose_name='Telegram Username',
         help_text='Имя пользователя в Telegram'
     )
+    timezone = models.CharField(
+        max_length=64,
+        default=settings.TIME_ZONE,
+        validators=[validate_timezone],
+        verbose_name='Часовой пояс',
+        help_text='Часовой пояс IANA, в котором указано время привычек'
+    )
     
     objects = UserManager()
     
@@ -61,6 +84,11 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.email
+    
+    def save(self, *args, **kwargs):
+        # Пустая строка хранится как NULL, иначе она нарушит уникальность
+        self.telegram_chat_id = self.telegram_chat_id or None
+        super().save(*args, **kwargs)
 
 
 class Habit(models.Model):
@@ -128,49 +156,112 @@ class Habit(models.Model):
         auto_now=True,
         verbose_name='Дата обновления'
     )
+    next_fire_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Следующее напоминание',
+        help_text='Вычисляется по времени, периодичности и часовому поясу пользователя'
+    )
 
     class Meta:
         verbose_name = 'Привычка'
         verbose_name_plural = 'Привычки'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                name='habit_user_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='habit_public_created_idx',
+                condition=Q(is_public=True)
+            ),
+            models.Index(
+                fields=['next_fire_at'],
+                name='habit_next_fire_idx',
+                condition=Q(is_pleasant=False)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.action} в {self.place} в {self.time}"
 
-    def clean(self):
-        """Валидация модели"""
-        errors = {}
-        
-        # Исключить одновременный выбор связанной привычки и указания вознаграждения
-        if self.related_habit and self.reward:
-            errors['related_habit'] = 'Нельзя одновременно указывать связанную привычку и вознаграждение'
-            errors['reward'] = 'Нельзя одновременно указывать связанную привычку и вознаграждение'
-        
-        # Время выполнения должно быть не больше 120 секунд
-        if self.estimated_time and self.estimated_time > 120:
-            errors['estimated_time'] = 'Время выполнения должно быть не больше 120 секунд'
-        
-        # В связанные привычки могут попадать только привычки с признаком приятной привычки
-        if self.related_habit and not self.related_habit.is_pleasant:
-            errors['related_habit'] = 'В связанные привычки могут попадать только приятные привычки'
-        
-        # У приятной привычки не может быть вознаграждения или связанной привычки
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Связь из базы уже проверена при сохранении и не требует повторной загрузки
+        instance._loaded_related_habit_id = instance.__dict__.get('related_habit_id')
+        instance._loaded_schedule = instance.schedule_key()
+        return instance
+
+    def schedule_key(self):
+        """Поля, от которых зависит расписание напоминаний"""
+        return tuple(self.__dict__.get(field) for field in ('time', 'periodicity', 'is_pleasant'))
+
+    def schedule(self, now=None, tz=None):
+        """Рассчитать ближайшее напоминание (у приятных привычек его нет)"""
         if self.is_pleasant:
-            if self.reward:
-                errors['reward'] = 'У приятной привычки не может быть вознаграждения'
-            if self.related_habit:
-                errors['related_habit'] = 'У приятной привычки не может быть связанной привычки'
-        
-        # Нельзя выполнять привычку реже, чем 1 раз в 7 дней
-        if self.periodicity > 7:
-            errors['periodicity'] = 'Нельзя выполнять привычку реже, чем 1 раз в 7 дней'
-        
+            self.next_fire_at = None
+        else:
+            self.next_fire_at = next_fire_time(
+                self.time, self.periodicity, tz or self.user.timezone,
+                now or timezone.now()
+            )
+        self._loaded_schedule = self.schedule_key()
+
+    def advance(self, now, tz=None):
+        """Перенести напоминание на следующий период после срабатывания"""
+        self.next_fire_at = next_fire_time(
+            self.time, self.periodicity, tz or self.user.timezone,
+            now, previous=self.next_fire_at
+        )
+
+    def needs_schedule(self):
+        """Нужно ли пересчитать напоминание перед сохранением"""
+        if self.schedule_key() != getattr(self, '_loaded_schedule', None):
+            return True
+        return self.next_fire_at is None and not self.is_pleasant
+
+    def clean(self, related_habits=None):
+        """
+        Валидация модели по общим правилам (habits.validators).
+        related_habits — словарь id -> Habit с заранее загруженными связанными привычками.
+        """
+        errors = check_habit(values_from_instance(self, related_habits))
         if errors:
             raise ValidationError(errors)
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, tz=None, **kwargs):
+        """
+        tz — часовой пояс пользователя, если он известен вызывающему: иначе
+        для пересчета напоминания загружается пользователь (если привычка
+        получена без select_related('user')).
+        """
         self.clean()
+        if self.needs_schedule():
+            self.schedule(tz=tz)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'next_fire_at'}
         super().save(*args, **kwargs)
+        self._loaded_related_habit_id = self.related_habit_id
+
+
+class HabitLogQuerySet(models.QuerySet):
+    """
+    Выборки логов по диапазону completed_at.
+    Фильтр по диапазону (а не completed_at__date) использует составной индекс
+    и позволяет PostgreSQL отсекать лишние помесячные секции таблицы.
+    """
+
+    def between(self, start, end):
+        """Логи в полуинтервале [start, end)"""
+        return self.filter(completed_at__gte=start, completed_at__lt=end)
+
+    def on_day(self, day):
+        """Логи за календарный день в текущем часовом поясе"""
+        return self.between(*day_bounds(day))
 
 
 class HabitLog(models.Model):
@@ -191,10 +282,658 @@ class HabitLog(models.Model):
         verbose_name='Выполнено'
     )
 
+    objects = HabitLogQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Лог привычки'
         verbose_name_plural = 'Логи привычек'
         ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['habit', 'completed_at'], name='habitlog_habit_completed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.habit.action} - {self.completed_at.strftime('%d.%m.%Y %H:%M')}"
+
+
+class DailyUserStatsManager(models.Manager):
+    """Менеджер ежедневной статистики пользователей"""
+
+    def refresh_for_date(self, day, batch_size=1000):
+        """
+        Пересчитать статистику всех пользователей за день.
+        Выполненные и общие количества считаются одним запросом с GROUP BY
+        по пользователю, результаты сохраняются пакетным upsert.
+        """
+        start, end = day_bounds(day)
+        rows = (
+            Habit.objects
+            .filter(is_pleasant=False)
+            .annotate(day_logs=FilteredRelation(
+                'logs',
+                condition=Q(
+                    logs__completed_at__gte=start,
+                    logs__completed_at__lt=end,
+                    logs__is_completed=True
+                )
+            ))
+            .order_by()
+            .values('user_id')
+            .annotate(
+                total=Count('id', distinct=True),
+                completed=Count('day_logs__habit_id', distinct=True)
+            )
+        )
+
+        batch = []
+        refreshed = 0
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(self.model(
+                user_id=row['user_id'],
+                date=day,
+                total_habits=row['total'],
+                completed_habits=row['completed']
+            ))
+            if len(batch) >= batch_size:
+                refreshed += self._upsert(batch)
+                batch = []
+        if batch:
+            refreshed += self._upsert(batch)
+        return refreshed
+
+    def _upsert(self, batch):
+        self.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=['total_habits', 'completed_habits', 'updated_at']
+        )
+        return len(batch)
+
+
+class DailyUserStats(models.Model):
+    """Предрасчитанная статистика выполнения привычек пользователя за день"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='daily_stats'
+    )
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    total_habits = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Всего полезных привычек'
+    )
+    completed_habits = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Выполнено привычек'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    objects = DailyUserStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика за день'
+        verbose_name_plural = 'Статистика за день'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_user_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_stats_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.date}: {self.completed_habits}/{self.total_habits}"
+
+    @property
+    def completion_rate(self):
+        """Процент выполнения привычек"""
+        if not self.total_habits:
+            return 0.0
+        return self.completed_habits / self.total_habits * 100
+
+
+def streaks_from_days(days, periodicity=1):
+    """
+    Серии выполнений по отсортированному списку дней выполнения.
+    Серия не прерывается, пока между выполнениями не больше periodicity дней.
+    Возвращает (серия на последний день, самая длинная серия).
+    """
+    current = longest = 0
+    previous = None
+    for day in days:
+        if previous is not None and day == previous:
+            continue
+        if previous is None or (day - previous).days > periodicity:
+            current = 1
+        else:
+            current += 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+class HabitStatsManager(models.Manager):
+    """Менеджер счетчиков выполнения привычек"""
+
+    def rebuild(self, habit_ids=None, batch_size=1000):
+        """
+        Пересчитать счетчики по логам (например, после загрузки истории).
+        Дни выполнения читаются одним потоковым запросом, отсортированным
+        по привычке, и сливаются с днями из архива логов; результаты
+        сохраняются пакетным upsert.
+        """
+        habits = Habit.objects.order_by()
+        logs = HabitLog.objects.filter(is_completed=True)
+        archives = HabitLogArchive.objects.all()
+        if habit_ids is not None:
+            habits = habits.filter(id__in=habit_ids)
+            logs = logs.filter(habit_id__in=habit_ids)
+            archives = archives.filter(habit_id__in=habit_ids)
+
+        periodicity = dict(habits.values_list('id', 'periodicity'))
+        totals = defaultdict(int)
+        for habit_id, total in (
+            logs.order_by().values('habit_id').annotate(total=Count('id'))
+            .values_list('habit_id', 'total')
+        ):
+            totals[habit_id] += total
+        for habit_id, total in (
+            archives.order_by().values('habit_id').annotate(total=Sum('completions'))
+            .values_list('habit_id', 'total')
+        ):
+            totals[habit_id] += total
+        days = (
+            logs.annotate(day=TruncDate('completed_at'))
+            .order_by('habit_id', 'day')
+            .values_list('habit_id', 'day')
+            .distinct()
+        )
+        # Дни из архива сливаются с днями логов: оба потока отсортированы по привычке
+        live_days = (
+            (habit_id, [day for _, day in group])
+            for habit_id, group in groupby(days.iterator(chunk_size=batch_size * 10), key=itemgetter(0))
+        )
+        archived_days = (
+            (habit_id, [day for archive in group for day in archive.archived_days()])
+            for habit_id, group in groupby(
+                archives.order_by('habit_id', 'year').iterator(chunk_size=batch_size),
+                key=attrgetter('habit_id')
+            )
+        )
+
+        def collect(habit_id, habit_days):
+            current, longest = streaks_from_days(habit_days, periodicity.get(habit_id, 1))
+            return self.model(
+                habit_id=habit_id,
+                current_streak=current,
+                longest_streak=longest,
+                total_completions=totals.get(habit_id, 0),
+                completed_days=len(habit_days),
+                last_completed_date=habit_days[-1] if habit_days else None
+            )
+
+        def rows():
+            seen = set()
+            merged = heapq.merge(live_days, archived_days, key=itemgetter(0))
+            for habit_id, parts in groupby(merged, key=itemgetter(0)):
+                seen.add(habit_id)
+                yield collect(habit_id, sorted(set().union(*(part for _, part in parts))))
+            # Привычки без выполнений получают нулевые счетчики
+            for habit_id in periodicity.keys() - seen:
+                yield collect(habit_id, [])
+
+        rebuilt = 0
+        for batch in batched(rows(), batch_size):
+            self.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['habit'],
+                update_fields=[
+                    'current_streak', 'longest_streak', 'total_completions',
+                    'completed_days', 'last_completed_date', 'updated_at'
+                ]
+            )
+            rebuilt += len(batch)
+        return rebuilt
+
+    def record(self, habit, day):
+        """
+        Учесть выполнение привычки за день (лог уже записан).
+        Строка счетчиков блокируется, поэтому вызывать внутри транзакции.
+        """
+        stats, created = self.select_for_update().get_or_create(habit=habit)
+        stats.habit = habit
+        if created:
+            stats.rebuild()
+        else:
+            stats.record_completion(day)
+        stats.save()
+        return stats
+
+
+class HabitStats(models.Model):
+    """
+    Счетчики выполнения привычки.
+    Обновляются инкрементально при выполнении и удалении логов, поэтому
+    статистика читается без сканирования логов.
+    """
+
+    habit = models.OneToOneField(
+        Habit,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Привычка',
+        related_name='stats'
+    )
+    current_streak = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Текущая серия'
+    )
+    longest_streak = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Самая длинная серия'
+    )
+    total_completions = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Всего выполнений'
+    )
+    completed_days = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Дней с выполнением'
+    )
+    last_completed_date = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='Дата последнего выполнения'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    objects = HabitStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика привычки'
+        verbose_name_plural = 'Статистика привычек'
+
+    def __str__(self):
+        return f"{self.habit_id}: серия {self.current_streak}, рекорд {self.longest_streak}"
+
+    def record_completion(self, day):
+        """Учесть новое выполнение привычки за день"""
+        self.total_completions += 1
+        if self.last_completed_date == day:
+            return
+        if self.last_completed_date and day < self.last_completed_date:
+            # Выполнение задним числом: серии нельзя обновить инкрементально
+            self.rebuild()
+            return
+        if self.last_completed_date and (day - self.last_completed_date).days <= self.habit.periodicity:
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+        self.completed_days += 1
+        self.last_completed_date = day
+
+    def rebuild(self):
+        """Пересчитать счетчики по логам привычки и ее архиву"""
+        logs = HabitLog.objects.filter(habit_id=self.habit_id, is_completed=True)
+        days = set(
+            logs.annotate(day=TruncDate('completed_at'))
+            .order_by()
+            .values_list('day', flat=True)
+            .distinct()
+        )
+        archived = 0
+        for archive in HabitLogArchive.objects.filter(habit_id=self.habit_id):
+            days.update(archive.archived_days())
+            archived += archive.completions
+        days = sorted(days)
+        self.total_completions = logs.count() + archived
+        self.completed_days = len(days)
+        self.current_streak, self.longest_streak = streaks_from_days(days, self.habit.periodicity)
+        self.last_completed_date = days[-1] if days else None
+
+    def effective_streak(self, today=None):
+        """Текущая серия с учетом того, что она могла прерваться к сегодняшнему дню"""
+        today = today or timezone.localdate()
+        if not self.last_completed_date:
+            return 0
+        if (today - self.last_completed_date).days > self.habit.periodicity:
+            return 0
+        return self.current_streak
+
+    def completion_rate(self, today=None):
+        """Процент периодов с выполнением с момента создания привычки"""
+        today = today or timezone.localdate()
+        created = timezone.localdate(self.habit.created_at)
+        periods = (today - created).days // self.habit.periodicity + 1
+        return min(100.0, self.completed_days / periods * 100) if periods > 0 else 0.0
+
+
+class RollupState(models.Model):
+    """Отметка (high-water mark) инкрементального пересчета агрегатов по логам"""
+
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Агрегат'
+    )
+    last_log_id = models.BigIntegerField(
+        default=0,
+        verbose_name='Последний учтенный лог'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    class Meta:
+        verbose_name = 'Состояние агрегата'
+        verbose_name_plural = 'Состояния агрегатов'
 
     def __str__(self):
-        return f"{self.habit.action} - {self.completed_at.strftime('%d.%m.%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.name}: {self.last_log_id}"
+
+
+class HabitDailyRollupManager(models.Manager):
+    """Менеджер дневных агрегатов выполнения привычек"""
+
+    state_name = 'habit_daily_rollup'
+
+    def refresh(self, batch_size=1000):
+        """
+        Учесть логи, добавленные после прошлого пересчета.
+        Логи читаются по id порциями из ANALYTICS_ROLLUP_CHUNK id, каждая
+        порция и отметка фиксируются в своей транзакции. Последние
+        ANALYTICS_ROLLUP_REWIND id перечитываются повторно: транзакция с
+        меньшим id может зафиксироваться позже большего. Затронутые пары
+        (привычка, день) пересчитываются заново, поэтому повтор безопасен.
+        Возвращает число пересчитанных пар.
+        """
+        RollupState.objects.get_or_create(name=self.state_name)
+        refreshed = 0
+        while True:
+            with transaction.atomic():
+                # Блокировка отметки не дает двум пересчетам идти одновременно
+                state = RollupState.objects.select_for_update().get(name=self.state_name)
+                latest = HabitLog.objects.aggregate(latest=Max('id'))['latest'] or 0
+                start = max(0, state.last_log_id - settings.ANALYTICS_ROLLUP_REWIND)
+                end = min(latest, state.last_log_id + settings.ANALYTICS_ROLLUP_CHUNK)
+                pairs = (
+                    HabitLog.objects
+                    .filter(id__gt=start, id__lte=end)
+                    .annotate(day=TruncDate('completed_at'))
+                    .order_by()
+                    .values_list('habit_id', 'day')
+                    .distinct()
+                )
+                for batch in batched(pairs.iterator(chunk_size=batch_size), batch_size):
+                    refreshed += self.recount(batch)
+                state.last_log_id = max(state.last_log_id, end)
+                state.save(update_fields=['last_log_id', 'updated_at'])
+            if end >= latest:
+                return refreshed
+
+    def recount(self, pairs):
+        """
+        Пересчитать агрегаты для пар (id привычки, день) по логам.
+        Для каждого дня — один запрос по индексу (habit, completed_at);
+        пары без выполнений удаляются.
+        """
+        habits_by_day = defaultdict(set)
+        for habit_id, day in pairs:
+            habits_by_day[day].add(habit_id)
+        users = dict(
+            Habit.objects
+            .filter(id__in={habit_id for habit_id, _ in pairs})
+            .values_list('id', 'user_id')
+        )
+
+        rows, empty = [], Q()
+        for day, habit_ids in habits_by_day.items():
+            counts = dict(
+                HabitLog.objects.on_day(day)
+                .filter(habit_id__in=habit_ids, is_completed=True)
+                .order_by()
+                .values('habit_id')
+                .annotate(total=Count('id'))
+                .values_list('habit_id', 'total')
+            )
+            for habit_id in habit_ids:
+                if counts.get(habit_id) and habit_id in users:
+                    rows.append(self.model(
+                        habit_id=habit_id,
+                        user_id=users[habit_id],
+                        date=day,
+                        completions=counts[habit_id]
+                    ))
+            missing = habit_ids - counts.keys()
+            if missing:
+                empty |= Q(date=day, habit_id__in=missing)
+
+        if empty:
+            self.filter(empty).delete()
+        self.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['habit', 'date'],
+            update_fields=['completions', 'updated_at']
+        )
+        return len(pairs)
+
+
+class HabitDailyRollup(models.Model):
+    """
+    Число выполнений привычки за день.
+    Пересчитывается инкрементально задачей refresh_habit_rollups, поэтому
+    аналитика за период читает не больше строки на привычку и день и не
+    зависит от длины истории логов. Строки не удаляются вместе с помесячными
+    секциями логов.
+    """
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        verbose_name='Привычка',
+        related_name='daily_rollups'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='habit_rollups'
+    )
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    completions = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Выполнений'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    objects = HabitDailyRollupManager()
+
+    class Meta:
+        verbose_name = 'Выполнения привычки за день'
+        verbose_name_plural = 'Выполнения привычек по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'date'], name='unique_habit_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='habit_rollup_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id} - {self.date}: {self.completions}"
+
+
+class HabitLogArchiveManager(models.Manager):
+    """Менеджер архива логов привычек"""
+
+    def archive(self, before, batch_size=1000):
+        """
+        Свернуть выполнения до дня before (не включая) в битовые карты.
+        Переносятся только логи, уже учтенные в дневных агрегатах аналитики
+        (id не больше отметки HabitDailyRollup минус ANALYTICS_ROLLUP_REWIND),
+        чтобы агрегаты не потеряли историю. Логи удаляются без сигналов
+        post_delete: счетчики серий и агрегаты не меняются. Логи без
+        выполнения (is_completed=False) не переносятся и остаются в таблице.
+        Возвращает число удаленных логов.
+        """
+        state = RollupState.objects.filter(name=HabitDailyRollup.objects.state_name).first()
+        max_id = (state.last_log_id if state else 0) - settings.ANALYTICS_ROLLUP_REWIND
+        if max_id <= 0:
+            return 0
+
+        logs = HabitLog.objects.filter(
+            completed_at__lt=day_bounds(before)[0],
+            is_completed=True,
+            id__lte=max_id
+        )
+        habit_ids = logs.order_by().values_list('habit_id', flat=True).distinct()
+        archived = 0
+        for batch in batched(list(habit_ids), batch_size):
+            with transaction.atomic():
+                archived += self._archive_batch(logs.filter(habit_id__in=batch))
+        return archived
+
+    def _archive_batch(self, logs):
+        days = defaultdict(set)
+        completions = defaultdict(int)
+        for habit_id, day, total in (
+            logs.annotate(day=TruncDate('completed_at'))
+            .order_by()
+            .values('habit_id', 'day')
+            .annotate(total=Count('id'))
+            .values_list('habit_id', 'day', 'total')
+        ):
+            days[habit_id, day.year].add(day)
+            completions[habit_id, day.year] += total
+
+        existing = {
+            (archive.habit_id, archive.year): archive
+            for archive in self.select_for_update().filter(
+                habit_id__in={habit_id for habit_id, _ in days},
+                year__in={year for _, year in days}
+            )
+        }
+        now = timezone.now()
+        to_create, to_update = [], []
+        for (habit_id, year), year_days in days.items():
+            archive = existing.get((habit_id, year))
+            if archive is None:
+                to_create.append(self.model(
+                    habit_id=habit_id,
+                    year=year,
+                    days=days_to_bitmap(year, year_days),
+                    completions=completions[habit_id, year]
+                ))
+            else:
+                archive.days = days_to_bitmap(year, year_days, archive.days)
+                archive.completions += completions[habit_id, year]
+                archive.updated_at = now
+                to_update.append(archive)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ['days', 'completions', 'updated_at'])
+        return logs._raw_delete(logs.db)
+
+    def restore(self, habit_ids=None, years=None, batch_size=1000):
+        """
+        Развернуть архив обратно в логи: по логу на отмеченный день
+        (в полдень по часовому поясу сервера). Число выполнений за день и
+        время выполнения в архиве не хранятся, поэтому после восстановления
+        счетчики серий пересчитываются по логам.
+        Возвращает число созданных логов.
+        """
+        archives = self.order_by('habit_id', 'year')
+        if habit_ids is not None:
+            archives = archives.filter(habit_id__in=habit_ids)
+        if years is not None:
+            archives = archives.filter(year__in=years)
+
+        restored = 0
+        for batch in batched(archives.iterator(chunk_size=batch_size), batch_size):
+            with transaction.atomic():
+                logs = [
+                    HabitLog(
+                        habit_id=archive.habit_id,
+                        completed_at=day_bounds(day)[0] + timedelta(hours=12),
+                        is_completed=True
+                    )
+                    for archive in batch
+                    for day in archive.archived_days()
+                ]
+                HabitLog.objects.bulk_create(logs, batch_size=batch_size)
+                self.filter(pk__in=[archive.pk for archive in batch]).delete()
+                HabitStats.objects.rebuild(
+                    habit_ids={archive.habit_id for archive in batch},
+                    batch_size=batch_size
+                )
+                restored += len(logs)
+        return restored
+
+
+class HabitLogArchive(models.Model):
+    """
+    Архив выполнений привычки за год: битовая карта дней года (бит на день,
+    YEAR_BITMAP_BYTES байт) вместо строки HabitLog с id и временем на каждое
+    выполнение. Серии и история читают и логи, и архив.
+    """
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        verbose_name='Привычка',
+        related_name='log_archives'
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name='Год'
+    )
+    days = models.BinaryField(
+        max_length=YEAR_BITMAP_BYTES,
+        verbose_name='Дни выполнения',
+        help_text='Бит на день года, начиная с 1 января'
+    )
+    completions = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Выполнений',
+        help_text='Число архивированных логов (за день их может быть несколько)'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    objects = HabitLogArchiveManager()
+
+    class Meta:
+        verbose_name = 'Архив логов привычки'
+        verbose_name_plural = 'Архив логов привычек'
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'year'], name='unique_habit_log_archive'),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id} - {self.year}: {self.completions}"
+
+    def archived_days(self, start=None, end=None):
+        """Дни выполнения из архива, при необходимости в пределах [start, end]"""
+        return [
+            day for day in bitmap_days(self.year, self.days)
+            if (start is None or day >= start) and (end is None or day <= end)
+        ]
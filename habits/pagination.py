@@ -0,0 +1,38 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+# Верхняя граница размера страницы, который может запросить клиент
+MAX_PAGE_SIZE = 100
+
+
+class HabitPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с выбираемым клиентом размером страницы"""
+
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация.
+    Страница выбирается условием по ключу сортировки вместо OFFSET и без
+    COUNT(*), поэтому глубокие страницы отдаются так же быстро, как первая.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        # Порядок фиксирован и совпадает с индексом; параметр ordering не учитывается
+        return self.ordering
+
+
+class HabitCursorPagination(KeysetPagination):
+    """Курсорная пагинация привычек по (created_at, id)"""
+
+    ordering = ('-created_at', '-id')
+
+
+class HabitLogCursorPagination(KeysetPagination):
+    """Курсорная пагинация логов по (completed_at, id)"""
+
+    ordering = ('-completed_at', '-id')
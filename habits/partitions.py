@@ -0,0 +1,85 @@
+"""
+Помесячное секционирование таблицы логов привычек (PostgreSQL).
+
+Таблица habits_habitlog секционирована по диапазону completed_at:
+одна секция на календарный месяц (habits_habitlog_pYYYYMM), секция
+habits_habitlog_legacy со всеми строками до перехода на секционирование
+и секция по умолчанию для строк вне созданных диапазонов.
+"""
+import re
+from datetime import date
+
+from django.db import connection
+
+PARENT_TABLE = 'habits_habitlog'
+PARTITION_PREFIX = f'{PARENT_TABLE}_p'
+PARTITION_NAME_RE = re.compile(rf'^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def month_start(day):
+    """Первое число месяца"""
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    """Сдвинуть первое число месяца на count месяцев"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Имя секции для месяца"""
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def is_partitioned(using=connection):
+    """Секционирована ли таблица логов"""
+    if using.vendor != 'postgresql':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [PARENT_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(using=connection):
+    """Месяцы, для которых есть присоединенные помесячные секции"""
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s",
+            [PARENT_TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month, using=connection):
+    """Создать секцию для месяца, если ее еще нет"""
+    start, end = month_start(month), add_months(month_start(month), 1)
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} "
+            f"PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+
+def detach_partition(month, drop=False, using=connection):
+    """Отсоединить секцию месяца от таблицы логов (и при необходимости удалить)"""
+    name = partition_name(month_start(month))
+    with using.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+        if drop:
+            cursor.execute(f"DROP TABLE {name}")
+    return name
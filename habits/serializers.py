@@ -1,54 +1,32 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, Habit, HabitLog
+from .analytics import PERIOD_DAY, PERIODS, default_start
+from .models import User, Habit, HabitLog, HabitStats
+from .validators import check_habit, values_from_data
 
 
 class BaseHabitValidationMixin:
-    """Миксин для валидации привычек"""
+    """Миксин для валидации привычек по общим правилам (habits.validators)"""
     
     def validate(self, data):
         """Валидация данных привычки"""
-        errors = {}
-        
-        # Исключить одновременный выбор связанной привычки и указания вознаграждения
-        if data.get('related_habit') and data.get('reward'):
-            errors['related_habit'] = 'Нельзя одновременно указывать связанную привычку и вознаграждение'
-            errors['reward'] = 'Нельзя одновременно указывать связанную привычку и вознаграждение'
-        
-        # Время выполнения должно быть не больше 120 секунд
-        if data.get('estimated_time') and data['estimated_time'] > 120:
-            errors['estimated_time'] = 'Время выполнения должно быть не больше 120 секунд'
-        
-        # У приятной привычки не может быть вознаграждения или связанной привычки
-        if data.get('is_pleasant'):
-            if data.get('reward'):
-                errors['reward'] = 'У приятной привычки не может быть вознаграждения'
-            if data.get('related_habit'):
-                errors['related_habit'] = 'У приятной привычки не может быть связанной привычки'
-        
-        # Нельзя выполнять привычку реже, чем 1 раз в 7 дней
-        if data.get('periodicity') and data['periodicity'] > 7:
-            errors['periodicity'] = 'Нельзя выполнять привычку реже, чем 1 раз в 7 дней'
-        
+        errors = check_habit(values_from_data(data, self.instance, self.Meta.model))
         if errors:
             raise serializers.ValidationError(errors)
         
         return data
 
-    def validate_related_habit(self, value):
-        """Валидация связанной привычки"""
-        if value and not value.is_pleasant:
-            raise serializers.ValidationError(
-                'В связанные привычки могут попадать только приятные привычки'
-            )
-        return value
-
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для пользователя"""
     
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'telegram_chat_id', 'telegram_username']
+        fields = [
+            'id', 'email', 'first_name', 'last_name', 'telegram_chat_id',
+            'telegram_username', 'timezone'
+        ]
         read_only_fields = ['id']
 
 
@@ -63,9 +41,9 @@ class HabitSerializer(BaseHabitValidationMixin, serializers.ModelSerializer):
         fields = [
             'id', 'user', 'place', 'time', 'action', 'is_pleasant',
             'related_habit', 'periodicity', 'reward', 'estimated_time',
-            'is_public', 'created_at', 'updated_at'
+            'is_public', 'next_fire_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'next_fire_at', 'created_at', 'updated_at']
 
 
 class HabitLogSerializer(serializers.ModelSerializer):
@@ -79,6 +57,57 @@ class HabitLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class HabitLogFlatSerializer(serializers.ModelSerializer):
+    """Сериализатор лога без вложенной привычки"""
+    
+    class Meta:
+        model = HabitLog
+        fields = ['id', 'completed_at', 'is_completed']
+        read_only_fields = fields
+
+
+class HabitLogPeriodSerializer(serializers.Serializer):
+    """Фильтр логов по периоду: from и to — даты включительно"""
+    
+    def get_fields(self):
+        # Имя from зарезервировано в Python, поэтому поля объявляются здесь
+        return {
+            'from': serializers.DateField(required=False),
+            'to': serializers.DateField(required=False),
+        }
+    
+    def validate(self, data):
+        if data.get('from') and data.get('to') and data['from'] > data['to']:
+            raise serializers.ValidationError({'from': 'Начало периода позже его окончания'})
+        return data
+
+
+class AnalyticsQuerySerializer(HabitLogPeriodSerializer):
+    """
+    Параметры аналитики: размер корзины, период (даты включительно,
+    не длиннее ANALYTICS_MAX_DAYS дней) и необязательная привычка.
+    """
+    
+    def get_fields(self):
+        return {
+            **super().get_fields(),
+            'period': serializers.ChoiceField(choices=PERIODS, default=PERIOD_DAY),
+            'habit': serializers.IntegerField(required=False, min_value=1),
+        }
+    
+    def validate(self, data):
+        data = super().validate(data)
+        data.setdefault('to', timezone.localdate())
+        data.setdefault('from', default_start(data['to'], data['period']))
+        if data['from'] > data['to']:
+            raise serializers.ValidationError({'from': 'Начало периода позже его окончания'})
+        if (data['to'] - data['from']).days >= settings.ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError(
+                {'from': f'Период не может быть длиннее {settings.ANALYTICS_MAX_DAYS} дней'}
+            )
+        return data
+
+
 class HabitCreateSerializer(BaseHabitValidationMixin, serializers.ModelSerializer):
     """Сериализатор для создания привычки"""
     
@@ -88,3 +117,59 @@ class HabitCreateSerializer(BaseHabitValidationMixin, serializers.ModelSerialize
             'place', 'time', 'action', 'is_pleasant', 'related_habit',
             'periodicity', 'reward', 'estimated_time', 'is_public'
         ]
+
+
+class HabitStatsSerializer(serializers.ModelSerializer):
+    """Сериализатор для статистики привычки"""
+    
+    current_streak = serializers.SerializerMethodField()
+    completion_rate = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = HabitStats
+        fields = [
+            'current_streak', 'longest_streak', 'total_completions',
+            'completed_days', 'last_completed_date', 'completion_rate'
+        ]
+    
+    def get_current_streak(self, obj):
+        return obj.effective_streak()
+    
+    def get_completion_rate(self, obj):
+        return round(obj.completion_rate(), 1)
+
+
+class PrefetchedHabitField(serializers.PrimaryKeyRelatedField):
+    """
+    Ссылка на привычку, которая ищется в заранее загруженном словаре
+    context['habits_by_id'] вместо отдельного запроса на каждое значение.
+    """
+    
+    def get_queryset(self):
+        return Habit.objects.none()
+    
+    def to_internal_value(self, data):
+        try:
+            habit = self.context['habits_by_id'].get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if habit is None:
+            self.fail('does_not_exist', pk_value=data)
+        return habit
+
+
+class HabitBulkItemSerializer(HabitCreateSerializer):
+    """Элемент пакетного создания/обновления: с id — обновление, без id — создание"""
+    
+    id = serializers.IntegerField(required=False)
+    related_habit = PrefetchedHabitField(required=False, allow_null=True)
+    
+    class Meta(HabitCreateSerializer.Meta):
+        fields = ['id'] + HabitCreateSerializer.Meta.fields
+
+
+class HabitCompleteItemSerializer(serializers.Serializer):
+    """Элемент пакетной отметки выполнения"""
+    
+    habit = PrefetchedHabitField()
+    completed_at = serializers.DateTimeField(required=False)
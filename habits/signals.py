@@ -0,0 +1,138 @@
+from collections import defaultdict
+from threading import local
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from . import cache
+from .models import Habit, HabitDailyRollup, HabitLog, HabitStats, User
+
+# Отправляется после фиксации пакетной записи привычек (аргумент habits):
+# bulk_create/bulk_update не вызывают post_save
+habits_bulk_saved = Signal()
+
+
+@receiver(post_init, sender=Habit)
+def habit_loaded(sender, instance, **kwargs):
+    """Запомнить, была ли привычка публичной до изменения"""
+    instance._was_public = instance.is_public
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    """Запомнить часовой пояс пользователя до изменения"""
+    instance._was_timezone = instance.__dict__.get('timezone')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Пересчитать напоминания привычек после смены часового пояса"""
+    if not created and instance._was_timezone != instance.timezone:
+        habits = list(Habit.objects.filter(user=instance, is_pleasant=False))
+        now = timezone.now()
+        for habit in habits:
+            habit.schedule(now, tz=instance.timezone)
+        Habit.objects.bulk_update(habits, ['next_fire_at'])
+        if habits:
+            transaction.on_commit(
+                lambda: habits_bulk_saved.send(sender=Habit, habits=habits)
+            )
+    instance._was_timezone = instance.timezone
+
+
+@receiver(post_save, sender=Habit)
+def habit_saved(sender, instance, **kwargs):
+    """Сбросить кэш публичной ленты, если изменилась публичная привычка"""
+    if instance.is_public or instance._was_public:
+        transaction.on_commit(cache.bump_version)
+    instance._was_public = instance.is_public
+
+
+@receiver(habits_bulk_saved, sender=Habit)
+def habits_bulk_saved_handler(sender, habits, **kwargs):
+    """Сбросить кэш публичной ленты после пакетной записи публичных привычек"""
+    if any(habit.is_public or habit._was_public for habit in habits):
+        cache.bump_version()
+    for habit in habits:
+        habit._was_public = habit.is_public
+
+
+@receiver(post_delete, sender=Habit)
+def habit_deleted(sender, instance, **kwargs):
+    """Сбросить кэш публичной ленты после удаления публичной привычки"""
+    if instance._was_public or instance.is_public:
+        transaction.on_commit(cache.bump_version)
+
+
+# Пары (привычка, день) удаленных логов, ожидающие пересчета агрегатов,
+# по алиасу базы (у каждого потока свое соединение). Пары откаченной
+# транзакции пересчитываются вместе со следующей: пересчет идемпотентен
+_pending_recounts = local()
+
+
+def pending_recount_pairs(using):
+    if not hasattr(_pending_recounts, 'pairs'):
+        _pending_recounts.pairs = defaultdict(set)
+    return _pending_recounts.pairs[using]
+
+
+def flush_rollup_recount(using=DEFAULT_DB_ALIAS):
+    """Пересчитать все накопленные пары одним вызовом; повторные вызовы ничего не делают"""
+    pending = pending_recount_pairs(using)
+    if pending:
+        pairs = set(pending)
+        pending.clear()
+        HabitDailyRollup.objects.recount(pairs)
+
+
+@receiver(post_delete, sender=HabitLog)
+def habit_log_rollup_deleted(sender, instance, origin=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Пересчитать дневной агрегат после удаления лога: инкрементальный
+    пересчет по high-water mark видит только новые логи. Пары всех
+    удаленных в транзакции логов пересчитывает первый обратный вызов
+    после фиксации, остальные находят список пустым.
+    """
+    if not (isinstance(origin, HabitLog) or getattr(origin, 'model', None) is HabitLog):
+        return
+    if not instance.is_completed:
+        return
+    pending_recount_pairs(using).add(
+        (instance.habit_id, timezone.localdate(instance.completed_at))
+    )
+    transaction.on_commit(lambda: flush_rollup_recount(using), using=using)
+
+
+@receiver(post_delete, sender=HabitLog)
+def habit_log_deleted(sender, instance, origin=None, **kwargs):
+    """Обновить счетчики привычки после удаления лога"""
+    # При каскадном удалении привычки или пользователя счетчики удаляются вместе с ней
+    if not (isinstance(origin, HabitLog) or getattr(origin, 'model', None) is HabitLog):
+        return
+    if not instance.is_completed:
+        return
+
+    with transaction.atomic():
+        stats = (
+            HabitStats.objects
+            .select_for_update()
+            .select_related('habit')
+            .filter(habit_id=instance.habit_id)
+            .first()
+        )
+        if stats is None:
+            return
+
+        day = timezone.localdate(instance.completed_at)
+        same_day = HabitLog.objects.on_day(day).filter(
+            habit_id=instance.habit_id,
+            is_completed=True
+        )
+        if same_day.exists():
+            # День остался выполненным: серии не меняются
+            stats.total_completions = max(0, stats.total_completions - 1)
+        else:
+            stats.rebuild()
+        stats.save()
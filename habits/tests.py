@@ -1,11 +1,36 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.request import Request
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from .models import Habit, HabitLog
-from datetime import time
+from django.utils import timezone
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from io import StringIO
+from pathlib import Path
+from django.conf import settings
+from .models import (
+    Habit, HabitLog, DailyUserStats, HabitDailyRollup, HabitLogArchive, HabitStats, RollupState,
+    streaks_from_days
+)
+from .partitions import add_months, month_start, partition_name
+from . import cache as public_feed_cache
+from .utils import (
+    YEAR_BITMAP_BYTES, bitmap_days, days_to_bitmap, timezone_names, validate_timezone
+)
+from prometheus_client import REGISTRY
+from unittest.mock import patch
+from habits_tracker.db_router import is_pinned_to_primary, read_from_replica
+from .benchmarks import BENCHMARKS, compare, load_baseline, run_benchmarks
+from .pagination import MAX_PAGE_SIZE, HabitCursorPagination, HabitPageNumberPagination
+from datetime import date, datetime, time, timedelta
+import json
 
 
 class HabitModelTest(TestCase):
@@ -171,7 +196,7 @@ class HabitAPITest(APITestCase):
         
         response = self.client.get(f'/api/v1/habits/{self.pleasant_habit.id}/logs/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
     
     def test_unauthorized_access(self):
         """Тест доступа без авторизации"""
@@ -221,4 +246,972 @@ class HabitLogModelTest(TestCase):
         )
         self.assertEqual(log.habit, self.habit)
         self.assertTrue(log.is_completed)
-        self.assertIsNotNone(log.completed_at)
\ No newline at end of file
+        self.assertIsNotNone(log.completed_at)
+
+class DailyUserStatsTest(TestCase):
+    """Тесты для ежедневной статистики пользователей"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='stats@example.com',
+            password='testpass123'
+        )
+        self.done = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        self.pending = Habit.objects.create(
+            user=self.user, place='Дома', time=time(21, 0),
+            action='Чтение', estimated_time=60
+        )
+        Habit.objects.create(
+            user=self.user, place='Дома', time=time(22, 0),
+            action='Чай', is_pleasant=True, estimated_time=60
+        )
+        # Два выполнения одной привычки считаются один раз
+        HabitLog.objects.create(habit=self.done, is_completed=True)
+        HabitLog.objects.create(habit=self.done, is_completed=True)
+    
+    def test_refresh_for_date(self):
+        """Тест пересчета статистики одним агрегирующим запросом"""
+        today = timezone.localdate()
+        with self.assertNumQueries(2):
+            DailyUserStats.objects.refresh_for_date(today)
+        
+        stats = DailyUserStats.objects.get(user=self.user, date=today)
+        self.assertEqual(stats.total_habits, 2)
+        self.assertEqual(stats.completed_habits, 1)
+        self.assertEqual(stats.completion_rate, 50.0)
+    
+    def test_refresh_updates_existing_row(self):
+        """Тест повторного пересчета за тот же день"""
+        today = timezone.localdate()
+        DailyUserStats.objects.refresh_for_date(today)
+        HabitLog.objects.create(habit=self.pending, is_completed=True)
+        DailyUserStats.objects.refresh_for_date(today)
+        
+        stats = DailyUserStats.objects.get(user=self.user, date=today)
+        self.assertEqual(stats.completed_habits, 2)
+        self.assertEqual(DailyUserStats.objects.count(), 1)
+
+
+class HabitLogPartitionsTest(TestCase):
+    """Тесты для помесячного секционирования логов"""
+    
+    def test_month_arithmetic(self):
+        """Тест расчета месяцев секций"""
+        self.assertEqual(month_start(date(2024, 2, 29)), date(2024, 2, 1))
+        self.assertEqual(add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+        self.assertEqual(partition_name(date(2024, 3, 1)), 'habits_habitlog_p202403')
+    
+    def test_on_day_uses_range(self):
+        """Тест выборки логов за день по диапазону completed_at"""
+        user = get_user_model().objects.create_user(
+            email='partitions@example.com',
+            password='testpass123'
+        )
+        habit = Habit.objects.create(
+            user=user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        log = HabitLog.objects.create(habit=habit)
+        HabitLog.objects.create(
+            habit=habit,
+            completed_at=log.completed_at - timedelta(days=1)
+        )
+        
+        today = HabitLog.objects.on_day(timezone.localdate(log.completed_at))
+        self.assertEqual(list(today), [log])
+        self.assertIn('completed_at" >=', str(today.query))
+
+
+class HabitStatsTest(APITestCase):
+    """Тесты для счетчиков выполнения привычек"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='streaks@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+    
+    def log_days_ago(self, days):
+        return HabitLog.objects.create(
+            habit=self.habit,
+            completed_at=timezone.now() - timedelta(days=days)
+        )
+    
+    def test_streaks_from_days(self):
+        """Тест расчета серий с учетом периодичности"""
+        days = [date(2024, 1, d) for d in (1, 2, 2, 3, 6, 7)]
+        self.assertEqual(streaks_from_days(days), (2, 3))
+        self.assertEqual(streaks_from_days(days, periodicity=3), (5, 5))
+        self.assertEqual(streaks_from_days([]), (0, 0))
+    
+    def test_complete_updates_stats(self):
+        """Тест инкрементального обновления счетчиков при выполнении"""
+        self.log_days_ago(2)
+        self.log_days_ago(1)
+        
+        response = self.client.post(f'/api/v1/habits/{self.habit.id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(f'/api/v1/habits/{self.habit.id}/complete/')
+        
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.current_streak, 3)
+        self.assertEqual(stats.longest_streak, 3)
+        self.assertEqual(stats.total_completions, 4)
+        self.assertEqual(stats.completed_days, 3)
+    
+    def test_log_deletion_updates_stats(self):
+        """Тест обновления счетчиков при удалении лога"""
+        self.log_days_ago(2)
+        middle = self.log_days_ago(1)
+        self.client.post(f'/api/v1/habits/{self.habit.id}/complete/')
+        
+        middle.delete()
+        
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.current_streak, 1)
+        self.assertEqual(stats.longest_streak, 1)
+        self.assertEqual(stats.total_completions, 2)
+    
+    def test_stats_endpoint(self):
+        """Тест эндпоинта статистики без сканирования логов"""
+        self.client.post(f'/api/v1/habits/{self.habit.id}/complete/')
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/habits/{self.habit.id}/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['current_streak'], 1)
+        self.assertEqual(response.data['completion_rate'], 100.0)
+    
+    def test_rebuild_command(self):
+        """Тест пересчета счетчиков по логам"""
+        for days in (4, 3, 1, 0):
+            self.log_days_ago(days)
+        
+        call_command('rebuild_habit_stats', stdout=StringIO())
+        
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.current_streak, 2)
+        self.assertEqual(stats.longest_streak, 2)
+        self.assertEqual(stats.total_completions, 4)
+
+
+class KeysetPaginationTest(APITestCase):
+    """Тесты для курсорной пагинации"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='keyset@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        Habit.objects.bulk_create([
+            Habit(
+                user=self.user, place='Дома', time=time(9, 0),
+                action=f'Привычка {i}', estimated_time=60, is_public=True
+            )
+            for i in range(7)
+        ])
+    
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+    
+    def test_cursor_pages_cover_all_habits(self):
+        """Тест обхода всех привычек курсорными страницами"""
+        ids = self.collect_pages('/api/v1/habits/my_habits/?pagination=cursor&page_size=3')
+        expected = list(
+            Habit.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+    
+    def test_cursor_page_skips_count_query(self):
+        """Тест: курсорная страница публичной ленты не выполняет COUNT(*)"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/habits/public_habits/?pagination=cursor')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+    
+    def test_page_size_is_capped(self):
+        """Тест ограничения размера страницы"""
+        request = Request(APIRequestFactory().get('/', {'page_size': MAX_PAGE_SIZE + 50}))
+        self.assertEqual(HabitCursorPagination().get_page_size(request), MAX_PAGE_SIZE)
+        self.assertEqual(HabitPageNumberPagination().get_page_size(request), MAX_PAGE_SIZE)
+        
+        response = self.client.get('/api/v1/habits/my_habits/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+
+class HabitLogsEndpointTest(APITestCase):
+    """Тесты для эндпоинта логов привычки"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='logs@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        self.today = timezone.localdate()
+        for days in range(10):
+            HabitLog.objects.create(
+                habit=self.habit,
+                completed_at=timezone.now() - timedelta(days=days)
+            )
+        self.url = f'/api/v1/habits/{self.habit.id}/logs/'
+    
+    def test_flat_paginated_logs(self):
+        """Тест плоского списка логов с привычкой один раз"""
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(response.data['habit']['id'], self.habit.id)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'completed_at', 'is_completed'})
+    
+    def test_period_filter(self):
+        """Тест фильтра логов по периоду"""
+        response = self.client.get(self.url, {
+            'from': (self.today - timedelta(days=2)).isoformat(),
+            'to': self.today.isoformat(),
+        })
+        self.assertEqual(response.data['count'], 3)
+        
+        response = self.client.get(self.url, {'from': self.today.isoformat(), 'to': '2000-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_ndjson_export(self):
+        """Тест потоковой выгрузки логов в NDJSON"""
+        response = self.client.get(self.url, {'export': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['habit']['id'], self.habit.id)
+        self.assertEqual(len(lines), 11)
+        self.assertEqual(set(json.loads(lines[1])), {'id', 'completed_at', 'is_completed'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PublicHabitsCacheTest(APITestCase):
+    """Тесты для кэша публичной ленты"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='feed@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            user=self.user, place='Парк', time=time(7, 0),
+            action='Пробежка', estimated_time=60, is_public=True
+        )
+    
+    def test_second_request_served_from_cache(self):
+        """Тест: повторный запрос страницы не обращается к базе"""
+        first = self.client.get('/api/v1/habits/public_habits/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/v1/habits/public_habits/')
+        self.assertEqual(first.data, second.data)
+        
+        stats = public_feed_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+    
+    def test_public_habit_change_invalidates_cache(self):
+        """Тест сброса кэша при изменении публичной привычки"""
+        self.client.get('/api/v1/habits/public_habits/')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.is_public = False
+            self.habit.save()
+        
+        response = self.client.get('/api/v1/habits/public_habits/')
+        self.assertEqual(response.data['count'], 0)
+    
+    def test_private_habit_change_keeps_cache(self):
+        """Тест: изменение приватной привычки не сбрасывает кэш"""
+        version = public_feed_cache.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.create(
+                user=self.user, place='Дома', time=time(8, 0),
+                action='Чтение', estimated_time=60
+            )
+        self.assertEqual(public_feed_cache.get_version(), version)
+
+
+class BulkHabitsTest(APITestCase):
+    """Тесты для пакетных операций с привычками"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='bulk@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.pleasant = Habit.objects.create(
+            user=self.user, place='Дома', time=time(20, 0),
+            action='Чай', is_pleasant=True, estimated_time=60
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Парк', time=time(7, 0),
+            action='Пробежка', estimated_time=60
+        )
+    
+    def test_bulk_create_and_update(self):
+        """Тест пакетного создания и обновления с ошибкой в одном элементе"""
+        items = [
+            {'place': 'Дома', 'time': '08:00', 'action': 'Зарядка',
+             'estimated_time': 60, 'related_habit': self.pleasant.id},
+            {'id': self.habit.id, 'place': 'Стадион'},
+            {'place': 'Дома', 'time': '09:00', 'action': 'Чтение',
+             'estimated_time': 300},
+            {'id': self.habit.id, 'related_habit': self.habit.id},
+        ]
+        response = self.client.post('/api/v1/habits/bulk/', items, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['created', 'updated', 'error', 'error'])
+        self.assertIn('estimated_time', results[2]['errors'])
+        self.assertIn('related_habit', results[3]['errors'])
+        
+        created = Habit.objects.get(id=results[0]['id'])
+        self.assertEqual(created.related_habit, self.pleasant)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.place, 'Стадион')
+        self.assertIsNone(self.habit.related_habit)
+    
+    def test_bulk_query_count_does_not_grow(self):
+        """Тест: число запросов не зависит от размера пакета"""
+        def items(count):
+            return [
+                {'place': 'Дома', 'time': '08:00', 'action': f'Привычка {i}',
+                 'estimated_time': 60, 'related_habit': self.pleasant.id}
+                for i in range(count)
+            ] + [{'id': self.habit.id, 'place': 'Стадион'}]
+        
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/v1/habits/bulk/', items(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post('/api/v1/habits/bulk/', items(50), format='json')
+        self.assertEqual(len(small), len(large))
+    
+    def test_bulk_rejects_other_users_habit(self):
+        """Тест: чужую привычку нельзя обновить пакетом"""
+        other = get_user_model().objects.create_user(
+            email='other-bulk@example.com',
+            password='testpass123'
+        )
+        foreign = Habit.objects.create(
+            user=other, place='Офис', time=time(9, 0),
+            action='Кофе', estimated_time=60
+        )
+        response = self.client.post(
+            '/api/v1/habits/bulk/', [{'id': foreign.id, 'place': 'Дома'}], format='json'
+        )
+        self.assertEqual(response.data['results'][0]['status'], 'error')
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.place, 'Офис')
+    
+    def test_bulk_requires_list(self):
+        """Тест: тело пакетного запроса должно быть списком"""
+        response = self.client.post('/api/v1/habits/bulk/', {'place': 'Дома'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_complete_batch(self):
+        """Тест пакетной отметки выполнения и обновления серий"""
+        today = timezone.now()
+        items = [
+            {'habit': self.habit.id, 'completed_at': (today - timedelta(days=1)).isoformat()},
+            {'habit': self.habit.id, 'completed_at': today.isoformat()},
+            {'habit': self.pleasant.id},
+            {'habit': 999999},
+        ]
+        response = self.client.post('/api/v1/habits/complete_batch/', items, format='json')
+        
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['completed'] * 3 + ['error'])
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit).count(), 2)
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.total_completions, 2)
+        self.assertEqual(stats.current_streak, 2)
+        self.assertTrue(HabitStats.objects.filter(habit=self.pleasant).exists())
+    
+    def test_complete_batch_rebuilds_new_stats_at_once(self):
+        """Тест: новые счетчики пересчитываются одним пакетным вызовом"""
+        HabitStats.objects.rebuild(habit_ids=[self.habit.id])
+        HabitStats.objects.filter(habit=self.habit).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        others = [
+            Habit.objects.create(
+                user=self.user, place='Дома', time=time(9, 0),
+                action=f'Привычка {i}', estimated_time=60
+            )
+            for i in range(3)
+        ]
+        items = [{'habit': habit.id} for habit in others + [self.habit]]
+        
+        with patch.object(
+            HabitStats.objects, 'rebuild', wraps=HabitStats.objects.rebuild
+        ) as mock_rebuild:
+            response = self.client.post('/api/v1/habits/complete_batch/', items, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_rebuild.assert_called_once_with(habit_ids=[habit.id for habit in others])
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual(stats.total_completions, 1)
+        self.assertGreater(stats.updated_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(
+            HabitStats.objects.filter(habit__in=others, total_completions=1).count(), 3
+        )
+
+
+class HabitValidationRulesTest(APITestCase):
+    """Тесты для общих правил валидации привычек"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='rules@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.pleasant = Habit.objects.create(
+            user=self.user, place='Дома', time=time(20, 0),
+            action='Чай', is_pleasant=True, estimated_time=60
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Парк', time=time(7, 0),
+            action='Пробежка', estimated_time=60, related_habit=self.pleasant
+        )
+    
+    def test_save_does_not_load_unchanged_related_habit(self):
+        """Тест: сохранение без смены связи не загружает связанную привычку"""
+        habit = Habit.objects.get(id=self.habit.id)
+        habit.place = 'Стадион'
+        with self.assertNumQueries(1):
+            habit.save()
+    
+    def test_rescheduling_save_with_known_timezone(self):
+        """Тест: пересчет напоминания не загружает пользователя, если пояс известен"""
+        habit = Habit.objects.get(id=self.habit.id)
+        habit.time = time(8, 0)
+        with self.assertNumQueries(1):
+            habit.save(tz='Europe/Moscow')
+        
+        habit = Habit.objects.select_related('user').get(id=self.habit.id)
+        habit.time = time(9, 0)
+        with self.assertNumQueries(1):
+            habit.save()
+    
+    def test_timezone_names_are_cached(self):
+        """Тест: список часовых поясов читается один раз"""
+        timezone_names.cache_clear()
+        with patch('habits.utils.available_timezones', return_value={'UTC'}) as mock_zones:
+            validate_timezone('UTC')
+            validate_timezone('UTC')
+            with self.assertRaises(ValidationError):
+                validate_timezone('Mars/Olympus')
+        mock_zones.assert_called_once_with()
+        timezone_names.cache_clear()
+    
+    def test_changed_related_habit_is_checked(self):
+        """Тест: новая связь проверяется по правилам"""
+        other = Habit.objects.create(
+            user=self.user, place='Офис', time=time(9, 0),
+            action='Отчет', estimated_time=60
+        )
+        habit = Habit.objects.get(id=self.habit.id)
+        habit.related_habit_id = other.id
+        with self.assertRaises(ValidationError):
+            habit.save()
+    
+    def test_partial_update_checked_against_instance(self):
+        """Тест: частичное обновление проверяется вместе с текущими полями привычки"""
+        response = self.client.patch(
+            f'/api/v1/habits/{self.habit.id}/', {'reward': 'Десерт'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('reward', response.data)
+
+
+class BenchmarkTest(TestCase):
+    """Тесты генератора данных и бенчмарков"""
+    
+    def setUp(self):
+        call_command(
+            'generate_habits_data', users=5, habits=30, logs=300, days=30,
+            stats=True, stdout=StringIO()
+        )
+    
+    def test_generator_creates_scheduled_habits(self):
+        """Тест: генератор создает данные, у полезных привычек есть расписание"""
+        self.assertEqual(get_user_model().objects.filter(email__startswith='bench').count(), 5)
+        self.assertEqual(Habit.objects.count(), 30)
+        self.assertEqual(HabitLog.objects.count(), 300)
+        self.assertFalse(Habit.objects.filter(is_pleasant=False, next_fire_at__isnull=True).exists())
+    
+    def test_query_counts_within_baseline(self):
+        """Тест: число запросов не превышает сохраненных базовых значений"""
+        results = run_benchmarks()
+        self.assertEqual(set(results), set(BENCHMARKS))
+        baseline = load_baseline(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json')
+        queries_only = {name: {'queries': value['queries']} for name, value in baseline.items()}
+        self.assertEqual(compare(results, queries_only, tolerance=1.5), [])
+    
+    def test_benchmarks_do_not_change_data(self):
+        """Тест: замеры откатываются и не меняют данные"""
+        logs = HabitLog.objects.count()
+        schedule = list(Habit.objects.order_by('id').values_list('next_fire_at', flat=True))
+        run_benchmarks(['task.send_habit_reminders', 'api.habits.complete'])
+        self.assertEqual(HabitLog.objects.count(), logs)
+        self.assertEqual(
+            list(Habit.objects.order_by('id').values_list('next_fire_at', flat=True)), schedule
+        )
+    
+    def test_compare_reports_regressions(self):
+        """Тест: превышение запросов и времени считается регрессией"""
+        baseline = {'api.habits.list': {'queries': 2, 'ms': 100.0}}
+        self.assertEqual(compare({'api.habits.list': {'queries': 2, 'ms': 140.0}}, baseline, 1.5), [])
+        regressions = compare({'api.habits.list': {'queries': 3, 'ms': 160.0}}, baseline, 1.5)
+        self.assertEqual(len(regressions), 2)
+
+
+@override_settings(METRICS_TOKEN='')
+class RequestMetricsTest(APITestCase):
+    """Тесты метрик запросов"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='metrics@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        Habit.objects.create(
+            user=self.user, place='Дома', time=time(8, 0), action='Зарядка', estimated_time=60
+        )
+    
+    def sample(self, name, view, action):
+        return REGISTRY.get_sample_value(name, {'view': view, 'action': action}) or 0
+    
+    def test_records_latency_and_queries_per_action(self):
+        """Тест: время и SQL-запросы записываются по представлению и действию"""
+        count = self.sample('http_request_duration_seconds_count', 'HabitViewSet', 'my_habits')
+        queries = self.sample('http_request_db_queries_sum', 'HabitViewSet', 'my_habits')
+        response = self.client.get('/api/v1/habits/my_habits/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.sample('http_request_duration_seconds_count', 'HabitViewSet', 'my_habits'),
+            count + 1
+        )
+        self.assertGreater(
+            self.sample('http_request_db_queries_sum', 'HabitViewSet', 'my_habits'), queries
+        )
+    
+    @override_settings(DEBUG=True)
+    def test_metrics_endpoint(self):
+        """Тест: /metrics отдает метрики в формате Prometheus"""
+        self.client.get('/api/v1/habits/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            b'http_request_db_queries_count{action="list",view="HabitViewSet"}',
+            response.content
+        )
+    
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Тест: при заданном токене метрики требуют Bearer-заголовок"""
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_metrics_closed_without_token(self):
+        """Тест: без токена метрики закрыты, если DEBUG выключен"""
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(REPLICA_DATABASE='replica', CACHES=LOCMEM_CACHE)
+class ReplicaRoutingTest(APITestCase):
+    """
+    Тесты чтения с реплики на двух локальных базах.
+    На время тестов алиас replica (в остальных тестах — зеркало default)
+    подменяется отдельной тестовой базой. Базы не реплицируются, поэтому
+    по данным видно, откуда прочитан ответ.
+    """
+    
+    databases = {'default', 'replica'}
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.saved_settings = connections.settings.get('replica')
+        cls.saved_connection = connections['replica'] if cls.saved_settings else None
+        default = connections['default'].settings_dict
+        test = {**default['TEST'], 'MIRROR': None}
+        test['NAME'] = None if default['ENGINE'].endswith('sqlite3') else f"{default['NAME']}_replica"
+        connections.settings['replica'] = {**default, 'TEST': test}
+        if cls.saved_connection is not None:
+            del connections['replica']
+        connections['replica'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+    
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].creation.destroy_test_db(
+            connections['replica'].settings_dict['NAME'], verbosity=0
+        )
+        del connections['replica']
+        if cls.saved_settings is None:
+            del connections.settings['replica']
+        else:
+            connections.settings['replica'] = cls.saved_settings
+            connections['replica'] = cls.saved_connection
+    
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='replica@example.com', password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        Habit.objects.create(
+            user=self.user, place='Дома', time=time(8, 0), action='Основная', estimated_time=60
+        )
+        # Та же строка пользователя на реплике, но другая привычка
+        get_user_model().objects.using('replica').bulk_create([
+            get_user_model()(id=self.user.id, email=self.user.email, password=self.user.password)
+        ])
+        Habit.objects.using('replica').bulk_create([Habit(
+            user_id=self.user.id, place='Дома', time=time(8, 0), action='С реплики', estimated_time=60
+        )])
+    
+    def actions(self, response):
+        return [habit['action'] for habit in response.data['results']]
+    
+    def test_list_reads_from_replica(self):
+        """Тест: списки читаются с реплики"""
+        response = self.client.get('/api/v1/habits/my_habits/')
+        self.assertEqual(self.actions(response), ['С реплики'])
+    
+    def test_write_pins_user_to_primary(self):
+        """Тест: после записи чтение пользователя идет из основной базы"""
+        response = self.client.post('/api/v1/habits/', {
+            'place': 'Парк', 'time': '09:00', 'action': 'Новая', 'estimated_time': 60
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(is_pinned_to_primary(self.user.id))
+        
+        response = self.client.get('/api/v1/habits/my_habits/')
+        self.assertEqual(sorted(self.actions(response)), ['Новая', 'Основная'])
+        
+        cache.clear()
+        response = self.client.get('/api/v1/habits/my_habits/')
+        self.assertEqual(self.actions(response), ['С реплики'])
+    
+    def test_detail_and_writes_use_primary(self):
+        """Тест: действия вне replica_actions читают и пишут в основную базу"""
+        habit = Habit.objects.get(action='Основная')
+        response = self.client.get(f'/api/v1/habits/{habit.id}/')
+        self.assertEqual(response.data['action'], 'Основная')
+        with read_from_replica():
+            self.assertEqual(Habit.objects.get().action, 'С реплики')
+            Habit.objects.filter(id=habit.id).update(action='Изменена')
+        self.assertEqual(Habit.objects.get().action, 'Изменена')
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_reporting_task_reads_from_replica(self, mock_outbox):
+        """Тест: check_habit_completion просматривает привычки на реплике"""
+        from telegram_bot.tasks import check_habit_completion
+        get_user_model().objects.using('replica').filter(id=self.user.id).update(telegram_chat_id='100')
+        entries = []
+        mock_outbox.return_value.enqueue_many.side_effect = lambda messages: len(
+            entries.extend(messages) or entries
+        )
+        check_habit_completion()
+        self.assertEqual(len(entries), 1)
+        self.assertIn('С реплики', entries[0][4])
+    
+    @override_settings(REPLICA_DATABASE='')
+    def test_disabled_replica_reads_primary(self):
+        """Тест: без реплики все читается из основной базы"""
+        response = self.client.get('/api/v1/habits/my_habits/')
+        self.assertEqual(self.actions(response), ['Основная'])
+
+
+class AnalyticsTest(APITestCase):
+    """Тесты дневных агрегатов и эндпоинта аналитики"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='analytics@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        self.other = Habit.objects.create(
+            user=self.user, place='Парк', time=time(19, 0),
+            action='Прогулка', estimated_time=120
+        )
+    
+    def log(self, habit, day, is_completed=True):
+        return HabitLog.objects.create(
+            habit=habit,
+            completed_at=timezone.make_aware(datetime.combine(day, time(12, 0))),
+            is_completed=is_completed
+        )
+    
+    def rollups(self):
+        return dict(
+            HabitDailyRollup.objects.filter(habit=self.habit).values_list('date', 'completions')
+        )
+    
+    def test_refresh_is_incremental(self):
+        """Тест: пересчет учитывает только новые логи и сдвигает отметку"""
+        self.log(self.habit, date(2026, 10, 5))
+        self.log(self.habit, date(2026, 10, 5))
+        self.log(self.habit, date(2026, 10, 6), is_completed=False)
+        HabitDailyRollup.objects.refresh()
+        self.assertEqual(self.rollups(), {date(2026, 10, 5): 2})
+        
+        state = RollupState.objects.get(name=HabitDailyRollup.objects.state_name)
+        self.assertEqual(state.last_log_id, HabitLog.objects.latest('id').id)
+        
+        # Пересчитывается только день нового лога (выполнение задним числом)
+        self.log(self.habit, date(2026, 9, 1))
+        with override_settings(ANALYTICS_ROLLUP_REWIND=0):
+            self.assertEqual(HabitDailyRollup.objects.refresh(), 1)
+        self.assertEqual(self.rollups(), {date(2026, 9, 1): 1, date(2026, 10, 5): 2})
+    
+    @override_settings(ANALYTICS_ROLLUP_CHUNK=2, ANALYTICS_ROLLUP_REWIND=0)
+    def test_refresh_processes_backlog_in_chunks(self):
+        """Тест: накопленные логи обрабатываются порциями до конца"""
+        for day in range(1, 6):
+            self.log(self.habit, date(2026, 10, day))
+        self.assertEqual(HabitDailyRollup.objects.refresh(), 5)
+        self.assertEqual(len(self.rollups()), 5)
+    
+    def test_log_deletion_recounts_day(self):
+        """Тест: удаление лога пересчитывает его день"""
+        first = self.log(self.habit, date(2026, 10, 5))
+        second = self.log(self.habit, date(2026, 10, 5))
+        HabitDailyRollup.objects.refresh()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.rollups(), {date(2026, 10, 5): 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.rollups(), {})
+    
+    def test_bulk_log_deletion_recounts_once(self):
+        """Тест: удаление нескольких логов в транзакции пересчитывается одним вызовом"""
+        for day in (5, 5, 6):
+            self.log(self.habit, date(2026, 10, day))
+        self.log(self.other, date(2026, 10, 6))
+        HabitDailyRollup.objects.refresh()
+        
+        with patch.object(
+            HabitDailyRollup.objects, 'recount', wraps=HabitDailyRollup.objects.recount
+        ) as mock_recount:
+            with self.captureOnCommitCallbacks(execute=True):
+                HabitLog.objects.filter(habit=self.habit).delete()
+        
+        mock_recount.assert_called_once()
+        (pairs,), _ = mock_recount.call_args
+        self.assertLessEqual(
+            {(self.habit.id, date(2026, 10, 5)), (self.habit.id, date(2026, 10, 6))}, pairs
+        )
+        self.assertEqual(self.rollups(), {})
+        self.assertTrue(HabitDailyRollup.objects.filter(habit=self.other).exists())
+    
+    def test_weekly_buckets_and_heatmap(self):
+        """Тест: недельные корзины с нулями и тепловая карта по дням"""
+        self.log(self.habit, date(2026, 10, 5))
+        self.log(self.other, date(2026, 10, 5))
+        self.log(self.habit, date(2026, 10, 7))
+        self.log(self.habit, date(2026, 10, 13))
+        HabitDailyRollup.objects.refresh()
+        
+        response = self.client.get(
+            '/api/v1/analytics/', {'period': 'week', 'from': '2026-09-30', 'to': '2026-10-17'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(str(bucket['start']), bucket['completions'], bucket['active_days'])
+             for bucket in response.data['buckets']],
+            [('2026-09-28', 0, 0), ('2026-10-05', 3, 2), ('2026-10-12', 1, 1)]
+        )
+        self.assertEqual(
+            [(str(cell['date']), cell['completions']) for cell in response.data['heatmap']],
+            [('2026-10-05', 2), ('2026-10-07', 1), ('2026-10-13', 1)]
+        )
+        
+        response = self.client.get(
+            '/api/v1/analytics/',
+            {'period': 'month', 'from': '2026-10-01', 'to': '2026-10-31', 'habit': self.other.id}
+        )
+        self.assertEqual(
+            [(str(bucket['start']), bucket['completions']) for bucket in response.data['buckets']],
+            [('2026-10-01', 1)]
+        )
+    
+    def test_query_count_does_not_depend_on_history(self):
+        """Тест: число запросов не зависит от длины истории"""
+        for days in range(0, 400, 3):
+            self.log(self.habit, date(2026, 10, 1) - timedelta(days=days))
+        HabitDailyRollup.objects.refresh()
+        
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/analytics/', {'period': 'month'})
+        self.assertEqual(len(response.data['buckets']), 12)
+    
+    def test_invalid_period(self):
+        """Тест: слишком длинный период и неизвестный размер корзины отклоняются"""
+        response = self.client.get('/api/v1/analytics/', {'from': '2020-01-01', 'to': '2026-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/v1/analytics/', {'period': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(ANALYTICS_ROLLUP_REWIND=0)
+class HabitLogArchiveTest(APITestCase):
+    """Тесты архива логов в битовых картах"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='archive@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        # Серия 2024-12-30 .. 2025-01-02 на стыке лет, два выполнения 31 декабря
+        self.old_days = [date(2024, 12, 30), date(2024, 12, 31), date(2025, 1, 1), date(2025, 1, 2)]
+        for day in self.old_days + [date(2024, 12, 31)]:
+            self.log(day)
+        self.log(date(2025, 1, 3))
+        HabitStats.objects.rebuild()
+        HabitDailyRollup.objects.refresh()
+    
+    def log(self, day):
+        return HabitLog.objects.create(
+            habit=self.habit,
+            completed_at=timezone.make_aware(datetime.combine(day, time(12, 0)))
+        )
+    
+    def stats(self):
+        stats = HabitStats.objects.get(habit=self.habit)
+        return stats.current_streak, stats.longest_streak, stats.total_completions, stats.completed_days
+    
+    def test_bitmap_roundtrip(self):
+        """Тест: дни года, включая 31 декабря високосного года, помещаются в 46 байт"""
+        days = [date(2024, 1, 1), date(2024, 2, 29), date(2024, 12, 31)]
+        bitmap = days_to_bitmap(2024, days)
+        self.assertEqual(len(bitmap), YEAR_BITMAP_BYTES)
+        self.assertEqual(bitmap_days(2024, bitmap), days)
+        merged = days_to_bitmap(2024, [date(2024, 6, 1)], bitmap)
+        self.assertEqual(bitmap_days(2024, merged), sorted(days + [date(2024, 6, 1)]))
+    
+    def test_archive_folds_old_logs(self):
+        """Тест: старые логи сворачиваются по годам, статистика и агрегаты не меняются"""
+        stats = self.stats()
+        rollups = HabitDailyRollup.objects.count()
+        
+        self.assertEqual(HabitLogArchive.objects.archive(date(2025, 1, 3)), 5)
+        self.assertEqual(list(HabitLog.objects.values_list('completed_at__date', flat=True)), [date(2025, 1, 3)])
+        archives = {archive.year: archive for archive in HabitLogArchive.objects.all()}
+        self.assertEqual(archives[2024].archived_days(), self.old_days[:2])
+        self.assertEqual(archives[2024].completions, 3)
+        self.assertEqual(archives[2025].archived_days(), self.old_days[2:])
+        self.assertEqual(HabitDailyRollup.objects.count(), rollups)
+        
+        # Пересчет читает и логи, и архив
+        HabitStats.objects.rebuild()
+        self.assertEqual(self.stats(), stats)
+        HabitStats.objects.get(habit=self.habit).rebuild()
+        self.assertEqual(self.stats(), stats)
+        
+        # Повторная свертка дописывает дни в существующую карту года
+        self.log(date(2025, 1, 4))
+        HabitDailyRollup.objects.refresh()
+        archived_at = archives[2025].updated_at
+        self.assertEqual(HabitLogArchive.objects.archive(date(2025, 1, 10)), 2)
+        archive = HabitLogArchive.objects.get(year=2025)
+        self.assertEqual(
+            archive.archived_days(),
+            self.old_days[2:] + [date(2025, 1, 3), date(2025, 1, 4)]
+        )
+        self.assertGreater(archive.updated_at, archived_at)
+    
+    def test_archive_waits_for_rollups(self):
+        """Тест: логи, еще не учтенные в агрегатах, не архивируются"""
+        RollupState.objects.update(last_log_id=0)
+        self.assertEqual(HabitLogArchive.objects.archive(date(2025, 1, 3)), 0)
+        self.assertFalse(HabitLogArchive.objects.exists())
+    
+    def test_logs_endpoint_returns_archived_days(self):
+        """Тест: история привычки включает дни из архива"""
+        HabitLogArchive.objects.archive(date(2025, 1, 3))
+        response = self.client.get(
+            f'/api/v1/habits/{self.habit.id}/logs/', {'from': '2024-12-31', 'to': '2025-01-31'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['archived_days'], self.old_days[1:])
+        self.assertEqual(len(response.data['results']), 1)
+        
+        # Архивные дни отдаются только с первой страницей
+        for day in range(4, 6):
+            self.log(date(2025, 1, day))
+        url = f'/api/v1/habits/{self.habit.id}/logs/'
+        response = self.client.get(url, {'page_size': 2, 'page': 2})
+        self.assertNotIn('archived_days', response.data)
+        response = self.client.get(url, {'page_size': 2, 'pagination': 'cursor'})
+        self.assertEqual(response.data['archived_days'], self.old_days)
+        response = self.client.get(response.data['next'])
+        self.assertNotIn('archived_days', response.data)
+        
+        response = self.client.get(f'/api/v1/habits/{self.habit.id}/logs/', {'export': 'ndjson'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [line['date'] for line in lines if line.get('archived')],
+            [str(day) for day in self.old_days]
+        )
+    
+    def test_restore_command(self):
+        """Тест: восстановление создает по логу на день и пересчитывает статистику"""
+        HabitLogArchive.objects.archive(date(2025, 1, 3))
+        call_command('restore_habit_logs', years=[2024], stdout=StringIO())
+        
+        self.assertEqual(
+            sorted(timezone.localdate(log.completed_at) for log in HabitLog.objects.all()),
+            self.old_days[:2] + [date(2025, 1, 3)]
+        )
+        self.assertEqual(list(HabitLogArchive.objects.values_list('year', flat=True)), [2025])
+        # Два выполнения 31 декабря восстанавливаются одним логом
+        self.assertEqual(self.stats(), (5, 5, 5, 5))
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import HabitViewSet, UserViewSet, CustomTokenObtainPairView
+from .views import AnalyticsViewSet, HabitViewSet, UserViewSet, CustomTokenObtainPairView
 
 router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habit')
 router.register(r'users', UserViewSet, basename='user')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
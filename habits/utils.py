@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from itertools import islice
+from zoneinfo import ZoneInfo, available_timezones
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+
+def day_bounds(day):
+    """Границы суток [начало, конец) в текущем часовом поясе"""
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+# Битовая карта дней года: бит на день, 366 бит (високосный год) — 46 байт
+YEAR_BITMAP_BYTES = 46
+
+
+def days_to_bitmap(year, days, bitmap=None):
+    """Отметить дни года в битовой карте (по умолчанию — в пустой)"""
+    bits = bytearray(bitmap or bytes(YEAR_BITMAP_BYTES))
+    start = date(year, 1, 1).toordinal()
+    for day in days:
+        index = day.toordinal() - start
+        bits[index // 8] |= 1 << (index % 8)
+    return bytes(bits)
+
+
+def bitmap_days(year, bitmap):
+    """Отсортированный список дней, отмеченных в битовой карте года"""
+    start = date(year, 1, 1).toordinal()
+    return [
+        date.fromordinal(start + position * 8 + bit)
+        for position, byte in enumerate(bytes(bitmap)) if byte
+        for bit in range(8) if byte >> bit & 1
+    ]
+
+
+def batched(iterable, size):
+    """Разбить итерируемое на списки длиной не больше size"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@lru_cache(maxsize=1)
+def timezone_names():
+    """Имена часовых поясов IANA (available_timezones читает базу поясов с диска)"""
+    return frozenset(available_timezones())
+
+
+def validate_timezone(value):
+    """Проверка имени часового пояса IANA"""
+    if value not in timezone_names():
+        raise ValidationError(f'Неизвестный часовой пояс: {value}')
+
+
+def next_fire_time(habit_time, periodicity, tz, after, previous=None):
+    """
+    Ближайшее время напоминания строго после after (в UTC).
+
+    habit_time — локальное время привычки в часовом поясе tz. Без previous
+    берется ближайший день с этим временем; с previous (прошлое срабатывание)
+    следующее считается через periodicity дней, пропущенные периоды
+    пропускаются с сохранением шага.
+    """
+    zone = ZoneInfo(tz) if isinstance(tz, str) else tz
+    if previous is not None:
+        step = timedelta(days=periodicity or 1)
+        day = previous.astimezone(zone).date() + step
+    else:
+        step = timedelta(days=1)
+        day = after.astimezone(zone).date()
+    fire = datetime.combine(day, habit_time, tzinfo=zone)
+    while fire <= after:
+        day += step
+        fire = datetime.combine(day, habit_time, tzinfo=zone)
+    return fire.astimezone(dt_timezone.utc)
+
+
+def latest_fire_time(habit_time, periodicity, tz, fire, now):
+    """
+    Последнее наступившее срабатывание в ряду, начатом с fire.
+    Если напоминания пропускались несколько периодов подряд, возвращает
+    срабатывание текущего периода, а не самое старое.
+    """
+    while True:
+        following = next_fire_time(habit_time, periodicity, tz, fire, previous=fire)
+        if following > now:
+            return fire
+        fire = following
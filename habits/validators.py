@@ -0,0 +1,125 @@
+"""
+Правила валидации привычек.
+
+Один набор правил используется моделью (Habit.clean), сериализаторами
+и пакетными операциями. Правило получает значения полей привычки
+и возвращает ошибки по полям. Связанная привычка передается уже
+найденной, поэтому пакетная проверка (habits.bulk) обходится одним
+запросом за всеми связанными привычками, а не запросом на каждую строку.
+
+Значения для правил:
+    has_related_habit — указана ли связанная привычка
+    related_is_pleasant — приятна ли связанная привычка
+        (None, если связь не менялась и уже была проверена)
+    reward, estimated_time, is_pleasant, periodicity — поля привычки
+"""
+BOTH_REWARDS_MESSAGE = 'Нельзя одновременно указывать связанную привычку и вознаграждение'
+
+# Поля привычки, от которых зависят правила
+RULE_FIELDS = ('reward', 'estimated_time', 'is_pleasant', 'periodicity')
+
+
+def reward_or_related_habit(values):
+    """Исключить одновременный выбор связанной привычки и указания вознаграждения"""
+    if values['has_related_habit'] and values['reward']:
+        return {'related_habit': BOTH_REWARDS_MESSAGE, 'reward': BOTH_REWARDS_MESSAGE}
+    return {}
+
+
+def estimated_time_limit(values):
+    """Время выполнения должно быть не больше 120 секунд"""
+    if values['estimated_time'] and values['estimated_time'] > 120:
+        return {'estimated_time': 'Время выполнения должно быть не больше 120 секунд'}
+    return {}
+
+
+def related_habit_is_pleasant(values):
+    """В связанные привычки могут попадать только привычки с признаком приятной привычки"""
+    if values['has_related_habit'] and values['related_is_pleasant'] is False:
+        return {'related_habit': 'В связанные привычки могут попадать только приятные привычки'}
+    return {}
+
+
+def pleasant_habit_has_no_reward(values):
+    """У приятной привычки не может быть вознаграждения или связанной привычки"""
+    errors = {}
+    if values['is_pleasant']:
+        if values['reward']:
+            errors['reward'] = 'У приятной привычки не может быть вознаграждения'
+        if values['has_related_habit']:
+            errors['related_habit'] = 'У приятной привычки не может быть связанной привычки'
+    return errors
+
+
+def periodicity_limit(values):
+    """Нельзя выполнять привычку реже, чем 1 раз в 7 дней"""
+    if values['periodicity'] and values['periodicity'] > 7:
+        return {'periodicity': 'Нельзя выполнять привычку реже, чем 1 раз в 7 дней'}
+    return {}
+
+
+# Порядок важен: при совпадении поля сохраняется сообщение последнего правила
+HABIT_RULES = (
+    reward_or_related_habit,
+    estimated_time_limit,
+    related_habit_is_pleasant,
+    pleasant_habit_has_no_reward,
+    periodicity_limit,
+)
+
+
+def check_habit(values):
+    """Применить все правила и вернуть ошибки по полям"""
+    errors = {}
+    for rule in HABIT_RULES:
+        errors.update(rule(values))
+    return errors
+
+
+def _related_values(related_habit):
+    return {
+        'has_related_habit': related_habit is not None,
+        'related_is_pleasant': related_habit.is_pleasant if related_habit is not None else None,
+    }
+
+
+def values_from_instance(habit, related_habits=None):
+    """
+    Значения правил для экземпляра привычки.
+
+    Связанная привычка берется из кэша экземпляра или из словаря
+    related_habits (id -> Habit). Если связь не изменилась с момента
+    загрузки из базы, она уже была проверена и не загружается повторно.
+    """
+    values = {field: getattr(habit, field) for field in RULE_FIELDS}
+    related_id = habit.related_habit_id
+    descriptor = type(habit).related_habit
+
+    if related_id is None:
+        values.update(_related_values(None))
+    elif descriptor.is_cached(habit):
+        values.update(_related_values(habit.related_habit))
+    elif related_habits is not None and related_id in related_habits:
+        habit.related_habit = related_habits[related_id]
+        values.update(_related_values(habit.related_habit))
+    elif related_id == getattr(habit, '_loaded_related_habit_id', None):
+        values.update({'has_related_habit': True, 'related_is_pleasant': None})
+    else:
+        values.update(_related_values(habit.related_habit))
+    return values
+
+
+def values_from_data(data, instance=None, model=None):
+    """
+    Значения правил для входных данных сериализатора.
+    Отсутствующие поля берутся из instance, а при создании — из умолчаний модели.
+    """
+    if instance is not None:
+        values = values_from_instance(instance)
+    else:
+        values = {field: model._meta.get_field(field).get_default() for field in RULE_FIELDS}
+        values.update(_related_values(None))
+    values.update({field: data[field] for field in RULE_FIELDS if field in data})
+    if 'related_habit' in data:
+        values.update(_related_values(data['related_habit']))
+    return values
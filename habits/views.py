@@ -1,3 +1,9 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -5,14 +11,26 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from .models import User, Habit, HabitLog
+from .models import User, Habit, HabitLog, HabitStats
 from .serializers import (
+    AnalyticsQuerySerializer,
     HabitSerializer,
     HabitCreateSerializer,
-    HabitLogSerializer,
+    HabitLogFlatSerializer,
+    HabitLogPeriodSerializer,
+    HabitStatsSerializer,
     UserSerializer
 )
+from . import cache as public_feed_cache
+from .analytics import build_analytics
+from .bulk import BULK_MAX_ITEMS, bulk_complete, bulk_save_habits
 from .permissions import IsOwnerOrReadOnly
+from .pagination import HabitCursorPagination, HabitLogCursorPagination, KeysetPagination
+from .utils import day_bounds
+from habits_tracker.db_router import ReplicaReadMixin
+
+# Размер порции серверного курсора при выгрузке логов в NDJSON
+EXPORT_CHUNK_SIZE = 2000
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -62,7 +80,7 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Представление для привычек"""
     
     serializer_class = HabitSerializer
@@ -70,13 +88,36 @@ class HabitViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['is_pleasant', 'is_public']
     ordering_fields = ['created_at', 'time']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    
+    # Действия, поддерживающие курсорную пагинацию (?pagination=cursor)
+    cursor_pagination_classes = {
+        'my_habits': HabitCursorPagination,
+        'public_habits': HabitCursorPagination,
+        'logs': HabitLogCursorPagination,
+    }
+    
+    # Списки читаются с реплики (кроме недавно писавших пользователей)
+    replica_actions = ('list', 'my_habits', 'public_habits', 'logs')
+
+    @property
+    def paginator(self):
+        """Пагинатор действия: курсорный по запросу клиента, иначе постраничный"""
+        if not hasattr(self, '_paginator'):
+            cursor_class = self.cursor_pagination_classes.get(self.action)
+            if cursor_class and self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = cursor_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         """Получение queryset в зависимости от действия"""
         if self.action == 'public_habits':
-            return Habit.objects.filter(is_public=True)
-        return Habit.objects.filter(user=self.request.user)
+            return Habit.objects.filter(is_public=True).select_related('user', 'related_habit')
+        return Habit.objects.filter(user=self.request.user).select_related('user', 'related_habit')
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
@@ -102,27 +143,155 @@ class HabitViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def public_habits(self, request):
-        """Получение публичных привычек"""
-        habits = Habit.objects.filter(is_public=True)
+        """Получение публичных привычек (страницы кэшируются в Redis)"""
+        cached, cache_key = public_feed_cache.get_page(request)
+        if cached is not None:
+            return Response(cached)
+        
+        habits = self.get_queryset()
         page = self.paginate_queryset(habits)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(habits, many=True)
-        return Response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(habits, many=True)
+            response = Response(serializer.data)
+        public_feed_cache.set_page(cache_key, response.data)
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def public_habits_cache(self, request):
+        """Счетчики попаданий и промахов кэша публичной ленты"""
+        return Response(public_feed_cache.get_stats())
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def complete(self, request, pk=None):
         """Отметить привычку как выполненную"""
         habit = self.get_object()
-        HabitLog.objects.create(habit=habit, is_completed=True)
+        with transaction.atomic():
+            log = HabitLog.objects.create(habit=habit, is_completed=True)
+            HabitStats.objects.record(habit, timezone.localdate(log.completed_at))
         return Response({'message': 'Привычка отмечена как выполненная'})
 
+    def _bulk_items(self, request):
+        """Проверить, что тело запроса — список допустимого размера"""
+        items = request.data
+        if not isinstance(items, list):
+            return None, Response(
+                {'error': 'Ожидается список элементов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > BULK_MAX_ITEMS:
+            return None, Response(
+                {'error': f'Не больше {BULK_MAX_ITEMS} элементов в одном запросе'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return items, None
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request):
+        """Пакетное создание и обновление привычек (элементы с id обновляются)"""
+        items, error = self._bulk_items(request)
+        if error:
+            return error
+        return Response({'results': bulk_save_habits(request.user, items)})
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def complete_batch(self, request):
+        """Пакетная отметка выполнения привычек"""
+        items, error = self._bulk_items(request)
+        if error:
+            return error
+        return Response({'results': bulk_complete(request.user, items)})
+
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def logs(self, request, pk=None):
-        """Получить логи выполнения привычки"""
+        """
+        Получить логи выполнения привычки.
+        Поддерживает фильтры from/to (даты включительно), пагинацию и полную
+        выгрузку в NDJSON (?export=ndjson). Дни выполнения из архива
+        возвращаются в archived_days только на первой странице.
+        """
         habit = self.get_object()
+        period = HabitLogPeriodSerializer(data=request.query_params)
+        period.is_valid(raise_exception=True)
+        start, end = period.validated_data.get('from'), period.validated_data.get('to')
+        
         logs = habit.logs.all()
-        serializer = HabitLogSerializer(logs, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        if start:
+            logs = logs.filter(completed_at__gte=day_bounds(start)[0])
+        if end:
+            logs = logs.filter(completed_at__lt=day_bounds(end)[1])
+        
+        if request.query_params.get('export') == 'ndjson':
+            return self._export_logs(habit, logs, self._archived_days(habit, start, end))
+        
+        page = self.paginate_queryset(logs)
+        serializer = HabitLogFlatSerializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['habit'] = HabitSerializer(habit).data
+        # Архив не разбит на страницы, поэтому отдается один раз — с первой страницей
+        if self._is_first_page():
+            response.data['archived_days'] = self._archived_days(habit, start, end)
+        return response
+
+    def _archived_days(self, habit, start, end):
+        """Дни выполнения из архива за период (старые выполнения без отдельных логов)"""
+        archives = habit.log_archives.order_by('year')
+        if start:
+            archives = archives.filter(year__gte=start.year)
+        if end:
+            archives = archives.filter(year__lte=end.year)
+        return [day for archive in archives for day in archive.archived_days(start, end)]
+
+    def _is_first_page(self):
+        if isinstance(self.paginator, KeysetPagination):
+            return self.paginator.cursor is None
+        return self.paginator.page.number == 1
+
+    def _export_logs(self, habit, logs, archived_days=()):
+        """
+        Потоковая выгрузка логов: первая строка — привычка, далее по логу
+        на строку, затем по строке на день из архива (без id и времени)
+        """
+        header = json.dumps({'habit': HabitSerializer(habit).data}, cls=DjangoJSONEncoder)
+        
+        def lines():
+            yield header + '\n'
+            rows = logs.values('id', 'completed_at', 'is_completed')
+            for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+            for day in archived_days:
+                yield json.dumps({'date': day, 'archived': True}, cls=DjangoJSONEncoder) + '\n'
+        
+        response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="habit-{habit.id}-logs.ndjson"'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def stats(self, request, pk=None):
+        """Получить статистику выполнения привычки"""
+        habit = self.get_object()
+        stats = HabitStats.objects.filter(habit=habit).first() or HabitStats()
+        stats.habit = habit
+        serializer = HabitStatsSerializer(stats)
+        return Response(serializer.data)
+
+
+class AnalyticsViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    Аналитика выполнения привычек пользователя по дневным агрегатам:
+    корзины по дням, неделям или месяцам и тепловая карта по дням.
+    Данные обновляются задачей refresh_habit_rollups (updated_at в ответе).
+    """
+    
+    permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ('list',)
+    
+    def list(self, request):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        return Response(build_analytics(
+            request.user, data['period'], data['from'], data['to'], data.get('habit')
+        ))
@@ -2,6 +2,8 @@
 ASGI config for habits_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to TELEGRAM_WEBHOOK_PATH are handled by the Telegram webhook
+(telegram_bot.webhook), everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habits_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django: модулю нужны загруженные приложения
+from telegram_bot.webhook import WebhookApplication  # noqa: E402
+
+application = WebhookApplication(django_application)
@@ -8,6 +8,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habits_tracker.settings')
 # Создаем экземпляр Celery
 app = Celery('habits_tracker')
 
+# Телеметрия задач: сигналы Celery подключаются при импорте
+from . import telemetry  # noqa: E402,F401
+
 # Настройка Celery из настроек Django
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
@@ -15,11 +18,8 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 # Настройка расписания для периодических задач
+# Напоминания о привычках отправляет отдельный процесс run_scheduler.py
 app.conf.beat_schedule = {
-    'send-habit-reminders': {
-        'task': 'telegram_bot.tasks.send_habit_reminders',
-        'schedule': 60.0,  # Каждую минуту
-    },
     'check-habit-completion': {
         'task': 'telegram_bot.tasks.check_habit_completion',
         'schedule': 3600.0,  # Каждый час
@@ -28,6 +28,14 @@ app.conf.beat_schedule = {
         'task': 'telegram_bot.tasks.send_daily_summary',
         'schedule': 86400.0,  # Каждый день в полночь
     },
+    'refresh-habit-rollups': {
+        'task': 'telegram_bot.tasks.refresh_habit_rollups',
+        'schedule': 300.0,  # Каждые 5 минут
+    },
+    'archive-habit-logs': {
+        'task': 'telegram_bot.tasks.archive_habit_logs',
+        'schedule': 86400.0,  # Каждый день
+    },
 }
 
 app.conf.timezone = 'Europe/Moscow'
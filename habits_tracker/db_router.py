@@ -0,0 +1,109 @@
+"""
+Чтение с реплики базы данных.
+
+По умолчанию все запросы идут в default. Чтение переключается на реплику
+(алиас REPLICA_DATABASE) только явно: в читающих действиях ViewSet
+(ReplicaReadMixin) и в отчетных задачах (read_from_replica). Запись
+всегда идет в default.
+
+Реплика отстает от основной базы, поэтому после записи пользователь
+на REPLICA_STICKY_SECONDS секунд закрепляется за default (read-your-writes):
+метка хранится в общем кэше и видна всем процессам веб-сервера.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from redis import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Как rest_framework.permissions.SAFE_METHODS: модуль импортируют и воркеры
+# Celery, которым DRF не нужен
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_alias():
+    """Алиас реплики или None, если реплика не настроена"""
+    alias = settings.REPLICA_DATABASE
+    return alias if alias and alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Направить чтение внутри блока на реплику (если она настроена)"""
+    token = _read_alias.set(replica_alias() if enabled else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def sticky_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Закрепить чтение пользователя за default после записи"""
+    try:
+        cache.set(sticky_key(user_id), 1, timeout=settings.REPLICA_STICKY_SECONDS)
+    except RedisError as e:
+        logger.error(f"Error pinning user {user_id} to primary database: {e}")
+
+
+def is_pinned_to_primary(user_id):
+    """Писал ли пользователь недавно; при недоступности кэша — да"""
+    try:
+        return cache.get(sticky_key(user_id)) is not None
+    except RedisError as e:
+        logger.error(f"Error reading primary pin for user {user_id}: {e}")
+        return True
+
+
+class ReplicaRouter:
+    """Роутер: чтение — из алиаса текущего контекста, запись — в default"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Чтение с реплики для действий из replica_actions.
+    Вызывается после аутентификации (initial), поэтому учитывает
+    закрепление пользователя за default после недавней записи.
+    Ответы, отдаваемые потоком после выхода из представления
+    (выгрузка NDJSON), читаются из default.
+    """
+
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user_id = request.user.pk
+        if request.method not in SAFE_METHODS:
+            self._writer_id = user_id
+        elif self.action in self.replica_actions and replica_alias():
+            if not (user_id and is_pinned_to_primary(user_id)):
+                self._read_alias_token = _read_alias.set(replica_alias())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._read_alias_token = None
+        if getattr(self, '_writer_id', None):
+            pin_to_primary(self._writer_id)
+        return super().finalize_response(request, response, *args, **kwargs)
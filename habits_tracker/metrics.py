@@ -0,0 +1,164 @@
+"""
+Метрики в формате Prometheus.
+
+Метрики накапливаются в памяти процесса и отдаются эндпоинтом /metrics.
+Если веб-сервер или воркеры запущены несколькими процессами, задайте
+PROMETHEUS_MULTIPROC_DIR (общий пустой каталог, очищаемый при старте):
+тогда каждый процесс пишет метрики в свои файлы, а /metrics собирает их
+вместе.
+"""
+import hmac
+import os
+import time as time_module
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+    start_http_server
+)
+from prometheus_client import multiprocess
+
+# Границы гистограмм: время в секундах и число запросов к базе
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+# Задачи и доставка: от долей секунды до десятков минут
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total',
+    'HTTP-запросы по представлению, действию и статусу ответа',
+    ['view', 'action', 'status']
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ['view', 'action'],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Число SQL-запросов за HTTP-запрос',
+    ['view', 'action'],
+    buckets=QUERY_COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds',
+    'Суммарное время SQL-запросов за HTTP-запрос',
+    ['view', 'action'],
+    buckets=LATENCY_BUCKETS
+)
+
+CELERY_TASK_RUNS = Counter(
+    'celery_task_runs_total',
+    'Выполнения задач Celery по итоговому состоянию',
+    ['task', 'state']
+)
+CELERY_TASK_DURATION = Histogram(
+    'celery_task_duration_seconds',
+    'Время выполнения задачи Celery',
+    ['task'],
+    buckets=TASK_BUCKETS
+)
+CELERY_TASK_LAG = Histogram(
+    'celery_task_lag_seconds',
+    'Задержка старта задачи: фактический старт минус плановый (eta или постановка в очередь)',
+    ['task'],
+    buckets=TASK_BUCKETS
+)
+CELERY_TASK_ERRORS = Counter(
+    'celery_task_handled_errors_total',
+    'Ошибки, перехваченные в теле задачи без ее падения',
+    ['task']
+)
+TASK_ROWS_SCANNED = Counter(
+    'task_rows_scanned_total',
+    'Строк, прочитанных задачей из базы',
+    ['task']
+)
+TASK_MESSAGES_ENQUEUED = Counter(
+    'task_messages_enqueued_total',
+    'Сообщений, поставленных задачей в outbox',
+    ['task']
+)
+REMINDERS_DROPPED = Counter(
+    'reminders_dropped_total',
+    'Напоминания, опоздавшие больше REMINDER_MAX_LATENESS и не отправленные'
+)
+REMINDER_TICK_LAG = Histogram(
+    'reminder_tick_lag_seconds',
+    'Задержка старта шарда напоминаний относительно минуты тика',
+    buckets=TASK_BUCKETS
+)
+OUTBOX_MESSAGES_SENT = Counter(
+    'outbox_messages_sent_total',
+    'Доставленные сообщения',
+    ['kind']
+)
+OUTBOX_MESSAGES_FAILED = Counter(
+    'outbox_messages_failed_total',
+    'Недоставленные сообщения',
+    ['kind']
+)
+OUTBOX_SEND_LATENCY = Histogram(
+    'outbox_send_latency_seconds',
+    'Время от постановки сообщения в outbox до доставки',
+    ['kind'],
+    buckets=TASK_BUCKETS
+)
+TELEGRAM_REQUEST_DURATION = Histogram(
+    'telegram_send_duration_seconds',
+    'Время запроса sendMessage к Bot API',
+    buckets=LATENCY_BUCKETS
+)
+
+
+def record_task_run(task, scanned=0, enqueued=0):
+    """Итоги прохода задачи: прочитанные строки и поставленные сообщения"""
+    TASK_ROWS_SCANNED.labels(task).inc(scanned or 0)
+    TASK_MESSAGES_ENQUEUED.labels(task).inc(enqueued or 0)
+
+
+def observe_lag(histogram, planned, labels=()):
+    """Записать задержку относительно планового времени (unix-время)"""
+    if planned is None:
+        return
+    lag = max(0.0, time_module.time() - planned)
+    (histogram.labels(*labels) if labels else histogram).observe(lag)
+
+
+def get_registry():
+    """Реестр для выгрузки: в многопроцессном режиме — сборщик по файлам процессов"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus по Bearer-токену METRICS_TOKEN.
+    Без токена эндпоинт открыт только при DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(header, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def start_metrics_server(port=None):
+    """
+    Отдавать метрики процесса без Django-сервера (воркеры Celery, outbox).
+    Порт — METRICS_PORT; 0 отключает сервер (метрики собирает веб-процесс
+    через общий PROMETHEUS_MULTIPROC_DIR). Воркеру prefork общий каталог
+    нужен и с METRICS_PORT (habits_tracker.telemetry).
+    """
+    port = settings.METRICS_PORT if port is None else port
+    if port:
+        start_http_server(port, registry=get_registry())
+    return port
@@ -0,0 +1,74 @@
+import time as time_module
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import (
+    HTTP_REQUEST_DB_DURATION,
+    HTTP_REQUEST_DB_QUERIES,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+)
+
+
+class QueryStats:
+    """
+    Обертка выполнения SQL (connection.execute_wrapper): считает запросы
+    и их время. В отличие от connection.queries работает без DEBUG=True
+    и не хранит текст запросов.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time_module.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time_module.perf_counter() - started
+            self.count += 1
+
+
+def view_labels(request):
+    """
+    Метки представления и действия. Для ViewSet действие берется из
+    маршрута (list, retrieve, my_habits...), иначе — HTTP-метод.
+    Нераспознанные адреса собираются под одной меткой, чтобы не плодить серии.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', request.method
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    view = view_class.__name__ if view_class else match.view_name or func.__name__
+    actions = getattr(func, 'actions', None) or {}
+    return view, actions.get(request.method.lower(), request.method)
+
+
+class RequestMetricsMiddleware:
+    """
+    Время ответа, число и время SQL-запросов по представлению и действию.
+    У потоковых ответов (выгрузка NDJSON) учитывается только время до
+    начала отдачи тела.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time_module.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        duration = time_module.perf_counter() - started
+
+        view, action = view_labels(request)
+        HTTP_REQUESTS.labels(view, action, response.status_code).inc()
+        HTTP_REQUEST_DURATION.labels(view, action).observe(duration)
+        HTTP_REQUEST_DB_QUERIES.labels(view, action).observe(stats.count)
+        HTTP_REQUEST_DB_DURATION.labels(view, action).observe(stats.duration)
+        return response
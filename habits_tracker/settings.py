@@ -57,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'habits_tracker.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -101,6 +102,24 @@ DATABASES = {
     }
 }
 
+# Реплика для чтения: списки API и отчетные задачи (habits_tracker.db_router).
+# В тестах реплика зеркалит default (MIRROR): данные записи сразу видны
+# при чтении, как у реплики без отставания
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['habits_tracker.db_router.ReplicaRouter']
+
+# Алиас реплики ('' — читать только из default) и время, на которое
+# пользователь после записи закрепляется за default (read-your-writes)
+REPLICA_DATABASE = os.getenv('REPLICA_DATABASE', 'replica' if 'replica' in DATABASES else '')
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -156,7 +175,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'habits.pagination.HabitPageNumberPagination',
     'PAGE_SIZE': 5,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -184,6 +203,27 @@ SPECTACULAR_SETTINGS = {
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+# Режим webhook: обновления принимает ASGI-приложение по TELEGRAM_WEBHOOK_PATH
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook/')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Кэш процесса chat_id -> пользователь для команд бота (размер и время жизни в секундах)
+TELEGRAM_CHAT_CACHE_SIZE = int(os.getenv('TELEGRAM_CHAT_CACHE_SIZE', '10000'))
+TELEGRAM_CHAT_CACHE_TTL = int(os.getenv('TELEGRAM_CHAT_CACHE_TTL', '300'))
+
+# Кнопка «Выполнено» в напоминаниях: сколько дней после напоминания кнопка
+# действительна (столько же хранится метка от повторных нажатий)
+TELEGRAM_CALLBACK_MAX_AGE_DAYS = int(os.getenv('TELEGRAM_CALLBACK_MAX_AGE_DAYS', '1'))
+
+# Доставка сообщений: лимиты Telegram (сообщений в секунду) и параллелизм
+TELEGRAM_GLOBAL_RATE_LIMIT = float(os.getenv('TELEGRAM_GLOBAL_RATE_LIMIT', '30'))
+TELEGRAM_CHAT_RATE_LIMIT = float(os.getenv('TELEGRAM_CHAT_RATE_LIMIT', '1'))
+TELEGRAM_DELIVERY_CONCURRENCY = int(os.getenv('TELEGRAM_DELIVERY_CONCURRENCY', '50'))
+TELEGRAM_DELIVERY_MAX_RETRIES = int(os.getenv('TELEGRAM_DELIVERY_MAX_RETRIES', '3'))
+TELEGRAM_DELIVERY_BATCH_SIZE = int(os.getenv('TELEGRAM_DELIVERY_BATCH_SIZE', '500'))
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
@@ -192,9 +232,58 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Бюджет суммарного времени импорта при старте воркера/бота (мс),
+# проверяется командой import_profile
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '1500'))
+
+# Число шардов (по user_id), на которые делится тик напоминаний
+REMINDER_SHARDS = int(os.getenv('REMINDER_SHARDS', '4'))
+
+# Период полной перезагрузки колеса планировщика из базы (секунды, 0 — не перезагружать)
+REMINDER_WHEEL_RELOAD_SECONDS = int(os.getenv('REMINDER_WHEEL_RELOAD_SECONDS', '600'))
+
+# Максимальное опоздание напоминания (минуты): пропущенные тики догоняются
+# в пределах этого окна, более старые напоминания отбрасываются
+REMINDER_MAX_LATENESS = int(os.getenv('REMINDER_MAX_LATENESS', '60'))
+
+# Дневные агрегаты для аналитики: размер порции пересчета и число
+# перечитываемых последних id логов
+ANALYTICS_ROLLUP_CHUNK = int(os.getenv('ANALYTICS_ROLLUP_CHUNK', '100000'))
+ANALYTICS_ROLLUP_REWIND = int(os.getenv('ANALYTICS_ROLLUP_REWIND', '1000'))
+# Максимальная длина периода в запросе /analytics/ (дни)
+ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', '731'))
+# Выполнения старше этого числа дней сворачиваются в архив (0 — не архивировать)
+HABITLOG_ARCHIVE_AFTER_DAYS = int(os.getenv('HABITLOG_ARCHIVE_AFTER_DAYS', '730'))
+
 # Redis settings
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
+# Кэш (Redis): публичная лента привычек
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', REDIS_URL),
+    }
+}
+PUBLIC_HABITS_CACHE_TIMEOUT = int(os.getenv('PUBLIC_HABITS_CACHE_TIMEOUT', '300'))
+
+# Outbox: очередь исходящих сообщений в Redis
+OUTBOX_REDIS_URL = os.getenv('OUTBOX_REDIS_URL', REDIS_URL)
+OUTBOX_STREAM = 'outbox:messages'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '1000'))
+OUTBOX_LEDGER_TTL = int(os.getenv('OUTBOX_LEDGER_TTL', str(3 * 24 * 3600)))
+OUTBOX_BLOCK_MS = 5000
+OUTBOX_CLAIM_IDLE_MS = 60000
+# Попыток доставки до переноса сообщения в поток недоставленных
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_DEAD_LETTER_STREAM = 'outbox:dead'
+
+# Метрики Prometheus (/metrics): эндпоинт требует заголовок
+# Authorization: Bearer <токен>; без токена он открыт только при DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Порт HTTP-сервера метрик для воркеров Celery и outbox (0 — не запускать)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
 # JWT settings
 from datetime import timedelta
 
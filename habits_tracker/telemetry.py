@@ -0,0 +1,91 @@
+"""
+Телеметрия задач Celery через сигналы.
+
+При публикации задачи в заголовки добавляется время постановки в очередь,
+поэтому на воркере видна задержка старта: фактический старт минус eta
+(для отложенных задач) или время постановки. Время выполнения и итоговое
+состояние записываются по task_prerun/task_postrun. Метрики попадают
+в общий реестр habits_tracker.metrics и отдаются тем же /metrics.
+
+В пуле prefork задачи выполняются в дочерних процессах, а сервер метрик
+(METRICS_PORT) — в родительском, поэтому он видит метрики задач только
+через общий PROMETHEUS_MULTIPROC_DIR. Без него воркер не запускается.
+"""
+import logging
+import os
+import time as time_module
+from datetime import datetime
+
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, worker_process_shutdown, worker_ready
+)
+
+from django.conf import settings
+
+from .metrics import (
+    CELERY_TASK_DURATION, CELERY_TASK_LAG, CELERY_TASK_RUNS, observe_lag, start_metrics_server
+)
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_AT_HEADER = 'published_at'
+
+# Время старта выполняющихся задач процесса по task_id
+_started = {}
+
+
+def planned_start(request):
+    """Плановый старт задачи (unix-время): eta или время постановки в очередь"""
+    eta = getattr(request, 'eta', None)
+    if eta:
+        return datetime.fromisoformat(eta).timestamp() if isinstance(eta, str) else eta.timestamp()
+    return getattr(request, PUBLISHED_AT_HEADER, None)
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time_module.time())
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = time_module.perf_counter()
+    if task is not None and not task.request.called_directly:
+        observe_lag(CELERY_TASK_LAG, planned_start(task.request), labels=(task.name,))
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if task is None:
+        return
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name).observe(time_module.perf_counter() - started)
+    CELERY_TASK_RUNS.labels(task.name, (state or 'UNKNOWN').lower()).inc()
+
+
+@worker_ready.connect
+def serve_worker_metrics(sender=None, **kwargs):
+    from celery.concurrency.prefork import TaskPool as PreforkPool
+    from celery.exceptions import WorkerShutdown
+
+    if (settings.METRICS_PORT and isinstance(getattr(sender, 'pool', None), PreforkPool)
+            and not os.environ.get('PROMETHEUS_MULTIPROC_DIR')):
+        message = (
+            'METRICS_PORT with the prefork pool requires PROMETHEUS_MULTIPROC_DIR: '
+            'task metrics are recorded in child processes'
+        )
+        logger.critical(message)
+        # Исключения обработчиков сигналов Celery только логирует, а WorkerShutdown
+        # (SystemExit) останавливает воркер
+        raise WorkerShutdown(message)
+    start_metrics_server()
+
+
+@worker_process_shutdown.connect
+def mark_process_dead(pid=None, **kwargs):
+    # Файлы метрик завершившегося дочернего процесса больше не обновляются
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,22 @@
+"""
+Скрипт для запуска обработчика очереди исходящих сообщений
+"""
+import os
+import sys
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Устанавливаем переменную окружения для Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habits_tracker.settings')
+
+# Импортируем Django
+import django
+django.setup()
+
+from habits_tracker.metrics import start_metrics_server
+from telegram_bot.outbox import OutboxWorker
+
+if __name__ == '__main__':
+    start_metrics_server()
+    OutboxWorker().run()
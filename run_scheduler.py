@@ -0,0 +1,20 @@
+"""
+Скрипт для запуска планировщика напоминаний
+"""
+import os
+import sys
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Устанавливаем переменную окружения для Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habits_tracker.settings')
+
+# Импортируем Django
+import django
+django.setup()
+
+from telegram_bot.scheduler import ReminderScheduler
+
+if __name__ == '__main__':
+    ReminderScheduler().run()
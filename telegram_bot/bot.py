@@ -1,8 +1,19 @@
 import os
 import logging
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from habits.models import Habit, HabitLog
+from .callbacks import (
+    DONE_PREFIX, claim_tap, is_expired, parse_done_callback, release_tap, tap_completed_at
+)
+from .chat_cache import get_user_id
+from .tasks import record_habit_completion
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,9 +45,144 @@ class TelegramBot:
 /start - Начать работу с ботом
 /help - Показать это сообщение
 /habits - Показать ваши привычки
+/today - Привычки на сегодня и их выполнение
+/stats - Серии выполнения привычек
         """
         await update.message.reply_text(help_text)
     
+    async def _user_id_or_reply(self, update: Update):
+        """ID пользователя чата; если чат не привязан, отвечает подсказкой"""
+        user_id = await get_user_id(update.effective_chat.id)
+        if user_id is None:
+            await update.message.reply_text(
+                'Этот чат не привязан к аккаунту. Укажите Telegram Chat ID '
+                f'{update.effective_chat.id} в профиле.'
+            )
+        return user_id
+    
+    async def habits_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /habits"""
+        user_id = await self._user_id_or_reply(update)
+        if user_id is None:
+            return
+        habits = [
+            habit async for habit in Habit.objects
+            .filter(user_id=user_id)
+            .order_by('time', 'id')
+            .values('action', 'place', 'time', 'is_pleasant')
+        ]
+        if not habits:
+            await update.message.reply_text('У вас пока нет привычек.')
+            return
+        lines = [
+            f"{habit['time']:%H:%M} {habit['action']} ({habit['place']})"
+            + (' — приятная' if habit['is_pleasant'] else '')
+            for habit in habits
+        ]
+        await update.message.reply_text('Ваши привычки:\n' + '\n'.join(lines))
+    
+    async def today_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /today"""
+        user_id = await self._user_id_or_reply(update)
+        if user_id is None:
+            return
+        done_today = HabitLog.objects.on_day(timezone.localdate()).filter(
+            habit=OuterRef('pk'), is_completed=True
+        )
+        habits = [
+            habit async for habit in Habit.objects
+            .filter(user_id=user_id, is_pleasant=False)
+            .annotate(done=Exists(done_today))
+            .order_by('time', 'id')
+            .values('action', 'time', 'done')
+        ]
+        if not habits:
+            await update.message.reply_text('На сегодня привычек нет.')
+            return
+        done = sum(1 for habit in habits if habit['done'])
+        lines = [
+            f"{'✅' if habit['done'] else '⬜'} {habit['time']:%H:%M} {habit['action']}"
+            for habit in habits
+        ]
+        await update.message.reply_text(
+            f'Сегодня выполнено {done} из {len(habits)}:\n' + '\n'.join(lines)
+        )
+    
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /stats"""
+        user_id = await self._user_id_or_reply(update)
+        if user_id is None:
+            return
+        today = timezone.localdate()
+        habits = [
+            habit async for habit in Habit.objects
+            .filter(user_id=user_id, is_pleasant=False)
+            .order_by('time', 'id')
+            .values(
+                'action', 'periodicity', 'stats__current_streak',
+                'stats__longest_streak', 'stats__total_completions',
+                'stats__last_completed_date'
+            )
+        ]
+        if not habits:
+            await update.message.reply_text('Статистики пока нет.')
+            return
+        lines = []
+        for habit in habits:
+            last_date = habit['stats__last_completed_date']
+            # Серия прерывается, если с последнего выполнения прошло больше периода
+            current = habit['stats__current_streak'] or 0
+            if not last_date or (today - last_date).days > habit['periodicity']:
+                current = 0
+            lines.append(
+                f"{habit['action']}: серия {current}, "
+                f"лучшая {habit['stats__longest_streak'] or 0}, "
+                f"всего {habit['stats__total_completions'] or 0}"
+            )
+        await update.message.reply_text('Статистика:\n' + '\n'.join(lines))
+    
+    async def done_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопки «Выполнено» в напоминании"""
+        query = update.callback_query
+        parsed = parse_done_callback(query.data, str(update.effective_chat.id))
+        if parsed is None:
+            await query.answer('Кнопка недействительна')
+            return
+        habit_id, day = parsed
+        # День кнопки считается в поясе пользователя, поэтому и «сегодня» — в нем
+        tz = await (
+            Habit.objects.filter(id=habit_id)
+            .values_list('user__timezone', flat=True)
+            .afirst()
+        )
+        if tz is None:
+            await query.answer('Привычка не найдена')
+            return
+        if is_expired(day, tz):
+            await query.answer('Напоминание устарело')
+            return
+        
+        # Повторное нажатие отсекается в Redis и не доходит до вставки
+        if not await claim_tap(habit_id, day, tz):
+            await query.answer('Уже отмечено')
+            return
+        
+        # Выполнение записывается в день кнопки, а не в день нажатия
+        try:
+            log = await HabitLog.objects.acreate(
+                habit_id=habit_id, completed_at=tap_completed_at(day, tz), is_completed=True
+            )
+        except IntegrityError:
+            await release_tap(habit_id, day)
+            await query.answer('Привычка не найдена')
+            return
+        
+        await sync_to_async(record_habit_completion.delay)(
+            habit_id, timezone.localdate(log.completed_at).isoformat()
+        )
+        await query.answer('Отмечено ✅')
+        await query.edit_message_reply_markup(reply_markup=None)
+    
     async def send_reminder(self, message: str, chat_id: str = None):
         """Отправка напоминания пользователю"""
         try:
@@ -54,15 +200,33 @@ class TelegramBot:
         """Настройка обработчиков команд"""
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("habits", self.habits_command))
+        self.application.add_handler(CommandHandler("today", self.today_command))
+        self.application.add_handler(CommandHandler("stats", self.stats_command))
+        self.application.add_handler(
+            CallbackQueryHandler(self.done_callback, pattern=f'^{DONE_PREFIX}:')
+        )
+    
+    def build(self, webhook=False):
+        """
+        Создать приложение python-telegram-bot с обработчиками.
+        В режиме webhook long polling не нужен, обновления приходят
+        через ASGI-приложение (telegram_bot.webhook).
+        """
+        builder = Application.builder().token(self.token)
+        if webhook:
+            builder = builder.updater(None)
+        self.application = builder.build()
+        self.setup_handlers()
+        return self.application
     
     async def run(self):
-        """Запуск бота"""
+        """Запуск бота в режиме long polling"""
         if not self.token:
             logger.error("TELEGRAM_BOT_TOKEN not set")
             return
         
-        self.application = Application.builder().token(self.token).build()
-        self.setup_handlers()
+        self.build()
         
         logger.info("Starting Telegram bot...")
         await self.application.initialize()
@@ -71,14 +235,50 @@ class TelegramBot:
         
         logger.info("Telegram bot started successfully")
     
+    async def set_webhook(self):
+        """Зарегистрировать webhook в Telegram (вместо long polling)"""
+        url = settings.TELEGRAM_WEBHOOK_URL.rstrip('/') + settings.TELEGRAM_WEBHOOK_PATH
+        application = self.build(webhook=True)
+        async with application:
+            await application.bot.set_webhook(
+                url=url,
+                secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+                max_connections=settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info(f"Telegram webhook set to {url}")
+        return url
+    
+    async def delete_webhook(self):
+        """Удалить webhook и вернуться к long polling"""
+        application = self.build(webhook=True)
+        async with application:
+            await application.bot.delete_webhook()
+        logger.info("Telegram webhook deleted")
+    
     async def stop(self):
         """Остановка бота"""
         if self.application:
-            await self.application.updater.stop()
+            if self.application.updater:
+                await self.application.updater.stop()
             await self.application.stop()
             await self.application.shutdown()
             logger.info("Telegram bot stopped")
 
 
-# Глобальный экземпляр бота
-bot = TelegramBot()
+_bot = None
+
+
+def get_bot():
+    """Экземпляр бота процесса, создается при первом обращении"""
+    global _bot
+    if _bot is None:
+        _bot = TelegramBot()
+    return _bot
+
+
+def __getattr__(name):
+    # Совместимость со старым глобальным telegram_bot.bot.bot
+    if name == 'bot':
+        return get_bot()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
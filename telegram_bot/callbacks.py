@@ -0,0 +1,148 @@
+"""
+Кнопка «Выполнено» в напоминаниях.
+
+Данные кнопки (callback_data, не больше 64 байт) компактны и подписаны:
+d:<id привычки>:<день>:<подпись>, где числа записаны в base36, а подпись —
+усеченный HMAC от привычки, чата и дня на SECRET_KEY. Чат в данные не
+входит, но участвует в подписи, поэтому кнопку нельзя подделать или
+переслать в чужой чат, а проверка владельца привычки не требует запроса
+к базе.
+
+Повторные нажатия поглощаются в Redis (SET NX): нажатие занимается до
+конца срока действия кнопки, поэтому одна кнопка — это не больше одной
+вставки лога в базу.
+"""
+import base64
+import hmac
+import logging
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+logger = logging.getLogger(__name__)
+
+DONE_PREFIX = 'd'
+SIGNATURE_SALT = 'telegram_bot.callbacks.done'
+SIGNATURE_BYTES = 9
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+        if not number:
+            return result
+
+
+def _signature(habit_id, chat_id, day):
+    digest = salted_hmac(SIGNATURE_SALT, f'{habit_id}:{chat_id}:{day.toordinal()}').digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode()
+
+
+def done_callback_data(habit_id, chat_id, day):
+    """Подписанные данные кнопки «Выполнено»"""
+    return ':'.join([
+        DONE_PREFIX, _base36(int(habit_id)), _base36(day.toordinal()),
+        _signature(int(habit_id), chat_id, day)
+    ])
+
+
+def parse_done_callback(data, chat_id):
+    """(id привычки, день) из данных кнопки или None, если подпись неверна"""
+    try:
+        prefix, habit_part, day_part, signature = data.split(':')
+        habit_id = int(habit_part, 36)
+        day = date.fromordinal(int(day_part, 36))
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    if prefix != DONE_PREFIX:
+        return None
+    if not hmac.compare_digest(signature, _signature(habit_id, chat_id, day)):
+        return None
+    return habit_id, day
+
+
+def done_keyboard(habit_id, chat_id, day):
+    """Разметка inline-клавиатуры для Bot API"""
+    return {
+        'inline_keyboard': [[{
+            'text': '✅ Выполнено',
+            'callback_data': done_callback_data(habit_id, chat_id, day),
+        }]]
+    }
+
+
+def dedupe_key(habit_id, day):
+    return f'callback:done:{habit_id}:{day.isoformat()}'
+
+
+def is_expired(day, tz):
+    """Устарела ли кнопка дня: день кнопки и «сегодня» — в часовом поясе пользователя"""
+    today = timezone.localdate(timezone=ZoneInfo(tz))
+    return (today - day).days > settings.TELEGRAM_CALLBACK_MAX_AGE_DAYS
+
+
+def tap_completed_at(day, tz):
+    """
+    Время выполнения для нажатия: сейчас, если кнопка сегодняшняя, иначе
+    полдень дня кнопки в поясе пользователя, чтобы выполнение попало в свой день
+    """
+    zone = ZoneInfo(tz)
+    now = timezone.now()
+    if timezone.localdate(now, timezone=zone) == day:
+        return now
+    return datetime.combine(day, time(12, 0), tzinfo=zone)
+
+
+def claim_expires_at(day, tz=None):
+    """Конец срока действия кнопки дня: полночь после TELEGRAM_CALLBACK_MAX_AGE_DAYS"""
+    last_day = day + timedelta(days=settings.TELEGRAM_CALLBACK_MAX_AGE_DAYS + 1)
+    return timezone.make_aware(
+        datetime.combine(last_day, time.min), ZoneInfo(tz) if tz else None
+    )
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """Асинхронный клиент Redis для защиты от повторных нажатий"""
+    global _redis_client
+    if _redis_client is None:
+        # Асинхронный клиент нужен только боту; outbox импортирует модуль ради разметки
+        import redis.asyncio as aioredis
+        _redis_client = aioredis.Redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+async def claim_tap(habit_id, day, tz=None, client=None):
+    """
+    Занять нажатие: True, если это первое нажатие кнопки дня. Метка живет
+    до конца срока действия кнопки (позже нажатие отклоняется как
+    устаревшее), поэтому повтор не запишет второй лог. При недоступности
+    Redis нажатие пропускается, чтобы не терять отметки.
+    """
+    client = client or get_redis_client()
+    try:
+        return bool(await client.set(
+            dedupe_key(habit_id, day), 1, nx=True,
+            exat=int(claim_expires_at(day, tz).timestamp())
+        ))
+    except redis.RedisError as e:
+        logger.error(f"Error claiming callback for habit {habit_id}: {e}")
+        return True
+
+
+async def release_tap(habit_id, day, client=None):
+    """Освободить нажатие, если отметку не удалось записать"""
+    client = client or get_redis_client()
+    try:
+        await client.delete(dedupe_key(habit_id, day))
+    except redis.RedisError as e:
+        logger.error(f"Error releasing callback for habit {habit_id}: {e}")
@@ -0,0 +1,83 @@
+"""
+Кэш соответствия чата Telegram пользователю.
+
+Команды бота по chat_id находят пользователя; чтобы не ходить за этим
+в базу на каждое сообщение, соответствие хранится в ограниченном LRU-кэше
+процесса. Записи удаляются при сохранении или удалении пользователя
+(telegram_bot.signals), а время жизни записи ограничивает устаревание
+в других процессах, где сигнал не срабатывал.
+"""
+import time as time_module
+from collections import OrderedDict
+
+from django.conf import settings
+
+from habits.models import User
+
+
+class ChatUserCache:
+    """LRU-кэш chat_id -> user_id (None — чат ни к кому не привязан)"""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or settings.TELEGRAM_CHAT_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.TELEGRAM_CHAT_CACHE_TTL
+        self.entries = OrderedDict()
+        # Обратный индекс для сброса по пользователю: у пользователя один чат
+        self.chats = {}
+
+    def get(self, chat_id):
+        """Вернуть (найдено, user_id)"""
+        entry = self.entries.get(chat_id)
+        if entry is None:
+            return False, None
+        user_id, expires_at = entry
+        if expires_at < time_module.monotonic():
+            self._pop(chat_id)
+            return False, None
+        self.entries.move_to_end(chat_id)
+        return True, user_id
+
+    def set(self, chat_id, user_id):
+        self._pop(chat_id)
+        self.entries[chat_id] = (user_id, time_module.monotonic() + self.ttl)
+        if user_id is not None:
+            self.chats[user_id] = chat_id
+        while len(self.entries) > self.maxsize:
+            self._pop(next(iter(self.entries)))
+
+    def _pop(self, chat_id):
+        entry = self.entries.pop(chat_id, None)
+        if entry is not None and self.chats.get(entry[0]) == chat_id:
+            del self.chats[entry[0]]
+
+    def invalidate_user(self, user_id, chat_id=None):
+        """Удалить запись пользователя и запись его текущего чата"""
+        cached_chat_id = self.chats.get(user_id)
+        if cached_chat_id is not None:
+            self._pop(cached_chat_id)
+        if chat_id is not None:
+            self._pop(chat_id)
+
+    def clear(self):
+        self.entries.clear()
+        self.chats.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+chat_users = ChatUserCache()
+
+
+async def get_user_id(chat_id):
+    """ID пользователя, привязанного к чату, или None"""
+    chat_id = str(chat_id)
+    found, user_id = chat_users.get(chat_id)
+    if not found:
+        user_id = await (
+            User.objects.filter(telegram_chat_id=chat_id)
+            .values_list('id', flat=True)
+            .afirst()
+        )
+        chat_users.set(chat_id, user_id)
+    return user_id
@@ -0,0 +1,274 @@
+"""
+Асинхронная доставка сообщений в Telegram.
+
+Сообщения пачки отправляются конкурентно на одном цикле событий через общий
+пул keep-alive соединений. Отправка ограничена двумя token bucket'ами:
+общим лимитом бота и лимитом на отдельный чат. Токен чата берется до
+занятия слота конкурентности, поэтому ожидание лимита одного чата не
+задерживает остальные. Ответ 429 приостанавливает общий лимит на
+retry_after секунд: лимит Telegram действует на весь бот.
+"""
+import asyncio
+import logging
+import time as time_module
+from dataclasses import dataclass, field
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+
+# Ответы, которые не изменятся при повторе: неверный запрос или чат
+# недоступен (бот заблокирован пользователем, удален из группы)
+PERMANENT_ERROR_STATUSES = (400, 403)
+
+# Пауза после 429, если в ответе нет retry_after
+DEFAULT_RETRY_AFTER = 1
+
+
+@dataclass
+class OutgoingMessage:
+    """Сообщение для отправки в чат"""
+
+    chat_id: str
+    text: str
+    reply_markup: dict = None
+
+
+@dataclass
+class DeliveryReport:
+    """Итоги отправки пачки сообщений"""
+
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    duration: float = 0.0
+    latencies: list = field(default_factory=list, repr=False)
+    results: list = field(default_factory=list, repr=False)
+    # Индексы сообщений, отклоненных окончательно (повтор не поможет)
+    rejected: list = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self):
+        """Отправленных сообщений в секунду"""
+        return self.sent / self.duration if self.duration else 0.0
+
+    def latency_percentile(self, percent):
+        """Перцентиль задержки отправки в секундах"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+    def __str__(self):
+        return (
+            f"sent={self.sent} failed={self.failed} retried={self.retried} "
+            f"duration={self.duration:.2f}s throughput={self.throughput:.1f}/s "
+            f"p50={self.latency_percentile(50) * 1000:.0f}ms "
+            f"p95={self.latency_percentile(95) * 1000:.0f}ms"
+        )
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time_module.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time_module.monotonic()
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    @property
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (ответ 429 от Telegram)"""
+        until = time_module.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            # После паузы токены копятся заново, без накопленного всплеска
+            self.tokens = 0
+            self.updated_at = until
+
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self.lock:
+            while True:
+                delay = self.paused_until - time_module.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DeliveryEngine:
+    """Движок доставки с общим HTTP-клиентом и лимитами Telegram"""
+
+    def __init__(self, token=None, global_rate=None, chat_rate=None,
+                 concurrency=None, max_retries=None, transport=None):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.global_rate = global_rate or settings.TELEGRAM_GLOBAL_RATE_LIMIT
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_LIMIT
+        self.concurrency = concurrency or settings.TELEGRAM_DELIVERY_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else settings.TELEGRAM_DELIVERY_MAX_RETRIES
+        self.transport = transport
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.global_bucket = None
+        self.chat_buckets = {}
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=f'{TELEGRAM_API_URL}/bot{self.token}/',
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                ),
+                timeout=httpx.Timeout(10.0),
+                transport=self.transport
+            )
+            self.global_bucket = TokenBucket(self.global_rate)
+        return self.client
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket
+
+    def _prune_chat_buckets(self):
+        """Удалить лимиты чатов, которые уже полностью восстановились"""
+        self.chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self.chat_buckets.items()
+            if not bucket.is_full
+        }
+
+    def _payload(self, message):
+        payload = {'chat_id': message.chat_id, 'text': message.text}
+        if message.reply_markup:
+            payload['reply_markup'] = message.reply_markup
+        return payload
+
+    async def _send_one(self, index, message, semaphore, report):
+        client = self._get_client()
+        chat_bucket = self._chat_bucket(message.chat_id)
+        for attempt in range(self.max_retries + 1):
+            # Токен чата берется до слота: ожидание одного чата не занимает слоты других
+            await chat_bucket.acquire()
+            async with semaphore:
+                await self.global_bucket.acquire()
+                started = time_module.monotonic()
+                try:
+                    response = await client.post('sendMessage', json=self._payload(message))
+                except httpx.HTTPError as e:
+                    logger.warning(f"Error sending message to {message.chat_id}: {e}")
+                    response = None
+
+            if response is None:
+                if attempt < self.max_retries:
+                    report.retried += 1
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                report.failed += 1
+                return False
+
+            if response.status_code == 429:
+                retry_after = self._retry_after(response)
+                # Лимит превышен для всего бота: приостанавливаем все отправки
+                self.global_bucket.pause(retry_after)
+                if attempt < self.max_retries:
+                    report.retried += 1
+                    logger.warning(f"Rate limited for chat {message.chat_id}, retry after {retry_after}s")
+                    continue
+                report.failed += 1
+                return False
+
+            if response.status_code != 200:
+                logger.error(
+                    f"Telegram rejected message to {message.chat_id}: "
+                    f"{response.status_code} {response.text}"
+                )
+                report.failed += 1
+                if response.status_code in PERMANENT_ERROR_STATUSES:
+                    report.rejected.append(index)
+                return False
+
+            report.latencies.append(time_module.monotonic() - started)
+            report.sent += 1
+            return True
+        return False
+
+    @staticmethod
+    def _retry_after(response):
+        """retry_after из ответа 429; тело может быть не JSON (например, от прокси)"""
+        try:
+            return response.json()['parameters']['retry_after']
+        except (ValueError, KeyError, TypeError):
+            return DEFAULT_RETRY_AFTER
+
+    async def send_batch(self, messages):
+        """Отправить пачку сообщений конкурентно"""
+        report = DeliveryReport()
+        started = time_module.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        report.results = await asyncio.gather(*(
+            self._send_one(index, message, semaphore, report)
+            for index, message in enumerate(messages)
+        ))
+        report.duration = time_module.monotonic() - started
+        self._prune_chat_buckets()
+        return report
+
+    def deliver(self, messages):
+        """Синхронная обертка для задач Celery"""
+        messages = list(messages)
+        if not messages:
+            return DeliveryReport()
+        if not self.token:
+            logger.error("TELEGRAM_BOT_TOKEN not set")
+            return DeliveryReport(failed=len(messages), results=[False] * len(messages))
+        report = self.loop.run_until_complete(self.send_batch(messages))
+        logger.info(f"Delivered batch: {report}")
+        return report
+
+    def close(self):
+        """Закрыть соединения и цикл событий"""
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.aclose())
+            self.client = None
+        self.loop.close()
+
+
+_engine = None
+
+
+def get_delivery_engine():
+    """Движок доставки текущего процесса"""
+    global _engine
+    if _engine is None:
+        _engine = DeliveryEngine()
+    return _engine
+
+
+def deliver(messages):
+    """Отправить сообщения через движок доставки процесса"""
+    return get_delivery_engine().deliver(messages)
@@ -0,0 +1,89 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Модули, с которых стартуют процессы: воркер Celery и бот
+DEFAULT_MODULES = ['habits_tracker.celery', 'telegram_bot.tasks', 'telegram_bot.bot']
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def profile_imports(module):
+    """
+    Импортировать модуль в отдельном интерпретаторе после django.setup()
+    под python -X importtime. Возвращает список (собственное время в мкс,
+    накопленное время в мкс, глубина вложенности, модуль).
+    """
+    code = f'import django; django.setup(); import {module}'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=settings.BASE_DIR,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'habits_tracker.settings'
+        )}
+    )
+    if result.returncode != 0:
+        raise CommandError(f'Не удалось импортировать {module}:\n{result.stderr[-2000:]}')
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            imports.append((int(own), int(cumulative), len(indent) // 2, name))
+    return imports
+
+
+class Command(BaseCommand):
+    """Профилирование времени импорта при холодном старте процессов"""
+
+    help = 'Показывает самые дорогие импорты при старте и проверяет бюджет времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modules', nargs='*', default=DEFAULT_MODULES,
+            help=f'Модули для профилирования (по умолчанию {", ".join(DEFAULT_MODULES)})'
+        )
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Сколько самых дорогих импортов показать (по умолчанию 15)'
+        )
+        parser.add_argument(
+            '--budget-ms', type=float, default=settings.STARTUP_IMPORT_BUDGET_MS,
+            help='Бюджет суммарного времени импорта в мс (0 — не проверять)'
+        )
+
+    def handle(self, *args, **options):
+        over_budget = []
+        for module in options['modules']:
+            imports = profile_imports(module)
+            total_ms = sum(own for own, _, _, _ in imports) / 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{module}: {len(imports)} модулей, {total_ms:.0f} мс'
+            ))
+
+            # Пакеты верхнего уровня по накопленному времени: что тянет за собой импорт
+            packages = {}
+            for own, cumulative, depth, name in imports:
+                if depth == 0:
+                    package = name.split('.')[0]
+                    packages[package] = packages.get(package, 0) + cumulative
+            self.stdout.write('  Пакеты (накопленное время):')
+            for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+                self.stdout.write(f'    {cumulative / 1000:8.1f} мс  {package}')
+
+            self.stdout.write('  Модули (собственное время):')
+            for own, _, _, name in sorted(imports, reverse=True)[:options['top']]:
+                self.stdout.write(f'    {own / 1000:8.1f} мс  {name}')
+
+            if options['budget_ms'] and total_ms > options['budget_ms']:
+                over_budget.append(f'{module}: {total_ms:.0f} мс')
+
+        if over_budget:
+            raise CommandError(
+                f'Превышен бюджет импорта {options["budget_ms"]:.0f} мс: ' + ', '.join(over_budget)
+            )
+        self.stdout.write(self.style.SUCCESS('Бюджет времени импорта не превышен'))
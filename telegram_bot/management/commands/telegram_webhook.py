@@ -0,0 +1,33 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Регистрация и удаление webhook Telegram-бота"""
+
+    help = 'Регистрирует webhook бота в Telegram (или удаляет его с --delete)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Удалить webhook и вернуться к long polling'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise CommandError('TELEGRAM_BOT_TOKEN not set')
+
+        from telegram_bot.bot import get_bot
+        bot = get_bot()
+
+        if options['delete']:
+            asyncio.run(bot.delete_webhook())
+            self.stdout.write(self.style.SUCCESS('Webhook удален'))
+            return
+
+        if not settings.TELEGRAM_WEBHOOK_URL or not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise CommandError('TELEGRAM_WEBHOOK_URL и TELEGRAM_WEBHOOK_SECRET должны быть заданы')
+        url = asyncio.run(bot.set_webhook())
+        self.stdout.write(self.style.SUCCESS(f'Webhook зарегистрирован: {url}'))
@@ -0,0 +1,288 @@
+"""
+Надежная очередь исходящих сообщений (outbox) в Redis.
+
+Задачи Celery только кладут готовые сообщения в поток Redis и сразу
+завершаются; отправкой пачками занимается отдельный процесс-обработчик.
+
+Каждое сообщение имеет ключ идемпотентности (вид, дата срабатывания —
+для ежечасных проверок выполнения дата и час, привычка или пользователь). Повторная постановка с тем же ключом
+отбрасывается атомарно в Redis, а отправленные ключи записываются
+в компактный журнал — битовую карту на каждый вид и дату, где номер бита
+равен идентификатору привычки или пользователя.
+
+Подтверждаются только доставленные сообщения: недоставленные остаются
+в списке ожидающих группы и через OUTBOX_CLAIM_IDLE_MS забираются
+повторно (claim_stale). После OUTBOX_MAX_ATTEMPTS неудачных попыток
+сообщение переносится в поток недоставленных OUTBOX_DEAD_LETTER_STREAM.
+"""
+import logging
+import socket
+import time as time_module
+from datetime import date
+
+import redis
+from django.conf import settings
+
+from habits_tracker.metrics import (
+    OUTBOX_MESSAGES_FAILED, OUTBOX_MESSAGES_SENT, OUTBOX_SEND_LATENCY, TELEGRAM_REQUEST_DURATION
+)
+from .callbacks import done_keyboard
+
+logger = logging.getLogger(__name__)
+
+KIND_REMINDER = 'reminder'
+KIND_COMPLETION_CHECK = 'completion_check'
+KIND_DAILY_SUMMARY = 'daily_summary'
+
+CONSUMER_GROUP = 'delivery'
+
+# Число неудачных попыток доставки по идентификатору записи потока
+ATTEMPTS_KEY = 'outbox:attempts'
+
+# Пауза цикла обработчика после ошибки: удваивается до максимума
+ERROR_BACKOFF_SECONDS = 1
+ERROR_BACKOFF_MAX_SECONDS = 60
+
+# Атомарно помечает ключ как поставленный в очередь и добавляет сообщение,
+# если ключ встречается впервые
+ENQUEUE_SCRIPT = """
+if redis.call('SETBIT', KEYS[1], ARGV[1], 1) == 1 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('XADD', KEYS[2], '*', 'kind', ARGV[3], 'date', ARGV[4],
+           'entity_id', ARGV[1], 'chat_id', ARGV[5], 'text', ARGV[6])
+return 1
+"""
+
+
+def enqueued_key(kind, fire_date):
+    """Битовая карта поставленных в очередь сообщений"""
+    return f'outbox:enqueued:{kind}:{fire_date}'
+
+
+def ledger_key(kind, fire_date):
+    """Битовая карта доставленных сообщений"""
+    return f'outbox:delivered:{kind}:{fire_date}'
+
+
+def outgoing_message(fields):
+    """Сообщение для отправки; сообщения о привычке получают кнопку «Выполнено»"""
+    from .delivery import OutgoingMessage
+    reply_markup = None
+    if fields['kind'] in (KIND_REMINDER, KIND_COMPLETION_CHECK):
+        reply_markup = done_keyboard(
+            # Для проверок выполнения date — окно «дата и час», кнопке нужна дата
+            fields['entity_id'], fields['chat_id'], date.fromisoformat(fields['date'][:10])
+        )
+    return OutgoingMessage(fields['chat_id'], fields['text'], reply_markup)
+
+
+def enqueued_at(entry_id):
+    """Время постановки в очередь (unix-время) из идентификатора записи потока"""
+    try:
+        return int(str(entry_id).split('-', 1)[0]) / 1000
+    except ValueError:
+        return None
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """Клиент Redis для очереди сообщений"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.OUTBOX_REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+class Outbox:
+    """Постановка сообщений в очередь с защитой от дублей"""
+
+    def __init__(self, client=None):
+        self.client = client or get_redis_client()
+        self.stream = settings.OUTBOX_STREAM
+        self.ttl = settings.OUTBOX_LEDGER_TTL
+        self.enqueue_script = self.client.register_script(ENQUEUE_SCRIPT)
+
+    def enqueue_many(self, entries, batch_size=None):
+        """
+        Поставить сообщения в очередь пачками.
+        entries — итерируемое из (kind, fire_date, entity_id, chat_id, text).
+        Возвращает число действительно добавленных сообщений.
+        """
+        batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        added = 0
+        pipe = self.client.pipeline(transaction=False)
+        pending = 0
+        for kind, fire_date, entity_id, chat_id, text in entries:
+            self.enqueue_script(
+                keys=[enqueued_key(kind, fire_date), self.stream],
+                args=[entity_id, self.ttl, kind, str(fire_date), chat_id, text],
+                client=pipe
+            )
+            pending += 1
+            if pending >= batch_size:
+                added += sum(pipe.execute())
+                pending = 0
+        if pending:
+            added += sum(pipe.execute())
+        return added
+
+
+class OutboxWorker:
+    """Обработчик очереди: читает пачки, отправляет, подтверждает"""
+
+    def __init__(self, client=None, consumer=None, send=None):
+        self.client = client or get_redis_client()
+        self.stream = settings.OUTBOX_STREAM
+        self.ttl = settings.OUTBOX_LEDGER_TTL
+        self.batch_size = settings.TELEGRAM_DELIVERY_BATCH_SIZE
+        self.consumer = consumer or socket.gethostname()
+        if send is None:
+            # Доставка (httpx) нужна только обработчику очереди, но не задачам,
+            # которые лишь ставят сообщения в очередь
+            from .delivery import deliver as send
+        self.send = send
+
+    def ensure_group(self):
+        """Создать группу потребителей, если ее еще нет"""
+        try:
+            self.client.xgroup_create(self.stream, CONSUMER_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read_batch(self, block=None):
+        """Прочитать пачку новых сообщений"""
+        response = self.client.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {self.stream: '>'},
+            count=self.batch_size, block=block
+        )
+        return response[0][1] if response else []
+
+    def claim_stale(self):
+        """Забрать сообщения, которые прочитаны, но не подтверждены (сбой обработчика или доставки)"""
+        _, entries, *_ = self.client.xautoclaim(
+            self.stream, CONSUMER_GROUP, self.consumer,
+            min_idle_time=settings.OUTBOX_CLAIM_IDLE_MS, count=self.batch_size
+        )
+        # Удаленные из потока записи возвращаются без полей
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def process(self, entries):
+        """Отправить пачку, записать журнал и подтвердить сообщения"""
+        if not entries:
+            return 0
+
+        # Пропускаем уже доставленные сообщения (например, после сбоя до ack)
+        pipe = self.client.pipeline(transaction=False)
+        for _, fields in entries:
+            pipe.getbit(ledger_key(fields['kind'], fields['date']), int(fields['entity_id']))
+        delivered_before = pipe.execute()
+
+        to_send = [
+            (entry_id, fields) for (entry_id, fields), delivered in zip(entries, delivered_before)
+            if not delivered
+        ]
+        results, rejected_ids = [], set()
+        if to_send:
+            report = self.send([outgoing_message(fields) for _, fields in to_send])
+            results = report.results
+            rejected_ids = {to_send[index][0] for index in report.rejected}
+            for latency in report.latencies:
+                TELEGRAM_REQUEST_DURATION.observe(latency)
+
+        now = time_module.time()
+        failed = [
+            (entry_id, fields) for (entry_id, fields), sent in zip(to_send, results) if not sent
+        ]
+        # Отклоненные окончательно (бот заблокирован, чат не найден) сразу
+        # переносятся в поток недоставленных, остальные ждут повторной попытки
+        dead = self.count_failures(
+            [(entry_id, fields) for entry_id, fields in failed if entry_id not in rejected_ids]
+        ) + [
+            (entry_id, {**fields, 'rejected': 1})
+            for entry_id, fields in failed if entry_id in rejected_ids
+        ]
+        failed_ids = {entry_id for entry_id, _ in failed} - {entry_id for entry_id, _ in dead}
+
+        pipe = self.client.pipeline(transaction=True)
+        for (entry_id, fields), sent in zip(to_send, results):
+            if sent:
+                key = ledger_key(fields['kind'], fields['date'])
+                pipe.setbit(key, int(fields['entity_id']), 1)
+                pipe.expire(key, self.ttl)
+                OUTBOX_MESSAGES_SENT.labels(fields['kind']).inc()
+                queued = enqueued_at(entry_id)
+                if queued is not None:
+                    OUTBOX_SEND_LATENCY.labels(fields['kind']).observe(max(0.0, now - queued))
+            else:
+                OUTBOX_MESSAGES_FAILED.labels(fields['kind']).inc()
+                logger.error(
+                    f"Outbox message {fields['kind']}:{fields['date']}:{fields['entity_id']} "
+                    f"was not delivered"
+                )
+        for entry_id, fields in dead:
+            pipe.xadd(settings.OUTBOX_DEAD_LETTER_STREAM, fields)
+        # Недоставленные сообщения не подтверждаются и остаются ожидающими
+        done_ids = [entry_id for entry_id, _ in entries if entry_id not in failed_ids]
+        if done_ids:
+            pipe.xack(self.stream, CONSUMER_GROUP, *done_ids)
+            pipe.xdel(self.stream, *done_ids)
+            pipe.hdel(ATTEMPTS_KEY, *done_ids)
+        pipe.execute()
+        return sum(1 for sent in results if sent)
+
+    def count_failures(self, failed):
+        """
+        Учесть неудачные попытки доставки. Возвращает сообщения, исчерпавшие
+        OUTBOX_MAX_ATTEMPTS попыток: они переносятся в поток недоставленных.
+        """
+        if not failed:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for entry_id, _ in failed:
+            pipe.hincrby(ATTEMPTS_KEY, entry_id, 1)
+        attempts = pipe.execute()
+        dead = []
+        for (entry_id, fields), attempt in zip(failed, attempts):
+            if attempt >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error(
+                    f"Outbox message {fields['kind']}:{fields['date']}:{fields['entity_id']} "
+                    f"moved to dead letters after {attempt} attempts"
+                )
+                dead.append((entry_id, {**fields, 'attempts': attempt}))
+        return dead
+
+    def run(self):
+        """
+        Основной цикл обработчика. Ошибка (Redis недоступен, сбой отправки)
+        не завершает процесс: после паузы цикл продолжается, а прочитанные,
+        но не подтвержденные сообщения будут забраны повторно.
+        """
+        logger.info(f"Outbox worker {self.consumer} started")
+        last_claim = time_module.monotonic()
+        group_ready = False
+        backoff = ERROR_BACKOFF_SECONDS
+        while True:
+            try:
+                if not group_ready:
+                    # Группа создается и после ошибки: поток мог быть удален
+                    self.ensure_group()
+                    group_ready = True
+                entries = self.read_batch(block=settings.OUTBOX_BLOCK_MS)
+                # Зависшие и недоставленные сообщения забираются по таймеру,
+                # в том числе под постоянной нагрузкой
+                if time_module.monotonic() - last_claim >= settings.OUTBOX_CLAIM_IDLE_MS / 1000:
+                    last_claim = time_module.monotonic()
+                    entries = entries + self.claim_stale()
+                self.process(entries)
+            except Exception as e:
+                logger.exception(f"Outbox worker error, retrying in {backoff}s: {e}")
+                group_ready = False
+                time_module.sleep(backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX_SECONDS)
+            else:
+                backoff = ERROR_BACKOFF_SECONDS
@@ -0,0 +1,231 @@
+"""
+Планировщик напоминаний на основе колеса времени (timing wheel).
+
+Все полезные привычки один раз загружаются в память и раскладываются
+по 1440 слотам — по одному на каждую минуту суток (UTC) по времени
+ближайшего напоминания Habit.next_fire_at. Изменения привычек
+приходят из сигналов модели через Redis pub/sub, поэтому на каждом тике
+планировщик обрабатывает только те привычки, которые пора напомнить,
+а не сканирует всю таблицу. Окончательно срок проверяет задача
+по next_fire_at: колесо лишь отсекает привычки, которым точно рано.
+
+Pub/sub не гарантирует доставку (например, во время переподключения),
+поэтому раз в REMINDER_WHEEL_RELOAD_SECONDS секунд колесо заново строится
+по Habit.next_fire_at и пропущенные изменения не накапливаются.
+
+Обработанная минута (watermark) хранится в Redis. Если тики пропущены
+(процесс был занят или перезапускался), следующий тик обрабатывает все
+минуты после watermark, но не старше REMINDER_MAX_LATENESS минут.
+"""
+import json
+import logging
+import time as time_module
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from habits.models import Habit
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+SCHEDULE_CHANNEL = 'habits:schedule'
+WATERMARK_KEY = 'reminders:watermark'
+MINUTE = timedelta(minutes=1)
+
+
+def minute_of_day(value):
+    """Номер минуты суток для объекта time или datetime (datetime — в UTC)"""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc)
+    return value.hour * 60 + value.minute
+
+
+class TimingWheel:
+    """Колесо времени: слот на каждую минуту суток"""
+
+    def __init__(self):
+        self.slots = [set() for _ in range(MINUTES_PER_DAY)]
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, habit_id, minute):
+        """Добавить или переместить привычку в слот минуты"""
+        self.remove(habit_id)
+        self.slots[minute % MINUTES_PER_DAY].add(habit_id)
+        self.positions[habit_id] = minute % MINUTES_PER_DAY
+
+    def remove(self, habit_id):
+        """Убрать привычку из колеса"""
+        minute = self.positions.pop(habit_id, None)
+        if minute is not None:
+            self.slots[minute].discard(habit_id)
+
+    def due(self, minute):
+        """Привычки, которые нужно напомнить в указанную минуту"""
+        return set(self.slots[minute % MINUTES_PER_DAY])
+
+    def clear(self):
+        """Очистить колесо"""
+        for slot in self.slots:
+            slot.clear()
+        self.positions.clear()
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """Клиент Redis для канала изменений расписания"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+def publish_schedule_change(habit_id, minute=None):
+    """
+    Сообщить планировщику об изменении привычки.
+    minute=None означает, что привычку нужно убрать из колеса.
+    """
+    payload = json.dumps({'habit_id': habit_id, 'minute': minute})
+    try:
+        get_redis_client().publish(SCHEDULE_CHANNEL, payload)
+    except redis.RedisError as e:
+        logger.error(f"Error publishing schedule change for habit {habit_id}: {e}")
+
+
+class ReminderScheduler:
+    """Долгоживущий процесс, отправляющий напоминания по колесу времени"""
+
+    def __init__(self, dispatch=None, redis_client=None):
+        self.wheel = TimingWheel()
+        self.dispatch = dispatch or self._dispatch_task
+        self.redis_client = redis_client
+        self.pubsub = None
+        self.watermark = None
+        self.loaded_at = None
+        # Окно догоняния не длиннее суток: колесо описывает одни сутки
+        self.max_lateness = min(settings.REMINDER_MAX_LATENESS, MINUTES_PER_DAY - 1) * MINUTE
+
+    @staticmethod
+    def _dispatch_task(habit_ids):
+        from .tasks import send_habit_reminders
+        send_habit_reminders.delay(habit_ids=sorted(habit_ids))
+
+    def load(self):
+        """Загрузить все полезные привычки в новое колесо и заменить им текущее"""
+        wheel = TimingWheel()
+        habits = (
+            Habit.objects
+            .filter(is_pleasant=False, next_fire_at__isnull=False)
+            .values_list('id', 'next_fire_at')
+        )
+        for habit_id, next_fire_at in habits.iterator(chunk_size=2000):
+            wheel.add(habit_id, minute_of_day(next_fire_at))
+        self.wheel = wheel
+        self.loaded_at = time_module.monotonic()
+        logger.info(f"Timing wheel loaded with {len(self.wheel)} habits")
+
+    def reload_if_stale(self):
+        """Перестроить колесо по базе, если с прошлой загрузки прошло больше интервала"""
+        interval = settings.REMINDER_WHEEL_RELOAD_SECONDS
+        if interval and time_module.monotonic() - self.loaded_at >= interval:
+            self.load()
+            # Изменения, пришедшие во время загрузки, применяются поверх
+            self.drain_changes()
+
+    def subscribe(self):
+        """Подписаться на изменения привычек"""
+        client = self.redis_client or get_redis_client()
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(SCHEDULE_CHANNEL)
+
+    def apply(self, habit_id, minute):
+        """Применить изменение привычки к колесу"""
+        if minute is None:
+            self.wheel.remove(habit_id)
+        else:
+            self.wheel.add(habit_id, minute)
+
+    def drain_changes(self):
+        """Применить все накопившиеся изменения из канала"""
+        if self.pubsub is None:
+            return
+        while True:
+            message = self.pubsub.get_message()
+            if message is None:
+                break
+            try:
+                change = json.loads(message['data'])
+                self.apply(change['habit_id'], change['minute'])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Invalid schedule change message {message!r}: {e}")
+
+    def load_watermark(self):
+        """Последняя обработанная минута из Redis или None"""
+        client = self.redis_client or get_redis_client()
+        try:
+            value = client.get(WATERMARK_KEY)
+        except redis.RedisError as e:
+            logger.error(f"Error loading reminder watermark: {e}")
+            return None
+        if not value:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode()
+        return datetime.fromisoformat(value)
+
+    def save_watermark(self, minute):
+        """Сохранить последнюю обработанную минуту"""
+        client = self.redis_client or get_redis_client()
+        try:
+            client.set(WATERMARK_KEY, minute.isoformat())
+        except redis.RedisError as e:
+            logger.error(f"Error saving reminder watermark: {e}")
+
+    def tick(self, now=None):
+        """Отправить привычки всех минут после watermark до текущей включительно"""
+        now = (now or timezone.now()).astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+        if self.watermark is None:
+            self.watermark = self.load_watermark() or now - MINUTE
+        if now <= self.watermark:
+            return set()
+
+        start = self.watermark + MINUTE
+        if now - start > self.max_lateness:
+            logger.warning(
+                f"Reminder ticks from {start:%Y-%m-%d %H:%M} to "
+                f"{now - self.max_lateness - MINUTE:%Y-%m-%d %H:%M} UTC are too late and dropped"
+            )
+            start = now - self.max_lateness
+
+        self.drain_changes()
+        due = set()
+        minute = start
+        while minute <= now:
+            due |= self.wheel.due(minute_of_day(minute))
+            minute += MINUTE
+        if due:
+            self.dispatch(due)
+            logger.info(
+                f"Dispatched {len(due)} reminders for {start:%H:%M}-{now:%H:%M} UTC"
+            )
+        self.watermark = now
+        self.save_watermark(now)
+        return due
+
+    def run(self):
+        """Основной цикл планировщика"""
+        self.subscribe()
+        self.load()
+        logger.info("Reminder scheduler started")
+        while True:
+            self.tick()
+            self.drain_changes()
+            self.reload_if_stale()
+            time_module.sleep(1)
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from habits.models import Habit, User
+from habits.signals import habits_bulk_saved
+from .chat_cache import chat_users
+from .scheduler import publish_schedule_change, minute_of_day
+
+
+@receiver(post_save, sender=Habit)
+def habit_saved(sender, instance, **kwargs):
+    """Обновить расписание напоминаний после фиксации сохранения привычки"""
+    habit_id = instance.id
+    if instance.is_pleasant or instance.next_fire_at is None:
+        minute = None
+    else:
+        minute = minute_of_day(instance.next_fire_at)
+    # Откаченная транзакция не должна менять колесо планировщика
+    transaction.on_commit(lambda: publish_schedule_change(habit_id, minute))
+
+
+@receiver(post_delete, sender=Habit)
+def habit_deleted(sender, instance, **kwargs):
+    """Убрать удаленную привычку из расписания напоминаний после фиксации"""
+    habit_id = instance.id
+    transaction.on_commit(lambda: publish_schedule_change(habit_id))
+
+
+@receiver(habits_bulk_saved, sender=Habit)
+def habits_bulk_saved_handler(sender, habits, **kwargs):
+    """Обновить расписание напоминаний после пакетной записи привычек"""
+    for habit in habits:
+        habit_saved(sender, habit)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Сбросить кэш чата пользователя: привязка к чату могла измениться"""
+    chat_users.invalidate_user(instance.id, instance.telegram_chat_id)
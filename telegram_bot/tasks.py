@@ -1,111 +1,289 @@
-from celery import shared_task
+from celery import shared_task, group, chord
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.db.models.functions import Mod
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .bot import bot
-from habits.models import Habit
+from zoneinfo import ZoneInfo
+from .outbox import Outbox, KIND_REMINDER, KIND_COMPLETION_CHECK, KIND_DAILY_SUMMARY
+from .scheduler import minute_of_day, publish_schedule_change
+from habits.models import (
+    Habit, HabitLog, DailyUserStats, HabitStats, HabitDailyRollup, HabitLogArchive
+)
+from habits.utils import latest_fire_time
+from habits_tracker.db_router import read_from_replica
+from habits_tracker.metrics import (
+    CELERY_TASK_ERRORS, REMINDER_TICK_LAG, REMINDERS_DROPPED, observe_lag, record_task_run
+)
 import logging
+import time as time_module
 
 logger = logging.getLogger(__name__)
 
+# Размер порции при потоковом чтении больших выборок (серверный курсор)
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def completed_on(day):
+    """Подзапрос: есть ли у привычки выполнение за указанный день"""
+    return Exists(HabitLog.objects.on_day(day).filter(
+        habit=OuterRef('pk'),
+        is_completed=True
+    ))
+
+
+def habits_not_completed_on(day):
+    """
+    Полезные привычки без выполнения за указанный день.
+    Один запрос с анти-join (NOT EXISTS) вместо запроса на каждую привычку.
+    """
+    return (
+        Habit.objects
+        .filter(is_pleasant=False)
+        .filter(~completed_on(day))
+        .order_by()
+        .values('id', 'user__telegram_chat_id', 'action', 'place', 'time')
+    )
+
 
 @shared_task
-def send_habit_reminders():
-    """Отправка напоминаний о привычках"""
+def send_habit_reminders(habit_ids=None):
+    """
+    Отправка напоминаний о привычках.
+    Планировщик (telegram_bot.scheduler) передает список привычек,
+    которые пора напомнить; без него привычки ищутся по индексу next_fire_at.
+    Работа тика делится на REMINDER_SHARDS частей по user_id и
+    выполняется группой задач на разных воркерах.
+    """
+    shards = settings.REMINDER_SHARDS
+    tick = timezone.now().isoformat()
+    header = group(
+        send_habit_reminders_shard.s(shard, shards, tick, habit_ids)
+        for shard in range(shards)
+    )
+    return chord(header)(report_reminder_shards.s(tick)).id
+
+
+def last_completed_at():
+    """Подзапрос: время последнего выполнения привычки (по индексу habit, completed_at)"""
+    return Subquery(
+        HabitLog.objects
+        .filter(habit=OuterRef('pk'), is_completed=True)
+        .order_by('-completed_at')
+        .values('completed_at')[:1]
+    )
+
+
+def reminder_message(habit):
+    """Текст напоминания о привычке"""
+    message = f"⏰ Напоминание о привычке!\n\n"
+    message += f"Действие: {habit.action}\n"
+    message += f"Место: {habit.place}\n"
+    message += f"Время: {habit.time.strftime('%H:%M')}\n"
+    message += f"Время на выполнение: {habit.estimated_time} сек.\n"
+    
+    if habit.reward:
+        message += f"Вознаграждение: {habit.reward}\n"
+    elif habit.related_habit:
+        message += f"Связанная привычка: {habit.related_habit.action}\n"
+    return message
+
+
+def advance_habits(habits, now, minutes):
+    """
+    Перенести напоминания сработавших привычек на следующий период.
+    minutes — слоты колеса до переноса; планировщику сообщается только
+    о привычках, сменивших слот (например, при переходе на летнее время).
+    """
+    moved = []
+    for habit in habits:
+        habit.advance(now, tz=habit.user.timezone)
+        if minute_of_day(habit.next_fire_at) != minutes[habit.id]:
+            moved.append(habit)
+    Habit.objects.bulk_update(habits, ['next_fire_at'], batch_size=ITERATOR_CHUNK_SIZE)
+    for habit in moved:
+        publish_schedule_change(habit.id, minute_of_day(habit.next_fire_at))
+
+
+@shared_task
+def send_habit_reminders_shard(shard, shards, tick, habit_ids=None):
+    """
+    Отправка напоминаний для привычек пользователей одного шарда.
+    Выбираются все наступившие напоминания, в том числе пропущенные
+    из-за потерянных тиков; опоздавшие больше чем на REMINDER_MAX_LATENESS
+    минут не отправляются, а только переносятся на следующий период.
+    """
+    started = time_module.monotonic()
+    result = {'shard': shard, 'scanned': 0, 'enqueued': 0, 'dropped': 0, 'duration': 0.0}
     try:
-        current_time = timezone.now().time()
-        current_date = timezone.now().date()
+        now = datetime.fromisoformat(tick)
+        observe_lag(REMINDER_TICK_LAG, now.timestamp())
+        max_lateness = timedelta(minutes=settings.REMINDER_MAX_LATENESS)
         
-        # Получаем все привычки, которые нужно выполнить сейчас
-        habits_to_remind = Habit.objects.filter(
-            time__hour=current_time.hour,
-            time__minute=current_time.minute,
-            is_pleasant=False  # Напоминаем только о полезных привычках
+        # Диапазонный поиск по частичному индексу next_fire_at
+        habits_to_remind = Habit.objects.filter(next_fire_at__lte=now, is_pleasant=False)
+        if habit_ids is not None:
+            habits_to_remind = habits_to_remind.filter(id__in=habit_ids)
+        habits_to_remind = (
+            habits_to_remind
+            .alias(shard=Mod('user_id', shards))
+            .filter(shard=shard)
+            .annotate(last_completed_at=last_completed_at())
+            .select_related('user', 'related_habit')
+            .order_by()
         )
+        fired = []
+        minutes = {}
         
-        for habit in habits_to_remind:
-            # Проверяем, не напоминали ли уже сегодня
-            last_reminder = habit.logs.filter(
-                completed_at__date=current_date
-            ).first()
-            
-            if not last_reminder:
-                message = f"⏰ Напоминание о привычке!\n\n"
-                message += f"Действие: {habit.action}\n"
-                message += f"Место: {habit.place}\n"
-                message += f"Время: {habit.time.strftime('%H:%M')}\n"
-                message += f"Время на выполнение: {habit.estimated_time} сек.\n"
+        def messages():
+            for habit in habits_to_remind.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+                result['scanned'] += 1
+                fired.append(habit)
+                minutes[habit.id] = minute_of_day(habit.next_fire_at)
+                zone = ZoneInfo(habit.user.timezone)
+                # После нескольких пропущенных периодов напоминаем только о текущем
+                habit.next_fire_at = latest_fire_time(
+                    habit.time, habit.periodicity, zone, habit.next_fire_at, now
+                )
+                if now - habit.next_fire_at > max_lateness:
+                    result['dropped'] += 1
+                    continue
                 
-                if habit.reward:
-                    message += f"Вознаграждение: {habit.reward}\n"
-                elif habit.related_habit:
-                    message += f"Связанная привычка: {habit.related_habit.action}\n"
+                fire_date = habit.next_fire_at.astimezone(zone).date()
+                # Уже выполненные в день напоминания привычки не напоминаем;
+                # повторные напоминания отсекает ключ идемпотентности outbox
+                if habit.last_completed_at and habit.last_completed_at.astimezone(zone).date() == fire_date:
+                    continue
+                if not habit.user.telegram_chat_id:
+                    continue
                 
-                # Отправляем напоминание
-                bot.send_reminder(message, str(habit.user.id))
-                logger.info(f"Reminder sent for habit {habit.id}")
+                yield (
+                    KIND_REMINDER, fire_date, habit.id,
+                    habit.user.telegram_chat_id, reminder_message(habit)
+                )
         
-        logger.info("Habit reminders task completed successfully")
+        result['enqueued'] = Outbox().enqueue_many(messages())
+        advance_habits(fired, now, minutes)
+        record_task_run(send_habit_reminders_shard.name, result['scanned'], result['enqueued'])
+        REMINDERS_DROPPED.inc(result['dropped'])
+        if result['dropped']:
+            logger.warning(
+                f"Dropped {result['dropped']} reminders later than "
+                f"{settings.REMINDER_MAX_LATENESS} minutes (shard {shard})"
+            )
         
     except Exception as e:
-        logger.error(f"Error in send_habit_reminders task: {e}")
+        # Шард не падает, чтобы chord дождался остальных и подвел итоги
+        logger.exception(f"Error in send_habit_reminders_shard task (shard {shard}): {e}")
+        CELERY_TASK_ERRORS.labels(send_habit_reminders_shard.name).inc()
+        result['error'] = str(e)
+    
+    result['duration'] = round(time_module.monotonic() - started, 3)
+    return result
+
+
+@shared_task
+def report_reminder_shards(results, tick):
+    """Итоги тика напоминаний по шардам"""
+    for result in results:
+        logger.info(
+            f"Reminder tick {tick} shard {result['shard']}: scanned {result['scanned']}, "
+            f"enqueued {result['enqueued']} in {result['duration']:.3f}s"
+        )
+    summary = {
+        'tick': tick,
+        'shards': results,
+        'enqueued': sum(result['enqueued'] for result in results),
+        'dropped': sum(result.get('dropped', 0) for result in results),
+        'failed_shards': sum(1 for result in results if result.get('error')),
+        'slowest': max((result['duration'] for result in results), default=0.0),
+    }
+    logger.info(
+        f"Habit reminders task completed: enqueued {summary['enqueued']}, "
+        f"dropped {summary['dropped']}, failed shards {summary['failed_shards']}, "
+        f"slowest shard {summary['slowest']:.3f}s"
+    )
+    return summary
+
+
+def completion_check_window(now):
+    """Окно проверки выполнения: дата и час запуска (например, 2024-01-01T18)"""
+    return now.strftime('%Y-%m-%dT%H')
 
 
 @shared_task
 def check_habit_completion():
-    """Проверка выполнения привычек"""
-    try:
-        current_date = timezone.now().date()
-        
-        # Получаем все привычки пользователей
-        habits = Habit.objects.filter(is_pleasant=False)
-        
-        for habit in habits:
-            # Проверяем, была ли привычка выполнена сегодня
-            today_log = habit.logs.filter(
-                completed_at__date=current_date,
-                is_completed=True
-            ).first()
+    """
+    Проверка выполнения привычек.
+    Ошибки не перехватываются: задача завершается в состоянии FAILURE
+    и учитывается в метриках.
+    """
+    now = timezone.localtime()
+    current_date = now.date()
+    # Ключ идемпотентности — час запуска: повторы в пределах часа отсекаются,
+    # а каждая ежечасная проверка отправляет свое напоминание
+    window = completion_check_window(now)
+    scanned = 0
+    
+    # Привычки без выполнения за сегодня читаются порциями через серверный курсор
+    habits = habits_not_completed_on(current_date)
+    
+    def messages():
+        nonlocal scanned
+        for habit in habits.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            scanned += 1
+            if not habit['user__telegram_chat_id']:
+                continue
             
-            if not today_log:
-                # Если привычка не была выполнена, отправляем напоминание
-                message = f"⚠️ Вы не выполнили привычку сегодня!\n\n"
-                message += f"Действие: {habit.action}\n"
-                message += f"Место: {habit.place}\n"
-                message += f"Время: {habit.time.strftime('%H:%M')}\n"
-                
-                bot.send_reminder(message, str(habit.user.id))
-                logger.info(f"Completion check reminder sent for habit {habit.id}")
-        
-        logger.info("Habit completion check task completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Error in check_habit_completion task: {e}")
+            message = f"⚠️ Вы не выполнили привычку сегодня!\n\n"
+            message += f"Действие: {habit['action']}\n"
+            message += f"Место: {habit['place']}\n"
+            message += f"Время: {habit['time'].strftime('%H:%M')}\n"
+            
+            yield (
+                KIND_COMPLETION_CHECK, window, habit['id'],
+                habit['user__telegram_chat_id'], message
+            )
+    
+    # Полный просмотр привычек — отчетное чтение, выполняется на реплике
+    with read_from_replica():
+        enqueued = Outbox().enqueue_many(messages())
+    record_task_run(check_habit_completion.name, scanned, enqueued)
+    logger.info(f"Habit completion check task completed: scanned {scanned}, enqueued {enqueued}")
 
 
 @shared_task
 def send_daily_summary():
-    """Отправка ежедневной сводки"""
-    try:
-        current_date = timezone.now().date()
-        
-        # Получаем всех пользователей с привычками
-        users_with_habits = Habit.objects.values_list('user', flat=True).distinct()
-        
-        for user_id in users_with_habits:
-            user_habits = Habit.objects.filter(user_id=user_id, is_pleasant=False)
-            completed_today = 0
-            total_habits = user_habits.count()
-            
-            for habit in user_habits:
-                if habit.logs.filter(
-                    completed_at__date=current_date,
-                    is_completed=True
-                ).exists():
-                    completed_today += 1
+    """Отправка ежедневной сводки (ошибки не перехватываются, как в check_habit_completion)"""
+    current_date = timezone.localdate()
+    scanned = 0
+    
+    # Пересчитываем статистику одним агрегирующим запросом: агрегация
+    # читается с реплики, upsert пишется в основную базу, откуда ниже
+    # и читается свежая статистика
+    with read_from_replica():
+        DailyUserStats.objects.refresh_for_date(current_date)
+    
+    stats = (
+        DailyUserStats.objects
+        .filter(date=current_date, total_habits__gt=0)
+        .exclude(user__telegram_chat_id__isnull=True)
+        .exclude(user__telegram_chat_id='')
+        .select_related('user')
+        .order_by()
+    )
+    
+    def messages():
+        nonlocal scanned
+        for day_stats in stats.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            scanned += 1
+            completed_today = day_stats.completed_habits
+            total_habits = day_stats.total_habits
             
             message = f"📊 Ежедневная сводка\n\n"
             message += f"Выполнено привычек: {completed_today}/{total_habits}\n"
-            message += f"Процент выполнения: {(completed_today/total_habits*100):.1f}%\n"
+            message += f"Процент выполнения: {day_stats.completion_rate:.1f}%\n"
             
             if completed_today == total_habits:
                 message += "🎉 Отлично! Все привычки выполнены!"
@@ -114,9 +292,46 @@ def send_daily_summary():
             else:
                 message += "💪 Не расстраивайтесь! Завтра новый день!"
             
-            bot.send_reminder(message, str(user_id))
-        
-        logger.info("Daily summary task completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Error in send_daily_summary task: {e}")
+            yield (
+                KIND_DAILY_SUMMARY, current_date, day_stats.user_id,
+                day_stats.user.telegram_chat_id, message
+            )
+    
+    enqueued = Outbox().enqueue_many(messages())
+    record_task_run(send_daily_summary.name, scanned, enqueued)
+    logger.info(f"Daily summary task completed: scanned {scanned}, enqueued {enqueued}")
+
+
+@shared_task
+def refresh_habit_rollups():
+    """
+    Инкрементальный пересчет дневных агрегатов для аналитики.
+    Логи читаются из основной базы: реплика может еще не содержать строк
+    ниже новой отметки, и они были бы пропущены.
+    """
+    refreshed = HabitDailyRollup.objects.refresh()
+    record_task_run(refresh_habit_rollups.name, refreshed)
+    logger.info(f"Habit rollups refreshed: {refreshed} habit days")
+    return refreshed
+
+
+@shared_task
+def archive_habit_logs():
+    """Свернуть выполнения старше HABITLOG_ARCHIVE_AFTER_DAYS дней в архив"""
+    if not settings.HABITLOG_ARCHIVE_AFTER_DAYS:
+        return 0
+    before = timezone.localdate() - timedelta(days=settings.HABITLOG_ARCHIVE_AFTER_DAYS)
+    archived = HabitLogArchive.objects.archive(before)
+    record_task_run(archive_habit_logs.name, archived)
+    logger.info(f"Habit logs archived: {archived} logs before {before}")
+    return archived
+
+
+@shared_task
+def record_habit_completion(habit_id, day):
+    """Обновить счетчики серий после отметки выполнения из бота"""
+    habit = Habit.objects.filter(id=habit_id).first()
+    if habit is None:
+        return
+    with transaction.atomic():
+        HabitStats.objects.record(habit, datetime.strptime(day, '%Y-%m-%d').date())
@@ -1,11 +1,43 @@
-from django.test import TestCase
-from unittest.mock import patch, MagicMock
-from .bot import TelegramBot
-from .tasks import send_habit_reminders, check_habit_completion, send_daily_summary
-from habits.models import Habit, HabitLog
+from django.test import TestCase, override_settings
+from django.db import transaction
+import asyncio
+import time as time_module
+from asgiref.sync import async_to_sync
+import json
+import httpx
+import redis
+from unittest.mock import patch, MagicMock, AsyncMock
+from .bot import TelegramBot, get_bot
+from .management.commands.import_profile import profile_imports
+from . import bot as bot_module
+from .scheduler import TimingWheel, ReminderScheduler, minute_of_day
+from .delivery import DeliveryEngine, DeliveryReport, OutgoingMessage, TokenBucket
+from .chat_cache import ChatUserCache, chat_users
+from .callbacks import claim_expires_at, claim_tap, done_callback_data, parse_done_callback
+from .webhook import WebhookApplication
+from .outbox import (
+    ATTEMPTS_KEY, CONSUMER_GROUP, KIND_COMPLETION_CHECK, KIND_DAILY_SUMMARY, KIND_REMINDER,
+    OutboxWorker, ledger_key,
+    outgoing_message
+)
+from .tasks import (
+    send_habit_reminders,
+    send_habit_reminders_shard,
+    report_reminder_shards,
+    check_habit_completion,
+    send_daily_summary
+)
+from habits.models import Habit, HabitLog, HabitStats
 from django.contrib.auth.models import User
-from datetime import time
+from django.contrib.auth import get_user_model
+from datetime import time, timedelta
 from django.utils import timezone
+from datetime import date, datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from habits.utils import next_fire_time
+from habits_tracker.telemetry import planned_start, serve_worker_metrics
+from prometheus_client import REGISTRY
+from django.conf import settings
 
 
 class TelegramBotTest(TestCase):
@@ -40,7 +72,8 @@ class TelegramTasksTest(TestCase):
         self.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
-            password='testpass123'
+            password='testpass123',
+            telegram_chat_id='123456789'
         )
         self.habit = Habit.objects.create(
             user=self.user,
@@ -51,8 +84,8 @@ class TelegramTasksTest(TestCase):
             is_pleasant=False
         )
     
-    @patch('telegram_bot.tasks.bot.send_reminder')
-    def test_send_habit_reminders(self, mock_send_reminder):
+    @patch('telegram_bot.tasks.Outbox')
+    def test_send_habit_reminders(self, mock_outbox):
         """Тест отправки напоминаний о привычках"""
         # Мокаем время
         with patch('telegram_bot.tasks.timezone.now') as mock_now:
@@ -61,20 +94,20 @@ class TelegramTasksTest(TestCase):
             # Выполняем задачу
             send_habit_reminders.delay()
             
-            # Проверяем, что напоминание было отправлено
-            mock_send_reminder.assert_called()
+            # Проверяем, что напоминание было поставлено в очередь
+            mock_outbox.return_value.enqueue_many.assert_called()
     
-    @patch('telegram_bot.tasks.bot.send_reminder')
-    def test_check_habit_completion(self, mock_send_reminder):
+    @patch('telegram_bot.tasks.Outbox')
+    def test_check_habit_completion(self, mock_outbox):
         """Тест проверки выполнения привычек"""
         # Выполняем задачу
         check_habit_completion.delay()
         
         # Проверяем, что проверка была выполнена
-        mock_send_reminder.assert_called()
+        mock_outbox.return_value.enqueue_many.assert_called()
     
-    @patch('telegram_bot.tasks.bot.send_reminder')
-    def test_send_daily_summary(self, mock_send_reminder):
+    @patch('telegram_bot.tasks.Outbox')
+    def test_send_daily_summary(self, mock_outbox):
         """Тест отправки ежедневной сводки"""
         # Создаем лог выполнения
         HabitLog.objects.create(
@@ -85,5 +118,1067 @@ class TelegramTasksTest(TestCase):
         # Выполняем задачу
         send_daily_summary.delay()
         
-        # Проверяем, что сводка была отправлена
-        mock_send_reminder.assert_called()
\ No newline at end of file
+        # Проверяем, что сводка была поставлена в очередь
+        mock_outbox.return_value.enqueue_many.assert_called()
+
+class TimingWheelTest(TestCase):
+    """Тесты для колеса времени планировщика"""
+    
+    def test_add_move_remove(self):
+        """Тест добавления, перемещения и удаления привычки"""
+        wheel = TimingWheel()
+        wheel.add(1, 9 * 60)
+        self.assertEqual(wheel.due(9 * 60), {1})
+        
+        wheel.add(1, 10 * 60)
+        self.assertEqual(wheel.due(9 * 60), set())
+        self.assertEqual(wheel.due(10 * 60), {1})
+        
+        wheel.remove(1)
+        self.assertEqual(wheel.due(10 * 60), set())
+        self.assertEqual(len(wheel), 0)
+
+
+class ReminderSchedulerTest(TestCase):
+    """Тесты для планировщика напоминаний"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='scheduler@example.com',
+            password='testpass123'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            place='Дома',
+            time=time(9, 0),
+            action='Читать книгу',
+            estimated_time=60
+        )
+        self.dispatch = MagicMock()
+        self.redis = MagicMock()
+        self.redis.get.return_value = None
+        self.scheduler = ReminderScheduler(dispatch=self.dispatch, redis_client=self.redis)
+        self.scheduler.load()
+    
+    def test_tick_dispatches_only_due_habits(self):
+        """Тест отправки только тех привычек, которые пора напомнить"""
+        now = timezone.make_aware(timezone.datetime(2024, 1, 1, 9, 0))
+        self.assertEqual(self.scheduler.tick(now), {self.habit.id})
+        self.dispatch.assert_called_once_with({self.habit.id})
+        
+        # Повторный тик в ту же минуту ничего не отправляет
+        self.assertEqual(self.scheduler.tick(now), set())
+        self.assertEqual(self.dispatch.call_count, 1)
+    
+    def test_apply_schedule_change(self):
+        """Тест применения изменения расписания"""
+        self.scheduler.apply(self.habit.id, 10 * 60)
+        now = timezone.make_aware(timezone.datetime(2024, 1, 1, 9, 0))
+        self.assertEqual(self.scheduler.tick(now), set())
+        self.dispatch.assert_not_called()
+    
+    def test_missed_ticks_are_caught_up_from_watermark(self):
+        """Тест: после простоя обрабатываются все минуты после watermark"""
+        self.redis.get.return_value = b'2024-01-01T05:55:00+00:00'
+        now = timezone.make_aware(timezone.datetime(2024, 1, 1, 9, 5))
+        
+        self.assertEqual(self.scheduler.tick(now), {self.habit.id})
+        self.redis.set.assert_called_once_with(
+            'reminders:watermark', '2024-01-01T06:05:00+00:00'
+        )
+    
+    @patch('telegram_bot.signals.publish_schedule_change')
+    def test_schedule_change_published_on_commit(self, mock_publish):
+        """Тест: изменение публикуется только после фиксации, откат не публикуется"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.habit.time = time(10, 0)
+            self.habit.save()
+        mock_publish.assert_called_once_with(self.habit.id, minute_of_day(self.habit.next_fire_at))
+        
+        mock_publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.habit.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        mock_publish.assert_not_called()
+    
+    @override_settings(REMINDER_WHEEL_RELOAD_SECONDS=600)
+    def test_wheel_is_reloaded_periodically(self):
+        """Тест: колесо перестраивается из базы, пропущенные изменения не накапливаются"""
+        # Изменение, потерянное в pub/sub: колесо указывает на 09:00
+        self.scheduler.wheel.remove(self.habit.id)
+        self.scheduler.reload_if_stale()
+        self.assertEqual(len(self.scheduler.wheel), 0)
+        
+        self.scheduler.loaded_at -= 600
+        self.scheduler.reload_if_stale()
+        self.assertEqual(
+            self.scheduler.wheel.positions, {self.habit.id: minute_of_day(self.habit.next_fire_at)}
+        )
+    
+    @override_settings(REMINDER_MAX_LATENESS=30)
+    def test_ticks_older_than_max_lateness_are_dropped(self):
+        """Тест: минуты старше допустимого опоздания не догоняются"""
+        scheduler = ReminderScheduler(dispatch=self.dispatch, redis_client=self.redis)
+        scheduler.load()
+        self.redis.get.return_value = b'2024-01-01T05:00:00+00:00'
+        now = timezone.make_aware(timezone.datetime(2024, 1, 1, 9, 45))
+        
+        self.assertEqual(scheduler.tick(now), set())
+        self.dispatch.assert_not_called()
+
+
+class CheckHabitCompletionQueryTest(TestCase):
+    """Регрессионный тест числа запросов check_habit_completion"""
+    
+    HABITS_COUNT = 100_000
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='bulk@example.com',
+            password='testpass123',
+            telegram_chat_id='100'
+        )
+        Habit.objects.bulk_create(
+            (
+                Habit(
+                    user=cls.user,
+                    place='Дома',
+                    time=time(9, 0),
+                    action=f'Привычка {i}',
+                    estimated_time=60
+                )
+                for i in range(cls.HABITS_COUNT)
+            ),
+            batch_size=5000
+        )
+        completed = Habit.objects.order_by('id').first()
+        HabitLog.objects.create(habit=completed, is_completed=True)
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_constant_query_count(self, mock_outbox):
+        """Тест: число запросов не зависит от количества привычек"""
+        enqueued = []
+        mock_outbox.return_value.enqueue_many.side_effect = enqueued.extend
+        with self.assertNumQueries(1):
+            check_habit_completion()
+        
+        self.assertEqual(len(enqueued), self.HABITS_COUNT - 1)
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_completion_checks_are_keyed_per_hour(self, mock_outbox):
+        """Тест: каждая ежечасная проверка получает свой ключ идемпотентности"""
+        enqueued = []
+        mock_outbox.return_value.enqueue_many.side_effect = enqueued.extend
+        zone = timezone.get_current_timezone()
+        for hour in (9, 18):
+            with patch('telegram_bot.tasks.timezone.localtime') as mock_localtime:
+                mock_localtime.return_value = datetime(2024, 1, 1, hour, 5, tzinfo=zone)
+                check_habit_completion()
+        
+        self.assertEqual(
+            {(kind, window) for kind, window, *_ in enqueued},
+            {(KIND_COMPLETION_CHECK, '2024-01-01T09'), (KIND_COMPLETION_CHECK, '2024-01-01T18')}
+        )
+
+
+class DeliveryEngineTest(TestCase):
+    """Тесты для движка доставки сообщений"""
+    
+    def make_engine(self, handler):
+        return DeliveryEngine(
+            token='test-token',
+            global_rate=1000,
+            chat_rate=1000,
+            concurrency=10,
+            max_retries=2,
+            transport=httpx.MockTransport(handler)
+        )
+    
+    def test_deliver_batch(self):
+        """Тест конкурентной отправки пачки через общий клиент"""
+        requests = []
+        
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(200, json={'ok': True, 'result': {}})
+        
+        engine = self.make_engine(handler)
+        messages = [OutgoingMessage(str(chat_id), 'Привет') for chat_id in range(5)]
+        report = engine.deliver(messages)
+        engine.close()
+        
+        self.assertEqual(report.sent, 5)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual({r['chat_id'] for r in requests}, {str(i) for i in range(5)})
+    
+    @patch.object(TokenBucket, 'pause')
+    def test_retry_after_on_429(self, mock_pause):
+        """Тест: ответ 429 приостанавливает общий лимит на retry_after"""
+        responses = [
+            httpx.Response(429, json={'ok': False, 'parameters': {'retry_after': 3}}),
+            httpx.Response(200, json={'ok': True, 'result': {}}),
+        ]
+        engine = self.make_engine(lambda request: responses.pop(0))
+        report = engine.deliver([OutgoingMessage('1', 'Привет')])
+        engine.close()
+        
+        self.assertEqual(report.sent, 1)
+        self.assertEqual(report.retried, 1)
+        mock_pause.assert_called_once_with(3)
+    
+    @patch.object(TokenBucket, 'pause')
+    def test_429_without_json_body(self, mock_pause):
+        """Тест: 429 с телом не в JSON не роняет пачку, пауза по умолчанию"""
+        responses = [
+            httpx.Response(429, text='Too Many Requests'),
+            httpx.Response(200, json={'ok': True, 'result': {}}),
+        ]
+        engine = self.make_engine(lambda request: responses.pop(0))
+        report = engine.deliver([OutgoingMessage('1', 'Привет')])
+        engine.close()
+        
+        self.assertEqual(report.sent, 1)
+        mock_pause.assert_called_once_with(1)
+    
+    def test_permanent_errors_are_rejected(self):
+        """Тест: 403 (бот заблокирован) отмечается как окончательный отказ, 500 — нет"""
+        def handler(request):
+            chat_id = json.loads(request.content)['chat_id']
+            if chat_id == '1':
+                return httpx.Response(403, json={'ok': False, 'description': 'blocked'})
+            if chat_id == '2':
+                return httpx.Response(500, json={'ok': False})
+            return httpx.Response(200, json={'ok': True, 'result': {}})
+        
+        engine = self.make_engine(handler)
+        report = engine.deliver([OutgoingMessage(str(chat_id), 'Привет') for chat_id in (0, 1, 2)])
+        engine.close()
+        
+        self.assertEqual(report.results, [True, False, False])
+        self.assertEqual(report.rejected, [1])
+    
+    def test_429_pauses_other_chats(self):
+        """Тест: после 429 в одном чате отправка в другие чаты тоже ждет"""
+        sent_at = {}
+        
+        def handler(request):
+            chat_id = json.loads(request.content)['chat_id']
+            if chat_id == '1' and '1' not in sent_at:
+                sent_at['1'] = time_module.monotonic()
+                return httpx.Response(429, json={'ok': False, 'parameters': {'retry_after': 0.2}})
+            sent_at.setdefault(chat_id, time_module.monotonic())
+            return httpx.Response(200, json={'ok': True, 'result': {}})
+        
+        engine = DeliveryEngine(
+            token='test-token', global_rate=1000, chat_rate=1000, concurrency=1,
+            max_retries=2, transport=httpx.MockTransport(handler)
+        )
+        report = engine.deliver([OutgoingMessage('1', 'Привет'), OutgoingMessage('2', 'Привет')])
+        engine.close()
+        
+        self.assertEqual(report.sent, 2)
+        self.assertGreaterEqual(sent_at['2'] - sent_at['1'], 0.19)
+    
+    def test_chat_limit_does_not_hold_slot(self):
+        """Тест: ожидание лимита чата не занимает слот конкурентности"""
+        sent_at = {}
+        
+        def handler(request):
+            chat_id = json.loads(request.content)['chat_id']
+            sent_at.setdefault(chat_id, []).append(time_module.monotonic())
+            return httpx.Response(200, json={'ok': True, 'result': {}})
+        
+        engine = DeliveryEngine(
+            token='test-token', global_rate=1000, chat_rate=5, concurrency=1,
+            max_retries=0, transport=httpx.MockTransport(handler)
+        )
+        started = time_module.monotonic()
+        report = engine.deliver([
+            OutgoingMessage('1', 'Первое'), OutgoingMessage('1', 'Второе'),
+            OutgoingMessage('2', 'Привет'),
+        ])
+        engine.close()
+        
+        self.assertEqual(report.sent, 3)
+        # Второе сообщение чата 1 ждет токен 0.2с, но чат 2 уходит сразу
+        self.assertLess(sent_at['2'][0] - started, 0.1)
+    
+    def test_token_bucket_pause(self):
+        """Тест: пауза token bucket задерживает выдачу токенов"""
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        
+        async def acquire_one():
+            started = asyncio.get_running_loop().time()
+            await bucket.acquire()
+            return asyncio.get_running_loop().time() - started
+        
+        self.assertGreaterEqual(asyncio.run(acquire_one()), 0.09)
+    
+    def test_token_bucket_limits_rate(self):
+        """Тест ограничения частоты token bucket"""
+        bucket = TokenBucket(rate=20, capacity=1)
+        
+        async def acquire_three():
+            started = asyncio.get_running_loop().time()
+            for _ in range(3):
+                await bucket.acquire()
+            return asyncio.get_running_loop().time() - started
+        
+        self.assertGreaterEqual(asyncio.run(acquire_three()), 0.09)
+
+
+
+class OutboxWorkerTest(TestCase):
+    """Тесты для обработчика очереди сообщений"""
+    
+    def setUp(self):
+        self.client = MagicMock()
+        self.pipe = self.client.pipeline.return_value
+        self.send = MagicMock(return_value=DeliveryReport(sent=1, results=[True]))
+        self.worker = OutboxWorker(client=self.client, consumer='test', send=self.send)
+    
+    def entry(self, entry_id, entity_id):
+        return entry_id, {
+            'kind': KIND_REMINDER, 'date': '2024-01-01',
+            'entity_id': str(entity_id), 'chat_id': '100', 'text': 'Привет'
+        }
+    
+    def test_process_skips_already_delivered(self):
+        """Тест: уже доставленное сообщение не отправляется повторно"""
+        self.pipe.execute.side_effect = [[1, 0], []]
+        entries = [self.entry('1-0', 5), self.entry('1-1', 6)]
+        
+        self.assertEqual(self.worker.process(entries), 1)
+        (sent,), _ = self.send.call_args
+        self.assertEqual([(m.chat_id, m.text) for m in sent], [('100', 'Привет')])
+        self.assertIn('inline_keyboard', sent[0].reply_markup)
+        self.pipe.setbit.assert_called_once_with(
+            ledger_key(KIND_REMINDER, '2024-01-01'), 6, 1
+        )
+        self.pipe.xack.assert_called_once_with(
+            self.worker.stream, CONSUMER_GROUP, '1-0', '1-1'
+        )
+    
+    def test_failed_message_stays_pending(self):
+        """Тест: недоставленное сообщение не подтверждается и будет забрано повторно"""
+        self.send.return_value = DeliveryReport(sent=1, failed=1, results=[True, False])
+        self.pipe.execute.side_effect = [[0, 0], [1], []]
+        entries = [self.entry('1-0', 5), self.entry('1-1', 6)]
+        
+        self.assertEqual(self.worker.process(entries), 1)
+        self.pipe.hincrby.assert_called_once_with(ATTEMPTS_KEY, '1-1', 1)
+        self.pipe.xack.assert_called_once_with(self.worker.stream, CONSUMER_GROUP, '1-0')
+        self.pipe.xdel.assert_called_once_with(self.worker.stream, '1-0')
+        self.pipe.xadd.assert_not_called()
+    
+    @override_settings(OUTBOX_CLAIM_IDLE_MS=60000)
+    @patch('telegram_bot.outbox.time_module.monotonic')
+    def test_run_claims_stale_under_load(self, mock_monotonic):
+        """Тест: зависшие сообщения забираются по таймеру, даже когда новые не кончаются"""
+        mock_monotonic.side_effect = [0, 30, 61, 61, 70]
+        fresh, stale = [self.entry('2-0', 7)], [self.entry('1-0', 5)]
+        processed = []
+        # Исчерпанные часы — ошибка цикла, а пауза после нее останавливает тест
+        with patch.object(self.worker, 'ensure_group'), \
+                patch.object(self.worker, 'read_batch', return_value=fresh), \
+                patch.object(self.worker, 'claim_stale', return_value=stale) as mock_claim, \
+                patch.object(self.worker, 'process', side_effect=processed.append), \
+                patch('telegram_bot.outbox.time_module.sleep', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.worker.run()
+        
+        mock_claim.assert_called_once()
+        self.assertEqual(processed, [fresh, fresh + stale, fresh])
+    
+    @patch('telegram_bot.outbox.time_module.sleep')
+    def test_run_survives_errors(self, mock_sleep):
+        """Тест: ошибка Redis не завершает обработчик, пауза растет и сбрасывается"""
+        entries = [self.entry('1-0', 5)]
+        errors = [redis.ConnectionError('down')] * 2
+        processed = []
+        
+        def read_batch(block=None):
+            if errors:
+                raise errors.pop()
+            if processed:
+                raise KeyboardInterrupt
+            return entries
+        
+        with patch.object(self.worker, 'ensure_group') as mock_group, \
+                patch.object(self.worker, 'read_batch', side_effect=read_batch), \
+                patch.object(self.worker, 'process', side_effect=processed.append):
+            with self.assertRaises(KeyboardInterrupt):
+                self.worker.run()
+        
+        self.assertEqual(processed, [entries])
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [1, 2])
+        self.assertEqual(mock_group.call_count, 3)
+    
+    def test_rejected_message_moves_to_dead_letters_at_once(self):
+        """Тест: окончательно отклоненное сообщение не повторяется"""
+        self.send.return_value = DeliveryReport(failed=1, results=[False], rejected=[0])
+        self.pipe.execute.side_effect = [[0], []]
+        
+        self.assertEqual(self.worker.process([self.entry('1-0', 5)]), 0)
+        self.pipe.hincrby.assert_not_called()
+        (stream, fields), _ = self.pipe.xadd.call_args
+        self.assertEqual(stream, settings.OUTBOX_DEAD_LETTER_STREAM)
+        self.assertEqual((fields['entity_id'], fields['rejected']), ('5', 1))
+        self.pipe.xack.assert_called_once_with(self.worker.stream, CONSUMER_GROUP, '1-0')
+    
+    @override_settings(OUTBOX_MAX_ATTEMPTS=3)
+    def test_exhausted_message_moves_to_dead_letters(self):
+        """Тест: после OUTBOX_MAX_ATTEMPTS попыток сообщение уходит в поток недоставленных"""
+        self.send.return_value = DeliveryReport(failed=1, results=[False])
+        self.pipe.execute.side_effect = [[0], [3], []]
+        
+        self.assertEqual(self.worker.process([self.entry('1-0', 5)]), 0)
+        (stream, fields), _ = self.pipe.xadd.call_args
+        self.assertEqual(stream, settings.OUTBOX_DEAD_LETTER_STREAM)
+        self.assertEqual((fields['entity_id'], fields['attempts']), ('5', 3))
+        self.pipe.xack.assert_called_once_with(self.worker.stream, CONSUMER_GROUP, '1-0')
+
+
+class ReminderShardsTest(TestCase):
+    """Тесты для шардирования тика напоминаний"""
+    
+    def setUp(self):
+        self.habits = []
+        for i in range(4):
+            user = get_user_model().objects.create_user(
+                email=f'shard{i}@example.com',
+                password='testpass123',
+                telegram_chat_id=str(100 + i)
+            )
+            self.habits.append(Habit.objects.create(
+                user=user,
+                place='Дома',
+                time=time(9, 0),
+                action='Читать книгу',
+                estimated_time=60
+            ))
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_shards_split_habits_by_user(self, mock_outbox):
+        """Тест: каждый шард обрабатывает только своих пользователей"""
+        enqueued = []
+        
+        def enqueue_many(entries):
+            habit_ids = [entry[2] for entry in entries]
+            enqueued.extend(habit_ids)
+            return len(habit_ids)
+        
+        mock_outbox.return_value.enqueue_many.side_effect = enqueue_many
+        habit_ids = [habit.id for habit in self.habits]
+        fire_at = self.habits[0].next_fire_at
+        tick = fire_at.isoformat()
+        
+        with patch('telegram_bot.tasks.publish_schedule_change'):
+            results = [
+                send_habit_reminders_shard(shard, 2, tick, habit_ids) for shard in range(2)
+            ]
+        
+        self.assertEqual(sorted(enqueued), sorted(habit_ids))
+        # После срабатывания напоминание переносится на следующий день
+        for habit in Habit.objects.filter(id__in=habit_ids):
+            self.assertEqual(habit.next_fire_at, fire_at + timedelta(days=1))
+        for result in results:
+            expected = {h.id for h in self.habits if h.user_id % 2 == result['shard']}
+            self.assertEqual(result['scanned'], len(expected))
+            self.assertEqual(result['enqueued'], len(expected))
+    
+    def test_report_reminder_shards(self):
+        """Тест сводки по шардам"""
+        summary = report_reminder_shards([
+            {'shard': 0, 'scanned': 3, 'enqueued': 2, 'duration': 0.5},
+            {'shard': 1, 'scanned': 1, 'enqueued': 1, 'duration': 0.2},
+        ], 'tick')
+        self.assertEqual(summary['enqueued'], 3)
+        self.assertEqual(summary['slowest'], 0.5)
+
+
+def make_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': f'/habits {update_id}',
+            'chat': {'id': chat_id, 'type': 'private'}
+        }
+    }
+
+
+class WebhookTest(TestCase):
+    """Тесты для режима webhook"""
+    
+    def setUp(self):
+        self.processed = []
+        self.telegram_application = MagicMock()
+        self.telegram_application.bot = None
+        self.telegram_application.initialize = AsyncMock()
+        self.telegram_application.start = AsyncMock()
+        self.telegram_application.stop = AsyncMock()
+        self.telegram_application.shutdown = AsyncMock()
+        
+        async def process_update(update):
+            # Первые обновления обрабатываются дольше последующих
+            await asyncio.sleep(0.05 if update.update_id < 3 else 0)
+            self.processed.append((update.effective_chat.id, update.update_id))
+        
+        self.telegram_application.process_update = process_update
+        self.django_application = AsyncMock()
+        self.app = WebhookApplication(
+            self.django_application, self.telegram_application,
+            path='/telegram/webhook/', secret='s3cret'
+        )
+    
+    async def post(self, payload, secret='s3cret', method='POST'):
+        scope = {
+            'type': 'http', 'method': method, 'path': '/telegram/webhook/',
+            'headers': [(b'x-telegram-bot-api-secret-token', secret.encode())]
+        }
+        body = json.dumps(payload).encode()
+        messages = []
+        
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        
+        async def send(message):
+            messages.append(message)
+        
+        await self.app(scope, receive, send)
+        return messages[0]['status']
+    
+    def test_rejects_wrong_secret(self):
+        """Тест: обновление без верного секрета отклоняется"""
+        async def scenario():
+            return await self.post(make_update(1, 10), secret='wrong')
+        
+        self.assertEqual(asyncio.run(scenario()), 403)
+        self.assertEqual(self.processed, [])
+    
+    def test_preserves_order_within_chat(self):
+        """Тест: чаты обрабатываются конкурентно, обновления чата — по порядку"""
+        async def scenario():
+            statuses = [
+                await self.post(make_update(1, 10)),
+                await self.post(make_update(2, 20)),
+                await self.post(make_update(3, 10)),
+                await self.post(make_update(4, 30)),
+            ]
+            await self.app.shutdown()
+            return statuses
+        
+        self.assertEqual(asyncio.run(scenario()), [200] * 4)
+        # Чат 30 не ждет медленных обновлений других чатов
+        self.assertEqual(self.processed[0], (30, 4))
+        chat_10 = [update_id for chat_id, update_id in self.processed if chat_id == 10]
+        self.assertEqual(chat_10, [1, 3])
+    
+    def test_callback_acked_after_processing(self):
+        """Тест: нажатие кнопки подтверждается только после обработки, команда — сразу"""
+        callback = {
+            'update_id': 1,
+            'callback_query': {
+                'id': '1', 'chat_instance': '1', 'data': 'd:1:1:x',
+                'from': {'id': 10, 'is_bot': False, 'first_name': 'Тест'},
+                'message': {
+                    'message_id': 1, 'date': 0, 'chat': {'id': 10, 'type': 'private'}
+                },
+            }
+        }
+        
+        async def scenario():
+            acks = []
+            for payload in (callback, make_update(2, 20)):
+                status = await self.post(payload)
+                acks.append((status, list(self.processed)))
+            await self.app.shutdown()
+            return acks
+        
+        # На момент ответа нажатие уже обработано, а команда — еще нет
+        self.assertEqual(asyncio.run(scenario()), [(200, [(10, 1)]), (200, [(10, 1)])])
+        self.assertEqual(self.processed, [(10, 1), (20, 2)])
+    
+    def test_other_paths_go_to_django(self):
+        """Тест: остальные запросы передаются приложению Django"""
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/habits/', 'headers': []}
+        asyncio.run(self.app(scope, AsyncMock(), AsyncMock()))
+        self.django_application.assert_awaited_once()
+
+
+def make_command_update(chat_id):
+    update = MagicMock()
+    update.effective_chat.id = chat_id
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+class BotCommandsTest(TestCase):
+    """Тесты для команд бота /habits, /today и /stats"""
+    
+    def setUp(self):
+        chat_users.clear()
+        self.bot = TelegramBot()
+        self.user = get_user_model().objects.create_user(
+            email='commands@example.com',
+            password='testpass123',
+            telegram_chat_id='555'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Парк', time=time(7, 0),
+            action='Пробежка', estimated_time=60
+        )
+        Habit.objects.create(
+            user=self.user, place='Дома', time=time(8, 0),
+            action='Чтение', estimated_time=60
+        )
+    
+    def reply(self, update):
+        return update.message.reply_text.await_args.args[0]
+    
+    def test_habits_command_uses_chat_cache(self):
+        """Тест: повторная команда не ищет пользователя в базе"""
+        update = make_command_update(555)
+        async_to_sync(self.bot.habits_command)(update, None)
+        self.assertIn('Пробежка', self.reply(update))
+        
+        with self.assertNumQueries(1):
+            async_to_sync(self.bot.habits_command)(make_command_update(555), None)
+    
+    def test_today_command(self):
+        """Тест: /today показывает выполненные сегодня привычки одним запросом"""
+        HabitLog.objects.create(habit=self.habit, is_completed=True)
+        chat_users.set('555', self.user.id)
+        update = make_command_update(555)
+        with self.assertNumQueries(1):
+            async_to_sync(self.bot.today_command)(update, None)
+        self.assertIn('выполнено 1 из 2', self.reply(update))
+    
+    async def test_stats_command(self):
+        """Тест: /stats показывает серии привычек"""
+        await HabitStats.objects.acreate(
+            habit=self.habit, current_streak=3, longest_streak=5,
+            total_completions=7, completed_days=7,
+            last_completed_date=timezone.localdate()
+        )
+        update = make_command_update(555)
+        await self.bot.stats_command(update, None)
+        self.assertIn('Пробежка: серия 3, лучшая 5, всего 7', self.reply(update))
+    
+    async def test_unlinked_chat(self):
+        """Тест: чат без пользователя получает подсказку"""
+        update = make_command_update(777)
+        await self.bot.habits_command(update, None)
+        self.assertIn('не привязан', self.reply(update))
+    
+    def test_user_save_invalidates_cache(self):
+        """Тест: смена чата пользователя сбрасывает кэш"""
+        chat_users.set('555', self.user.id)
+        self.user.telegram_chat_id = '556'
+        self.user.save()
+        self.assertEqual(chat_users.get('555'), (False, None))
+    
+    def test_cache_is_bounded(self):
+        """Тест: кэш вытесняет давно не использованные чаты"""
+        cache = ChatUserCache(maxsize=2, ttl=60)
+        cache.set('1', 1)
+        cache.set('2', 2)
+        cache.get('1')
+        cache.set('3', 3)
+        self.assertEqual(cache.get('2'), (False, None))
+        self.assertEqual(cache.get('1'), (True, 1))
+        cache.invalidate_user(1)
+        self.assertEqual(cache.get('1'), (False, None))
+
+
+class DoneButtonTest(TestCase):
+    """Тесты для кнопки «Выполнено» в напоминаниях"""
+    
+    def setUp(self):
+        self.bot = TelegramBot()
+        self.user = get_user_model().objects.create_user(
+            email='button@example.com',
+            password='testpass123',
+            telegram_chat_id='555'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Парк', time=time(7, 0),
+            action='Пробежка', estimated_time=60
+        )
+        self.today = timezone.localdate()
+    
+    def make_update(self, data, chat_id=555):
+        update = MagicMock()
+        update.effective_chat.id = chat_id
+        update.callback_query.data = data
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_reply_markup = AsyncMock()
+        return update
+    
+    def test_callback_data_is_signed_and_compact(self):
+        """Тест: данные кнопки помещаются в 64 байта и привязаны к чату"""
+        data = done_callback_data(10 ** 9, '-1001234567890', self.today)
+        self.assertLessEqual(len(data.encode()), 64)
+        self.assertEqual(parse_done_callback(data, '-1001234567890'), (10 ** 9, self.today))
+        self.assertIsNone(parse_done_callback(data, '555'))
+        self.assertIsNone(parse_done_callback(data[:-1] + 'x', '-1001234567890'))
+    
+    def test_reminder_carries_keyboard(self):
+        """Тест: напоминание из очереди отправляется с кнопкой"""
+        fields = {
+            'kind': KIND_REMINDER, 'date': self.today.isoformat(),
+            'entity_id': str(self.habit.id), 'chat_id': '555', 'text': 'Напоминание'
+        }
+        message = outgoing_message(fields)
+        button = message.reply_markup['inline_keyboard'][0][0]
+        self.assertEqual(parse_done_callback(button['callback_data'], '555'), (self.habit.id, self.today))
+        self.assertIsNone(outgoing_message(dict(fields, kind=KIND_DAILY_SUMMARY)).reply_markup)
+        check = outgoing_message(dict(fields, kind=KIND_COMPLETION_CHECK, date=f'{self.today}T18'))
+        button = check.reply_markup['inline_keyboard'][0][0]
+        self.assertEqual(parse_done_callback(button['callback_data'], '555'), (self.habit.id, self.today))
+    
+    @patch('telegram_bot.bot.record_habit_completion')
+    @patch('telegram_bot.bot.claim_tap', new_callable=AsyncMock)
+    def test_tap_writes_log_in_one_insert(self, mock_claim, mock_record):
+        """Тест: нажатие — чтение пояса и одна вставка, повтор до вставки не доходит"""
+        data = done_callback_data(self.habit.id, '555', self.today)
+        mock_claim.side_effect = [True, False]
+        
+        with self.assertNumQueries(2):
+            async_to_sync(self.bot.done_callback)(self.make_update(data), None)
+        repeat = self.make_update(data)
+        with self.assertNumQueries(1):
+            async_to_sync(self.bot.done_callback)(repeat, None)
+        
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit).count(), 1)
+        mock_record.delay.assert_called_once_with(self.habit.id, self.today.isoformat())
+        repeat.callback_query.answer.assert_awaited_once_with('Уже отмечено')
+    
+    @patch('telegram_bot.bot.record_habit_completion')
+    @patch('telegram_bot.bot.claim_tap', new_callable=AsyncMock)
+    def test_tap_on_yesterdays_button_lands_on_its_day(self, mock_claim, mock_record):
+        """Тест: вчерашняя кнопка записывает выполнение во вчерашний день пользователя"""
+        mock_claim.return_value = True
+        self.user.timezone = 'America/New_York'
+        self.user.save()
+        zone = ZoneInfo('America/New_York')
+        # 6 марта 02:00 по Москве — еще вечер 5 марта в Нью-Йорке: по дате сервера
+        # кнопка 4 марта была бы устаревшей, а для пользователя она вчерашняя
+        now = datetime(2024, 3, 5, 23, 0, tzinfo=dt_timezone.utc)
+        user_today = now.astimezone(zone).date()
+        yesterday = user_today - timedelta(days=1)
+        
+        with patch('django.utils.timezone.now', return_value=now):
+            for day in (yesterday, user_today):
+                data = done_callback_data(self.habit.id, '555', day)
+                async_to_sync(self.bot.done_callback)(self.make_update(data), None)
+            # Кнопка 3 марта устарела и для пользователя
+            stale = self.make_update(
+                done_callback_data(self.habit.id, '555', user_today - timedelta(days=2))
+            )
+            async_to_sync(self.bot.done_callback)(stale, None)
+        
+        days = sorted(
+            log.completed_at.astimezone(zone).date()
+            for log in HabitLog.objects.filter(habit=self.habit)
+        )
+        self.assertEqual(days, [yesterday, user_today])
+        stale.callback_query.answer.assert_awaited_once_with('Напоминание устарело')
+        mock_claim.assert_any_await(self.habit.id, yesterday, 'America/New_York')
+    
+    @override_settings(TELEGRAM_CALLBACK_MAX_AGE_DAYS=1)
+    def test_claim_lasts_while_button_is_valid(self):
+        """Тест: метка нажатия живет до конца срока кнопки, а не несколько секунд"""
+        client = MagicMock()
+        client.set = AsyncMock(return_value=True)
+        day = date(2024, 1, 10)
+        
+        self.assertTrue(async_to_sync(claim_tap)(self.habit.id, day, client=client))
+        
+        expires = claim_expires_at(day)
+        self.assertEqual(timezone.localtime(expires).date(), date(2024, 1, 12))
+        self.assertEqual(timezone.localtime(expires).time(), time(0, 0))
+        client.set.assert_awaited_once_with(
+            f'callback:done:{self.habit.id}:2024-01-10', 1, nx=True,
+            exat=int(expires.timestamp())
+        )
+    
+    @patch('telegram_bot.bot.claim_tap', new_callable=AsyncMock)
+    def test_forged_tap_is_rejected(self, mock_claim):
+        """Тест: кнопка из чужого чата не принимается"""
+        data = done_callback_data(self.habit.id, '555', self.today)
+        update = self.make_update(data, chat_id=777)
+        async_to_sync(self.bot.done_callback)(update, None)
+        
+        mock_claim.assert_not_called()
+        self.assertFalse(HabitLog.objects.exists())
+
+
+class NextFireAtTest(TestCase):
+    """Тесты для расчета next_fire_at и выборки напоминаний по нему"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='tz@example.com',
+            password='testpass123',
+            telegram_chat_id='100',
+            timezone='America/New_York'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60, periodicity=2
+        )
+    
+    def test_next_fire_time_uses_user_timezone_and_dst(self):
+        """Тест: время привычки считается в поясе пользователя с учетом перехода на летнее время"""
+        after = datetime(2024, 3, 9, 15, 0, tzinfo=dt_timezone.utc)
+        first = next_fire_time(time(9, 0), 1, 'America/New_York', after)
+        self.assertEqual(first, datetime(2024, 3, 10, 13, 0, tzinfo=dt_timezone.utc))
+        
+        # Пропущенные периоды пропускаются с сохранением шага
+        previous = datetime(2024, 3, 1, 14, 0, tzinfo=dt_timezone.utc)
+        later = next_fire_time(time(9, 0), 2, 'America/New_York', after, previous=previous)
+        self.assertEqual(later, datetime(2024, 3, 11, 13, 0, tzinfo=dt_timezone.utc))
+    
+    def test_habit_is_scheduled_on_save(self):
+        """Тест: next_fire_at пересчитывается при смене времени и часового пояса"""
+        fire_at = self.habit.next_fire_at.astimezone(ZoneInfo('America/New_York'))
+        self.assertEqual((fire_at.hour, fire_at.minute), (9, 0))
+        
+        self.habit.time = time(10, 30)
+        self.habit.save()
+        fire_at = self.habit.next_fire_at.astimezone(ZoneInfo('America/New_York'))
+        self.assertEqual((fire_at.hour, fire_at.minute), (10, 30))
+        
+        user = get_user_model().objects.get(id=self.user.id)
+        user.timezone = 'Asia/Tokyo'
+        user.save()
+        self.habit.refresh_from_db()
+        fire_at = self.habit.next_fire_at.astimezone(ZoneInfo('Asia/Tokyo'))
+        self.assertEqual((fire_at.hour, fire_at.minute), (10, 30))
+    
+    @patch('telegram_bot.tasks.publish_schedule_change')
+    @patch('telegram_bot.tasks.Outbox')
+    def test_shard_selects_due_habits_and_respects_periodicity(self, mock_outbox, mock_publish):
+        """Тест: выбираются только наступившие напоминания, следующее — через periodicity дней"""
+        enqueued = []
+        mock_outbox.return_value.enqueue_many.side_effect = lambda entries: len(
+            [enqueued.append(entry) for entry in entries]
+        )
+        fire_at = self.habit.next_fire_at
+        
+        send_habit_reminders_shard(0, 1, (fire_at - timedelta(minutes=1)).isoformat())
+        self.assertEqual(enqueued, [])
+        
+        send_habit_reminders_shard(0, 1, fire_at.isoformat())
+        self.assertEqual([entry[2] for entry in enqueued], [self.habit.id])
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.next_fire_at, fire_at + timedelta(days=2))
+
+
+class ReminderCatchUpTest(TestCase):
+    """Тесты для догоняния пропущенных напоминаний"""
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='catchup@example.com',
+            password='testpass123',
+            telegram_chat_id='100',
+            timezone='UTC'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user, place='Дома', time=time(9, 0),
+            action='Зарядка', estimated_time=60
+        )
+        self.enqueued = []
+        patcher = patch('telegram_bot.tasks.Outbox')
+        self.addCleanup(patcher.stop)
+        mock_outbox = patcher.start()
+        mock_outbox.return_value.enqueue_many.side_effect = lambda entries: len(
+            [self.enqueued.append(entry) for entry in entries]
+        )
+        publisher = patch('telegram_bot.tasks.publish_schedule_change')
+        self.addCleanup(publisher.stop)
+        publisher.start()
+    
+    def set_next_fire_at(self, value):
+        Habit.objects.filter(id=self.habit.id).update(next_fire_at=value)
+    
+    def test_late_reminder_within_window_is_sent(self):
+        """Тест: опоздавшее в пределах окна напоминание отправляется один раз"""
+        self.set_next_fire_at(datetime(2024, 1, 1, 9, 0, tzinfo=dt_timezone.utc))
+        now = datetime(2024, 1, 1, 9, 40, tzinfo=dt_timezone.utc)
+        
+        result = send_habit_reminders_shard(0, 1, now.isoformat())
+        self.assertEqual((result['enqueued'], result['dropped']), (1, 0))
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.next_fire_at, datetime(2024, 1, 2, 9, 0, tzinfo=dt_timezone.utc))
+    
+    def test_missed_periods_send_only_current(self):
+        """Тест: после нескольких пропущенных дней напоминание только за текущий"""
+        self.set_next_fire_at(datetime(2024, 1, 1, 9, 0, tzinfo=dt_timezone.utc))
+        now = datetime(2024, 1, 4, 9, 10, tzinfo=dt_timezone.utc)
+        
+        send_habit_reminders_shard(0, 1, now.isoformat())
+        self.assertEqual([entry[1] for entry in self.enqueued], [date(2024, 1, 4)])
+    
+    @override_settings(REMINDER_MAX_LATENESS=30)
+    def test_too_late_reminder_is_dropped(self):
+        """Тест: напоминание старше допустимого опоздания отбрасывается, но переносится"""
+        self.set_next_fire_at(datetime(2024, 1, 1, 9, 0, tzinfo=dt_timezone.utc))
+        now = datetime(2024, 1, 1, 11, 0, tzinfo=dt_timezone.utc)
+        
+        result = send_habit_reminders_shard(0, 1, now.isoformat())
+        self.assertEqual((result['enqueued'], result['dropped']), (0, 1))
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.next_fire_at, datetime(2024, 1, 2, 9, 0, tzinfo=dt_timezone.utc))
+
+
+class TaskTelemetryTest(TestCase):
+    """Тесты телеметрии задач и доставки"""
+    
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='telemetry@example.com', password='testpass123',
+            telegram_chat_id='100'
+        )
+        for i in range(3):
+            Habit.objects.create(
+                user=user, place='Дома', time=time(9, 0),
+                action=f'Привычка {i}', estimated_time=60
+            )
+    
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_task_records_scanned_and_enqueued(self, mock_outbox):
+        """Тест: задача записывает прочитанные строки и поставленные сообщения"""
+        enqueue_many = mock_outbox.return_value.enqueue_many
+        enqueue_many.side_effect = lambda entries: len(list(entries))
+        task = check_habit_completion.name
+        scanned = self.sample('task_rows_scanned_total', task=task)
+        enqueued = self.sample('task_messages_enqueued_total', task=task)
+        
+        check_habit_completion()
+        
+        self.assertEqual(
+            self.sample('task_rows_scanned_total', task=task), scanned + 3
+        )
+        self.assertEqual(
+            self.sample('task_messages_enqueued_total', task=task), enqueued + 3
+        )
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_signals_record_runs_and_duration(self, mock_outbox):
+        """Тест: сигналы Celery записывают итог и время выполнения задачи"""
+        mock_outbox.return_value.enqueue_many.return_value = 0
+        task = check_habit_completion.name
+        runs = self.sample('celery_task_runs_total', task=task, state='success')
+        durations = self.sample('celery_task_duration_seconds_count', task=task)
+        
+        check_habit_completion.apply()
+        
+        self.assertEqual(
+            self.sample('celery_task_runs_total', task=task, state='success'),
+            runs + 1
+        )
+        self.assertEqual(
+            self.sample('celery_task_duration_seconds_count', task=task),
+            durations + 1
+        )
+    
+    @patch('telegram_bot.tasks.Outbox')
+    def test_failed_task_is_counted(self, mock_outbox):
+        """Тест: ошибка задачи не проглатывается и учитывается как failure"""
+        enqueue_many = mock_outbox.return_value.enqueue_many
+        enqueue_many.side_effect = RuntimeError('redis down')
+        task = check_habit_completion.name
+        failures = self.sample('celery_task_runs_total', task=task, state='failure')
+        
+        result = check_habit_completion.apply()
+        
+        self.assertTrue(result.failed())
+        self.assertEqual(
+            self.sample('celery_task_runs_total', task=task, state='failure'),
+            failures + 1
+        )
+    
+    def test_planned_start_prefers_eta(self):
+        """Тест: плановый старт — eta, иначе время постановки в очередь"""
+        eta = datetime(2024, 1, 1, 9, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            planned_start(MagicMock(eta=eta.isoformat(), published_at=1.0)),
+            eta.timestamp()
+        )
+        self.assertEqual(planned_start(MagicMock(eta=None, published_at=1.0)), 1.0)
+    
+    @override_settings(METRICS_PORT=9100)
+    @patch('habits_tracker.telemetry.start_metrics_server')
+    def test_prefork_metrics_require_multiproc_dir(self, mock_start):
+        """Тест: воркер prefork с METRICS_PORT без общего каталога не стартует"""
+        from celery.concurrency.prefork import TaskPool
+        from celery.exceptions import WorkerShutdown
+        consumer = MagicMock(pool=MagicMock(spec=TaskPool))
+        
+        with patch.dict('os.environ', {'PROMETHEUS_MULTIPROC_DIR': ''}):
+            with self.assertRaises(WorkerShutdown):
+                serve_worker_metrics(sender=consumer)
+        mock_start.assert_not_called()
+        
+        with patch.dict('os.environ', {'PROMETHEUS_MULTIPROC_DIR': '/tmp/metrics'}):
+            serve_worker_metrics(sender=consumer)
+        mock_start.assert_called_once_with()
+    
+    def test_outbox_records_send_latency(self):
+        """Тест: обработчик outbox записывает доставленные и задержку от постановки"""
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = [[0, 0], [1], []]
+        send = MagicMock(
+            return_value=DeliveryReport(sent=1, failed=1, results=[True, False])
+        )
+        worker = OutboxWorker(client=client, consumer='test', send=send)
+        queued_ms = int((timezone.now() - timedelta(seconds=30)).timestamp() * 1000)
+        entries = [
+            (f'{queued_ms}-{i}', {
+                'kind': KIND_DAILY_SUMMARY, 'date': '2024-01-01',
+                'entity_id': str(i), 'chat_id': '100', 'text': 'Сводка'
+            })
+            for i in range(2)
+        ]
+        kind = KIND_DAILY_SUMMARY
+        sent = self.sample('outbox_messages_sent_total', kind=kind)
+        failed = self.sample('outbox_messages_failed_total', kind=kind)
+        latency = self.sample('outbox_send_latency_seconds_sum', kind=kind)
+        
+        worker.process(entries)
+        
+        self.assertEqual(self.sample('outbox_messages_sent_total', kind=kind), sent + 1)
+        self.assertEqual(
+            self.sample('outbox_messages_failed_total', kind=kind), failed + 1
+        )
+        self.assertGreaterEqual(
+            self.sample('outbox_send_latency_seconds_sum', kind=kind) - latency, 30
+        )
+
+
+class LazyImportTest(TestCase):
+    """Тесты холодного старта процессов"""
+    
+    def test_tasks_do_not_import_delivery_or_bot(self):
+        """Тест: задачи не тянут httpx и python-telegram-bot"""
+        modules = {name for _, _, _, name in profile_imports('telegram_bot.tasks')}
+        self.assertIn('telegram_bot.tasks', modules)
+        heavy = {'httpx', 'telegram', 'telegram.ext', 'telegram_bot.bot', 'telegram_bot.delivery'}
+        self.assertEqual(heavy & modules, set())
+    
+    def test_bot_is_created_on_first_use(self):
+        """Тест: экземпляр бота создается при первом обращении и переиспользуется"""
+        self.assertIs(get_bot(), get_bot())
+        self.assertIs(bot_module.bot, get_bot())
@@ -0,0 +1,219 @@
+"""
+Режим webhook для Telegram-бота.
+
+ASGI-приложение проекта принимает обновления от Telegram на отдельном
+пути (TELEGRAM_WEBHOOK_PATH), проверяет секретный токен из заголовка
+X-Telegram-Bot-Api-Secret-Token и запускает обработку на том же цикле
+событий. Обновления разных чатов обрабатываются конкурентно, обновления
+одного чата — строго по порядку поступления. Состояния между запросами
+нет, поэтому несколько одинаковых реплик можно поставить за балансировщиком.
+
+Telegram повторяет обновление, пока не получит 200, поэтому момент ответа
+задает гарантию доставки:
+- нажатия кнопок (callback_query) записывают выполнение, поэтому 200
+  отправляется только после обработки: если реплика упадет раньше,
+  Telegram повторит нажатие (at-least-once, повтор поглощает claim_tap);
+- команды только читают данные, на них 200 отправляется сразу (at-most-once):
+  обновление, принятое репликой перед падением, теряется, и пользователь
+  повторяет команду.
+
+python-telegram-bot загружается только при включенном webhook (задан
+TELEGRAM_WEBHOOK_SECRET): реплики без бота стартуют без него.
+"""
+import asyncio
+import hmac
+import json
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+
+# Обновления Telegram небольшие; все, что больше, отклоняется
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def update_chat_id(update):
+    """Чат обновления или None, если обновление не привязано к чату"""
+    chat = update.effective_chat
+    return chat.id if chat else None
+
+
+def acks_after_processing(update):
+    """Подтверждать ли обновление только после обработки (обработчик пишет в базу)"""
+    return update.callback_query is not None
+
+
+class ChatOrderedProcessor:
+    """
+    Конкурентная обработка обновлений с сохранением порядка внутри чата.
+    Для каждого чата хранится последняя запущенная задача; новая задача
+    чата сначала дожидается предыдущей.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.tails = {}
+        self.tasks = set()
+
+    def submit(self, update):
+        """Запланировать обработку обновления"""
+        chat_id = update_chat_id(update)
+        previous = self.tails.get(chat_id) if chat_id is not None else None
+        task = asyncio.ensure_future(self._run(update, previous))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if chat_id is not None:
+            self.tails[chat_id] = task
+            task.add_done_callback(lambda done: self._release(chat_id, done))
+        return task
+
+    def _release(self, chat_id, task):
+        if self.tails.get(chat_id) is task:
+            del self.tails[chat_id]
+
+    async def _run(self, update, previous):
+        if previous is not None:
+            # Ошибка предыдущего обновления не должна останавливать очередь чата
+            await asyncio.wait([previous])
+        try:
+            await self.process(update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}")
+
+    async def join(self):
+        """Дождаться обработки всех принятых обновлений"""
+        if self.tasks:
+            await asyncio.wait(set(self.tasks))
+
+
+class WebhookApplication:
+    """
+    ASGI-обертка над приложением Django: путь webhook обслуживается здесь,
+    все остальные запросы передаются в Django.
+    """
+
+    def __init__(self, django_application, telegram_application=None, path=None, secret=None):
+        self.django_application = django_application
+        self.path = path or settings.TELEGRAM_WEBHOOK_PATH
+        self.secret = secret if secret is not None else settings.TELEGRAM_WEBHOOK_SECRET
+        self.telegram_application = telegram_application
+        self.processor = ChatOrderedProcessor(self._process_update)
+        self.started = False
+        self.start_lock = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == self.path:
+            await self._handle_update(scope, receive, send)
+        else:
+            await self.django_application(scope, receive, send)
+
+    async def startup(self):
+        """Инициализировать приложение python-telegram-bot (один раз)"""
+        if self.start_lock is None:
+            self.start_lock = asyncio.Lock()
+        async with self.start_lock:
+            if self.started:
+                return
+            if self.telegram_application is None:
+                from .bot import get_bot
+                self.telegram_application = get_bot().build(webhook=True)
+            await self.telegram_application.initialize()
+            await self.telegram_application.start()
+            self.started = True
+            logger.info(f"Telegram webhook is served at {self.path}")
+
+    async def shutdown(self):
+        """Дообработать принятые обновления и остановить приложение бота"""
+        await self.processor.join()
+        if self.started:
+            await self.telegram_application.stop()
+            await self.telegram_application.shutdown()
+            self.started = False
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.secret:
+                        await self.startup()
+                except Exception as e:
+                    logger.error(f"Telegram webhook startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _has_valid_secret(self, scope):
+        if not self.secret:
+            # Без секрета любой мог бы слать поддельные обновления
+            logger.error("TELEGRAM_WEBHOOK_SECRET not set, webhook updates are rejected")
+            return False
+        received = dict(scope['headers']).get(SECRET_HEADER, b'')
+        return hmac.compare_digest(received, self.secret.encode())
+
+    async def _read_body(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                return None
+            if not message.get('more_body'):
+                return body
+
+    async def _handle_update(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            await self._respond(send, 405)
+            return
+        if not self._has_valid_secret(scope):
+            await self._respond(send, 403)
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413)
+            return
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self._respond(send, 400)
+            return
+
+        if not self.started:
+            await self.startup()
+        from telegram import Update
+        try:
+            update = Update.de_json(data, self.telegram_application.bot)
+        except (KeyError, TypeError, ValueError):
+            update = None
+        if update is None:
+            await self._respond(send, 400)
+            return
+        task = self.processor.submit(update)
+        if acks_after_processing(update):
+            await task
+        # Остальные подтверждаются сразу: Telegram ждет ответа перед отправкой
+        # следующих обновлений
+        await self._respond(send, 200)
+
+    async def _process_update(self, update):
+        await self.telegram_application.process_update(update)
+
+    async def _respond(self, send, status):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': b''})